@@ -1,16 +1,38 @@
+import logging
 from flask import Flask, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from flask_migrate import Migrate
 from config import Config
 
 db = SQLAlchemy()
+migrate = Migrate()
 
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
+
+    from app.json_encoder import FastJSONEncoder
+    app.json_encoder = FastJSONEncoder
     
+    # Services and the profiler log through the same queue handler as the blueprints
+    from app.routes.logger import configure_logger
+    for name in ('app.services', 'app.profiling'):
+        configure_logger(logging.getLogger(name))
+
     CORS(app)
+    from app import database
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', database.engine_options(app.config))
     db.init_app(app)
+    migrate.init_app(app, db, directory=database.MIGRATIONS_DIR)
+
+    from app.services.password_hasher import PasswordHasher
+    app.extensions['password_hasher'] = PasswordHasher(
+        rounds=app.config['BCRYPT_ROUNDS'],
+        pool_size=app.config['BCRYPT_POOL_SIZE'],
+        max_concurrency=app.config['BCRYPT_MAX_CONCURRENCY'],
+        queue_timeout=app.config['BCRYPT_QUEUE_TIMEOUT']
+    )
 
     @app.route('/health')
     def health_check():
@@ -20,7 +42,61 @@ def create_app():
     app.register_blueprint(auth.bp)
     app.register_blueprint(stocks.bp)
 
+    from app.services.auth_tokens import TokenAuthority
+    app.extensions['auth_tokens'] = TokenAuthority(
+        app.config['SECRET_KEY'],
+        max_age=app.config['AUTH_TOKEN_MAX_AGE'],
+        load_principal=auth.load_principal,
+        cache_ttl=app.config['AUTH_TOKEN_CACHE_TTL']
+    )
+
     with app.app_context():
-        db.create_all()
+        database.tune_sqlite(db.engine, app.config['SQLITE_BUSY_TIMEOUT'])
+        if app.config['DATABASE_AUTO_MIGRATE']:
+            database.upgrade_schema(db.engine)
+        if app.config['METRICS_ENABLED']:
+            from app import instrumentation
+            instrumentation.init_app(app, db.engine)
+
+    from app import http_cache
+    http_cache.init_app(app)
+
+    if app.config['PROFILING_ENABLED']:
+        from app import profiling
+        profiling.init_app(app)
+
+    if app.config['SHARED_STATE_ENABLED']:
+        from app.routes.stocks import alpha_vantage, load_account, valuation_book
+        from app.services.quota_ledger import QuotaLedger
+        from app.services.state_sync import StateSync
+        with app.app_context():
+            alpha_vantage.scheduler.ledger = QuotaLedger(
+                db.engine,
+                per_minute=app.config['ALPHA_VANTAGE_CALLS_PER_MINUTE'],
+                per_day=app.config['ALPHA_VANTAGE_CALLS_PER_DAY']
+            )
+        state_sync = StateSync(
+            app,
+            alpha_vantage.prices,
+            valuation_book,
+            loader=load_account,
+            interval=app.config['SHARED_STATE_SYNC_INTERVAL']
+        )
+        state_sync.start()
+        app.extensions['state_sync'] = state_sync
+
+    if app.config['PRICE_REFRESH_ENABLED']:
+        from app.routes.stocks import alpha_vantage, broadcaster
+        from app.services.price_refresher import PriceRefresher
+        refresher = PriceRefresher(
+            app,
+            alpha_vantage,
+            interval=app.config['PRICE_REFRESH_INTERVAL'],
+            batch_size=app.config['PRICE_REFRESH_BATCH'],
+            daily_reserve=app.config['PRICE_REFRESH_DAILY_RESERVE'],
+            extra_symbols=lambda: broadcaster.topics('quote:')
+        )
+        refresher.start()
+        app.extensions['price_refresher'] = refresher
 
     return app
\ No newline at end of file
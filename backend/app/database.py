@@ -0,0 +1,123 @@
+import os
+from contextlib import contextmanager
+from alembic import command
+from flask import current_app
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine.url import make_url
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+# Revision matching the schema db.create_all() produced before migrations were introduced
+BASELINE_REVISION = '0001_initial_schema'
+
+# Postgres advisory lock id held while migrating
+MIGRATION_LOCK_KEY = 411_0001
+
+
+def engine_options(config):
+    """
+    Build SQLALCHEMY_ENGINE_OPTIONS for the configured database.
+
+    Args:
+        config (dict): Flask app config
+
+    Returns:
+        dict: Pool settings for server databases; empty for SQLite, whose
+        per-thread/static pools are chosen by SQLAlchemy and Flask-SQLAlchemy
+    """
+    if make_url(config['SQLALCHEMY_DATABASE_URI']).get_backend_name() == 'sqlite':
+        return {}
+    return {
+        'pool_size': config['DATABASE_POOL_SIZE'],
+        'max_overflow': config['DATABASE_MAX_OVERFLOW'],
+        'pool_timeout': config['DATABASE_POOL_TIMEOUT'],
+        'pool_recycle': config['DATABASE_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+    }
+
+
+def tune_sqlite(engine, busy_timeout):
+    """
+    Apply WAL journaling and related pragmas to every new SQLite connection.
+
+    WAL lets readers proceed while a trade is being written, and busy_timeout
+    makes a second writer wait for the lock instead of failing immediately
+    with "database is locked".
+
+    Args:
+        engine (Engine): SQLAlchemy engine; ignored unless it is SQLite
+        busy_timeout (int): Milliseconds to wait on a locked database
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout)}')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.execute('PRAGMA cache_size=-20000')
+        cursor.close()
+
+
+@contextmanager
+def migration_lock(engine):
+    """
+    Hold a lock that only one process sharing the database can take at a time.
+
+    Postgres uses a session advisory lock; a SQLite file gets an exclusive
+    `flock` on a `.migrate-lock` file beside it. In-memory databases (and
+    platforms without `fcntl`) are not locked.
+
+    Args:
+        engine (Engine): SQLAlchemy engine of the database
+    """
+    if engine.dialect.name == 'postgresql':
+        with engine.connect() as connection:
+            connection.execute(text('SELECT pg_advisory_lock(:key)'), {'key': MIGRATION_LOCK_KEY})
+            try:
+                yield
+            finally:
+                connection.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATION_LOCK_KEY})
+        return
+
+    path = engine.url.database
+    if engine.dialect.name != 'sqlite' or fcntl is None or not path or path == ':memory:':
+        yield
+        return
+    with open(f'{path}.migrate-lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def upgrade_schema(engine):
+    """
+    Bring the database schema up to the latest migration.
+
+    A database created by db.create_all() before migrations existed has the
+    tables but no alembic_version; it is stamped at the baseline revision so
+    only the later migrations are applied to it. Processes starting together
+    take turns under `migration_lock`, so later ones find the schema current.
+    Unlike the `flask db` CLI, this leaves the app's logging configuration alone.
+
+    Args:
+        engine (Engine): Engine of the app's database (app context required)
+    """
+    config = current_app.extensions['migrate'].migrate.get_config(MIGRATIONS_DIR)
+    # Read by migrations/env.py, which otherwise loads alembic.ini's logging setup
+    config.attributes['configure_logging'] = False
+    with migration_lock(engine):
+        tables = inspect(engine).get_table_names()
+        if 'user' in tables and 'alembic_version' not in tables:
+            command.stamp(config, BASELINE_REVISION)
+        command.upgrade(config, 'head')
@@ -0,0 +1,169 @@
+import gzip
+import hashlib
+
+import orjson
+from flask import Response, current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Suffixes added to a strong ETag by `compress`, so each encoding has its own tag
+ENCODING_SUFFIXES = ('-gzip', '-br')
+
+
+def etag_for(*parts):
+    """
+    Build a strong ETag from the values that identify a version of the data.
+
+    Args:
+        *parts: JSON-serializable values (other objects are stringified).
+
+    Returns:
+        str: The unquoted entity tag.
+    """
+    encoded = orjson.dumps(parts, default=str, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    return hashlib.blake2b(encoded, digest_size=12).hexdigest()
+
+
+def _client_has(etag):
+    if request.if_none_match.star_tag:
+        return True
+    for tag in request.if_none_match:
+        for suffix in ENCODING_SUFFIXES:
+            if tag.endswith(suffix):
+                tag = tag[:-len(suffix)]
+                break
+        if tag == etag:
+            return True
+    return False
+
+
+def cacheable(response, etag, max_age):
+    """
+    Mark a response with its ETag and how long clients may reuse it.
+
+    Args:
+        response (Response): The response to mark.
+        etag (str): The tag from `etag_for`.
+        max_age (float): Seconds the underlying data stays fresh.
+
+    Returns:
+        Response: The same response.
+    """
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = max(0, int(max_age))
+    return response
+
+
+def conditional(etag, max_age):
+    """
+    Answer `304 Not Modified` if the client already holds this version.
+
+    Args:
+        etag (str): The tag from `etag_for`.
+        max_age (float): Seconds the underlying data stays fresh.
+
+    Returns:
+        Response: The 304 response, or None if the full body must be sent.
+    """
+    if not _client_has(etag):
+        return None
+    return cacheable(Response(status=304), etag, max_age)
+
+
+def _encode(body, encoding, level):
+    if encoding == 'br':
+        return brotli.compress(body, quality=min(level, 11))
+    return gzip.compress(body, compresslevel=level)
+
+
+def accepted_encoding():
+    """
+    Get the encoding `compress` would use for a large body in this request.
+
+    Returns:
+        str: `br` or `gzip`, or None if the client accepts neither.
+    """
+    return request.accept_encodings.best_match(current_app.extensions['http_compress']['offered'])
+
+
+def encode(body, encoding):
+    """
+    Compress a JSON body ahead of time, as `compress` would.
+
+    Args:
+        body (bytes): The encoded JSON.
+        encoding (str): The result of `accepted_encoding`.
+
+    Returns:
+        tuple: `(data, encoding)`; encoding is None and the body unchanged for
+        bodies below `HTTP_COMPRESS_MIN_SIZE` or when no encoding is accepted.
+    """
+    settings = current_app.extensions['http_compress']
+    if encoding is None or len(body) < settings['min_size']:
+        return body, None
+    return _encode(body, encoding, settings['level']), encoding
+
+
+def encoded_response(data, encoding, etag, max_age):
+    """
+    Build a cacheable JSON response from a body already passed through `encode`.
+
+    The response is marked so `compress` leaves it alone.
+
+    Args:
+        data (bytes): The body, compressed with `encoding` or as-is.
+        encoding (str): The content encoding of `data`, or None.
+        etag (str): The tag from `etag_for`, without an encoding suffix.
+        max_age (float): Seconds the underlying data stays fresh.
+
+    Returns:
+        Response: The response.
+    """
+    response = current_app.response_class(data, mimetype=current_app.config['JSONIFY_MIMETYPE'])
+    response.vary.add('Accept-Encoding')
+    response.encoded = True
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+        etag = f'{etag}-{encoding}'
+    return cacheable(response, etag, max_age)
+
+
+def init_app(app):
+    """
+    Compress JSON responses for clients that accept gzip, or brotli when the
+    `brotli` package is installed.
+
+    Only complete 200 responses of at least `HTTP_COMPRESS_MIN_SIZE` bytes are
+    compressed; small bodies, streams and error responses are sent as-is, and
+    bodies built by `encoded_response` are already encoded. A strong ETag gets
+    the encoding appended, as the compressed bytes differ.
+
+    Args:
+        app (Flask): The application.
+    """
+    min_size = app.config['HTTP_COMPRESS_MIN_SIZE']
+    level = app.config['HTTP_COMPRESS_LEVEL']
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    app.extensions['http_compress'] = {'min_size': min_size, 'level': level, 'offered': offered}
+
+    @app.after_request
+    def compress(response):
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or getattr(response, 'encoded', False) or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(offered)
+        if encoding is None or response.content_length < min_size:
+            return response
+
+        response.set_data(_encode(response.get_data(), encoding, level))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(f'{etag}-{encoding}')
+        return response
@@ -0,0 +1,71 @@
+import time
+
+from flask import Response, g, request
+from sqlalchemy import event
+
+from app.services.metrics import registry
+
+
+REQUEST_LATENCY = registry.histogram(
+    'http_request_duration_seconds', 'Time to produce a response, per route.', ['route', 'method']
+)
+REQUESTS = registry.counter(
+    'http_requests_total', 'Responses per route and status code.', ['route', 'method', 'status']
+)
+IN_FLIGHT = registry.gauge(
+    'http_requests_in_flight', 'Requests currently being handled.'
+)
+DB_QUERIES = registry.counter(
+    'db_queries_total', 'SQL statements executed, by kind.', ['operation']
+)
+
+# Leading SQL keywords reported as their own `operation`; anything else is "other"
+DB_OPERATIONS = {'select', 'insert', 'update', 'delete'}
+
+
+def _route():
+    # The URL rule keeps label cardinality bounded (/api/stock/quote/<symbol>, not every symbol)
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def init_app(app, engine):
+    """
+    Record request, in-flight and DB query metrics and serve them at `/metrics`.
+
+    Each request costs two clock reads and a few counter updates; each SQL
+    statement one counter update. Streaming responses are timed until their
+    headers are returned.
+
+    Args:
+        app (Flask): The application.
+        engine (Engine): The app's database engine.
+    """
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+        g.in_flight = True
+        IN_FLIGHT.inc()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            route = _route()
+            REQUEST_LATENCY.observe(time.perf_counter() - started, route, request.method)
+            REQUESTS.inc(route, request.method, str(response.status_code))
+        return response
+
+    @app.teardown_request
+    def finish_request(error=None):
+        # Runs even when a handler raised, so the gauge cannot drift upwards
+        if g.pop('in_flight', False):
+            IN_FLIGHT.dec()
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        operation = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else ''
+        DB_QUERIES.inc(operation if operation in DB_OPERATIONS else 'other')
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
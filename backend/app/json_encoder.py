@@ -0,0 +1,25 @@
+import orjson
+from flask.json import JSONEncoder
+
+
+class FastJSONEncoder(JSONEncoder):
+    """
+    Flask JSON encoder that serializes with orjson.
+
+    Used by `jsonify` for every response. Output keeps Flask's conventions (keys
+    sorted when `JSON_SORT_KEYS` is set, dates as HTTP dates through `default`)
+    but non-ASCII text is written as UTF-8 instead of `\\u` escapes. Pretty-printed
+    output (`indent`) and values orjson cannot encode, such as integers beyond
+    64 bits, fall back to the standard library encoder.
+    """
+
+    def encode(self, o):
+        if self.indent is not None:
+            return super().encode(o)
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(o, default=self.default, option=option).decode('utf-8')
+        except orjson.JSONEncodeError:
+            return super().encode(o)
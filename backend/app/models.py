@@ -1,5 +1,5 @@
+from flask import current_app
 from app import db
-import bcrypt
 
 class User(db.Model):
     # __tablename__ = 'users'
@@ -9,13 +9,20 @@ class User(db.Model):
     password = db.Column(db.String(128), nullable=False)
     balance = db.Column(db.Float, default=1000000.0)  # Starting balance $1M
     portfolio = db.relationship('Portfolio', backref='user', lazy=True)
+    # Bumped on every update; a write based on an outdated read fails instead of being lost
+    version = db.Column(db.Integer, nullable=False, server_default='1')
 
+    __mapper_args__ = {'version_id_col': version}
+
+    # Hashing runs on the app's PasswordHasher process pool (see services/password_hasher.py)
     def set_password(self, password):
-        salt = bcrypt.gensalt()
-        self.password = bcrypt.hashpw(password.encode('utf-8'), salt)
+        self.password = current_app.extensions['password_hasher'].hash(password)
 
     def check_password(self, password):
-        return bcrypt.checkpw(password.encode('utf-8'), self.password)
+        return current_app.extensions['password_hasher'].verify(password, self.password)
+
+    def password_needs_rehash(self):
+        return current_app.extensions['password_hasher'].needs_rehash(self.password)
 
 class Portfolio(db.Model):
     # __tablename__ = 'portfolio'
@@ -23,4 +30,48 @@ class Portfolio(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     symbol = db.Column(db.String(10), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
-    purchase_price = db.Column(db.Float, nullable=False)
\ No newline at end of file
+    purchase_price = db.Column(db.Float, nullable=False)
+    version = db.Column(db.Integer, nullable=False, server_default='1')
+
+    __mapper_args__ = {'version_id_col': version}
+    __table_args__ = (
+        # One position per user and symbol; serves the lookup every trade does
+        db.Index('ix_portfolio_user_symbol', 'user_id', 'symbol', unique=True),
+    )
+
+class PriceBar(db.Model):
+    # One OHLCV bar of a symbol's time series at a given interval ('60min', 'daily', 'monthly')
+    id = db.Column(db.Integer, primary_key=True)
+    symbol = db.Column(db.String(10), nullable=False)
+    interval = db.Column(db.String(10), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False)
+    open = db.Column(db.Float)
+    high = db.Column(db.Float)
+    low = db.Column(db.Float)
+    close = db.Column(db.Float, nullable=False)
+    volume = db.Column(db.BigInteger)
+
+    __table_args__ = (
+        # Also serves range scans: WHERE symbol = ? AND interval = ? AND timestamp >= ?
+        db.UniqueConstraint('symbol', 'interval', 'timestamp', name='uq_price_bar_series_timestamp'),
+    )
+
+class PriceSeries(db.Model):
+    # Sync bookkeeping for a stored time series: newest bar held and when upstream was last asked
+    symbol = db.Column(db.String(10), primary_key=True)
+    interval = db.Column(db.String(10), primary_key=True)
+    last_timestamp = db.Column(db.DateTime)
+    refreshed_at = db.Column(db.DateTime, nullable=False)
+
+class UpstreamCall(db.Model):
+    # One Alpha Vantage call, so every worker process counts against the same quota (see services/quota_ledger.py)
+    id = db.Column(db.Integer, primary_key=True)
+    called_at = db.Column(db.Float, nullable=False, index=True)
+    # False for the placeholder rows a per-minute throttle adds, which must not use up the daily quota
+    daily = db.Column(db.Boolean, nullable=False, default=True, server_default=db.true())
+
+class Quote(db.Model):
+    # Latest fetched price per symbol, shared between worker processes (see services/state_sync.py)
+    symbol = db.Column(db.String(10), primary_key=True)
+    price = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False, index=True)
@@ -0,0 +1,77 @@
+import cProfile
+import logging
+import os
+import time
+import uuid
+
+from flask import g, request
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_QUERY_FLAG = 'profile'
+
+
+def _requested():
+    flag = request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_QUERY_FLAG)
+    return flag is not None and flag.lower() in ('1', 'true', 'yes')
+
+
+def _output_path(directory):
+    endpoint = (request.endpoint or 'unmatched').replace('.', '-')
+    name = f'{time.strftime("%Y%m%dT%H%M%S")}-{request.method}-{endpoint}-{uuid.uuid4().hex[:8]}.pstats'
+    return os.path.join(directory, name)
+
+
+def init_app(app):
+    """
+    Profile individual requests on demand.
+
+    A request is profiled only if it carries `X-Profile: 1` (or `?profile=1`)
+    and comes from an address in `PROFILING_ALLOWED_IPS`; every other request
+    pays one header lookup. The handler runs under cProfile and the stats are
+    written to `PROFILING_DIR` as a `.pstats` file (open with `python -m pstats`
+    or snakeviz), whose name is returned in the `X-Profile-Output` header.
+    Work handed to other threads (e.g. the quote fan-out) is not included.
+
+    Args:
+        app (Flask): The application.
+    """
+    allowed = {ip.strip() for ip in app.config['PROFILING_ALLOWED_IPS'].split(',') if ip.strip()}
+    directory = app.config['PROFILING_DIR']
+
+    @app.before_request
+    def start_profile():
+        if not _requested():
+            return
+        if request.remote_addr not in allowed:
+            logger.warning("Ignoring profiling request from %s", request.remote_addr)
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active on this thread
+            return
+        g.profiler = profiler
+
+    @app.after_request
+    def stop_profile(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        os.makedirs(directory, exist_ok=True)
+        path = _output_path(directory)
+        profiler.dump_stats(path)
+        logger.info("Wrote profile of %s %s to %s", request.method, request.path, path)
+        response.headers['X-Profile-Output'] = os.path.basename(path)
+        return response
+
+    @app.teardown_request
+    def discard_profile(error=None):
+        # The handler raised before after_request could stop the profiler
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
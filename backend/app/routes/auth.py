@@ -1,5 +1,8 @@
-from flask import Blueprint, request, jsonify
+from functools import wraps
+from flask import Blueprint, current_app, g, request, jsonify
 from app.models import db, User
+from app.services.auth_tokens import InvalidToken, Principal
+from app.services.password_hasher import HasherBusy
 from flask_cors import CORS
 import logging
 from .logger import configure_logger
@@ -12,6 +15,63 @@ configure_logger(logger)
 bp = Blueprint('auth', __name__)
 CORS(bp)
 
+HASHER_BUSY_ERROR = 'Too many password checks in progress. Please try again later.'
+
+
+def load_principal(user_id):
+    """
+    Load the principal for a token's user id; used by the app's TokenAuthority.
+
+    Args:
+        user_id (int): The user id carried by the token.
+
+    Returns:
+        Principal: The user's id, username and email, or None if the user does not exist.
+    """
+    user = db.session.get(User, user_id)
+    if not user:
+        return None
+    return Principal(user.id, user.username, user.email)
+
+
+def authenticate(allow_query_token=False):
+    """
+    Resolve the request's session token to the authenticated user.
+
+    The token is read from an `Authorization: Bearer <token>` header. Only routes
+    serving clients that cannot set headers (EventSource) may also accept a
+    `token` query parameter, since URLs end up in access and proxy logs.
+
+    Args:
+        allow_query_token (bool): Fall back to the `token` query parameter.
+
+    Returns:
+        Principal: The authenticated user.
+
+    Raises:
+        InvalidToken: If no token was sent or it is not valid.
+    """
+    header = request.headers.get('Authorization', '')
+    token = header[len('Bearer '):] if header.startswith('Bearer ') else None
+    if token is None and allow_query_token:
+        token = request.args.get('token')
+    if not token:
+        raise InvalidToken('Authentication required')
+    return current_app.extensions['auth_tokens'].verify(token)
+
+
+def token_required(view):
+    """Reject requests without a valid session token (401) and expose the user as `g.principal`."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            g.principal = authenticate()
+        except InvalidToken as e:
+            logger.warning("Rejected request to %s: %s", request.path, e)
+            return jsonify({"error": str(e)}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
 
 @bp.route('/api/auth/register', methods=['POST'])
 def register():
@@ -31,9 +91,10 @@ def register():
             - 201: On successful registration, the user's details.
             - 400: If required fields are missing or if the username or email already exists.
             - 500: If an internal server error occurs during the registration process.
+            - 503: If password hashing is saturated.
     """
     data = request.json
-    logger.info(f"Trying to register new user '{data.get('username')}'.")
+    logger.info("Trying to register new user '%s'.", data.get('username'))
     
 
     # Validate required fields
@@ -43,12 +104,12 @@ def register():
 
     # Check if username already exists
     if User.query.filter_by(username=data['username']).first():
-        logger.warning(f"Username: '{data['username']}' already exists.")
+        logger.warning("Username: '%s' already exists.", data['username'])
         return jsonify({"error": "Username already exists"}), 400
 
     # Check if email already exists
     if User.query.filter_by(email=data['email']).first():
-        logger.warning(f"Email: '{data['email']}' already exists.")
+        logger.warning("Email: '%s' already exists.", data['email'])
         return jsonify({"error": "Email already exists"}), 400
 
     try:
@@ -61,7 +122,7 @@ def register():
         # Add to database
         db.session.add(user)
         db.session.commit()
-        logger.info(f"User '{user.username}' created successfully.")
+        logger.info("User '%s' created successfully.", user.username)
 
         return jsonify({
             "message": "User registered successfully",
@@ -72,9 +133,13 @@ def register():
             }
         }), 201
 
+    except HasherBusy:
+        db.session.rollback()
+        return jsonify({"error": HASHER_BUSY_ERROR}), 503
+
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error during user registration: {str(e)}")
+        logger.error("Error during user registration: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
@@ -93,12 +158,17 @@ def login():
 
     Returns:
         Response: A JSON response containing:
-            - 200: On successful authentication, the user's details.
+            - 200: On successful authentication, the user's details and a signed session
+              `token` to send as `Authorization: Bearer <token>`, valid for `expires_in` seconds.
             - 400: If required fields are missing in the request payload.
             - 401: If the provided credentials are invalid.
+            - 503: If password checking is saturated.
+
+    A stored hash made with a different work factor than `BCRYPT_ROUNDS` is
+    replaced with a fresh hash after a successful login.
     """
     data = request.json
-    logger.info(f"Trying to log in user '{data.get('username')}'.")
+    logger.info("Trying to log in user '%s'.", data.get('username'))
     
 
     # Validate required fields
@@ -110,8 +180,15 @@ def login():
     user = User.query.filter_by(username=data['username']).first()
 
     # Verify password
-    if user and user.check_password(data['password']):
-        logger.info(f"Login successful for user '{user.username}'.")
+    try:
+        authenticated = bool(user) and user.check_password(data['password'])
+    except HasherBusy:
+        return jsonify({"error": HASHER_BUSY_ERROR}), 503
+
+    if authenticated:
+        logger.info("Login successful for user '%s'.", user.username)
+        if user.password_needs_rehash():
+            rehash_password(user, data['password'])
         return jsonify({
             "message": "Login successful",
             "user": {
@@ -119,7 +196,9 @@ def login():
                 "username": user.username,
                 "email": user.email,
                 "balance": user.balance
-            }
+            },
+            "token": current_app.extensions['auth_tokens'].issue(user.id),
+            "expires_in": current_app.config['AUTH_TOKEN_MAX_AGE']
         }), 200
 
     logger.warning("Invalid login credentials.")
@@ -127,6 +206,27 @@ def login():
 
 
 
+def rehash_password(user, password):
+    """
+    Re-hash a just verified password with the configured work factor.
+
+    Best effort: the login succeeds either way, and a failed rehash is retried
+    on the next login.
+
+    Args:
+        user (User): The authenticated user.
+        password (str): The plain text password that was verified.
+    """
+    try:
+        user.set_password(password)
+        db.session.commit()
+        logger.info("Rehashed password for user '%s'.", user.username)
+    except Exception as e:
+        db.session.rollback()
+        logger.warning("Could not rehash password for user '%s': %s", user.username, e)
+
+
+
 @bp.route('/api/auth/update-password', methods=['PUT'])
 def update_password():
     """
@@ -147,9 +247,10 @@ def update_password():
             - 401: If the current password is incorrect.
             - 404: If the specified user is not found.
             - 500: If an internal server error occurs during the password update process.
+            - 503: If password hashing is saturated.
     """
-    logger.info(f"Trying to update password for user '{data.get('username')}'.")
     data = request.json
+    logger.info("Trying to update password for user '%s'.", data.get('username'))
 
     # Validate required fields
     if not all(k in data for k in ["username", "current_password", "new_password"]):
@@ -160,21 +261,25 @@ def update_password():
     user = User.query.filter_by(username=data['username']).first()
 
     if not user:
-        logger.warning(f"User: '{data['username']}' not found.")
+        logger.warning("User: '%s' not found.", data['username'])
         return jsonify({"error": "User not found"}), 404
 
-    # Verify current password
-    if not user.check_password(data['current_password']):
-        logger.warning("Current password is incorrect.")
-        return jsonify({"error": "Current password is incorrect"}), 401
-
     try:
+        # Verify current password
+        if not user.check_password(data['current_password']):
+            logger.warning("Current password is incorrect.")
+            return jsonify({"error": "Current password is incorrect"}), 401
+
         user.set_password(data['new_password'])
         db.session.commit()
-        logger.info(f"Password updated successfully for user '{user.username}'.")
+        logger.info("Password updated successfully for user '%s'.", user.username)
         return jsonify({"message": "Password updated successfully"}), 200
 
+    except HasherBusy:
+        db.session.rollback()
+        return jsonify({"error": HASHER_BUSY_ERROR}), 503
+
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error during password update for user '{user.username}': {str(e)}")
+        logger.error("Error during password update for user '%s': %s", user.username, e)
         return jsonify({"error": str(e)}), 500
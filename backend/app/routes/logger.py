@@ -1,20 +1,92 @@
+import atexit
 import logging
+import queue
+import random
 import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
 
-from flask import current_app, has_request_context
+from config import Config
 
 
-def configure_logger(logger):
-    logger.setLevel(logging.DEBUG)
-    handler = logging.StreamHandler(sys.stderr)
-    handler.setLevel(logging.DEBUG)
+_lock = threading.Lock()
+_queue_handler = None
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Let through only a fraction of low-level records.
+
+    Records at or below `level` pass with probability `rate`; anything more
+    severe always passes. Dropped records are never formatted.
+    """
+
+    def __init__(self, rate, level=logging.DEBUG):
+        super().__init__()
+        self.rate = rate
+        self.level = level
+
+    def filter(self, record):
+        return record.levelno > self.level or self.rate >= 1 or random.random() < self.rate
+
+
+def _shared_handler():
+    """
+    Get the process-wide queue handler, starting its listener on first use.
+
+    Request threads only put records on an in-memory queue; a single listener
+    thread writes them to stderr, so a slow or blocked stderr never stalls a
+    request.
+    """
+    global _queue_handler
+    with _lock:
+        if _queue_handler is None:
+            log_queue = queue.SimpleQueue()
 
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    handler.setFormatter(formatter)
+            stream_handler = logging.StreamHandler(sys.stderr)
+            stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+            listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+            listener.start()
+            atexit.register(listener.stop)
+
+            handler = QueueHandler(log_queue)
+            handler.addFilter(SamplingFilter(Config.LOG_DEBUG_SAMPLE_RATE))
+            _queue_handler = handler
+        return _queue_handler
+
+
+def log_level(name):
+    """
+    Resolve the configured level of a logger.
+
+    `LOG_LEVELS` (e.g. `app.services=WARNING,app.routes.stocks=DEBUG`) overrides
+    `LOG_LEVEL` for a logger and its children; the longest matching prefix wins.
+
+    Args:
+        name (str): The logger name.
+
+    Returns:
+        str: The level name.
+    """
+    level, matched = Config.LOG_LEVEL, ''
+    for entry in Config.LOG_LEVELS.split(','):
+        prefix, _, value = entry.partition('=')
+        prefix = prefix.strip()
+        if value and (name == prefix or name.startswith(prefix + '.')) and len(prefix) > len(matched):
+            level, matched = value.strip(), prefix
+    return level.upper()
+
+
+def configure_logger(logger):
+    """
+    Route a logger through the shared non-blocking queue handler at its configured level.
 
-    logger.addHandler(handler)
+    Safe to call any number of times: the handler is attached only once.
 
-    if has_request_context():
-        app_logger = current_app.logger
-        for handler in app_logger.handlers:
-            logger.addHandler(handler)
+    Args:
+        logger (logging.Logger): The logger to configure.
+    """
+    handler = _shared_handler()
+    logger.setLevel(log_level(logger.name))
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
@@ -1,10 +1,26 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, g, request, jsonify
 from flask_cors import CORS
-from ..services.alpha_vantage import AlphaVantageService
-from datetime import datetime
+from ..services.alpha_vantage import (
+    MISSING_INVALID, MISSING_THROTTLED, MISSING_TIMEOUT, AlphaVantageService
+)
+from ..services.bar_store import BarStore
+from ..services.broadcaster import Broadcaster
+from ..services.cache import TTLCache
+from ..services.metrics import cache_collector, registry
+from ..services.rate_limiter import PRIORITY_LOOKUP, PRIORITY_TRADE, RateLimitExceeded
+from ..services.trading import TradeError, execute_orders, execute_trade, net_quantities
+from ..services.valuation import ValuationBook
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import datetime, timedelta
+import json
+import time
 from app.models import User, Portfolio, db
+from config import Config
 import logging
 from .logger import configure_logger
+from .auth import authenticate, token_required
+from ..services.auth_tokens import InvalidToken
+from .. import http_cache
 
 
 logger = logging.getLogger(__name__)
@@ -14,12 +30,110 @@ bp = Blueprint('stocks', __name__)
 CORS(bp)
 
 alpha_vantage = AlphaVantageService()
+bar_store = BarStore(alpha_vantage)
+valuation_book = ValuationBook(alpha_vantage.prices, max_age=Config.PORTFOLIO_BOOK_MAX_AGE)
+broadcaster = Broadcaster(queue_size=Config.STREAM_QUEUE_SIZE)
+
+
+def publish_quote(symbol, price, updated_at):
+    broadcaster.publish(f'quote:{symbol}', 'quote', {'symbol': symbol, 'price': price, 'updated_at': updated_at})
+
+
+def load_account(user_id):
+    """Read a user's balance, positions and row version for the valuation book, or None if unknown."""
+    user = db.session.get(User, user_id)
+    if not user:
+        return None
+    return user.balance, [(p.symbol, p.quantity) for p in user.portfolio], user.version
+
+
+def valuation_collector():
+    values = valuation_book.values()
+    return [
+        ('portfolio_book_accounts', 'gauge', 'Users currently valued in the portfolio book.', [({}, len(values))]),
+        ('portfolio_book_value', 'gauge', 'Summed portfolio value of every valued user.', [({}, sum(values.values()))]),
+    ]
+
+
+def publish_portfolio(user_id, valuation):
+    broadcaster.publish(f'portfolio:{user_id}', 'portfolio', {
+        'balance': valuation['balance'],
+        'portfolio_value': valuation['portfolio_value']
+    })
+
+
+# Stored series and look-back window behind each /historical-data range
+HISTORICAL_RANGES = {
+    '1d': {
+        'interval': '60min',
+        'days': 1
+    },
+    '10d': {
+        'interval': 'daily',
+        'days': 10
+    },
+    '1m': {
+        'interval': 'daily',
+        'days': 30
+    },
+    '6m': {
+        'interval': 'monthly',
+        'months': 6
+    },
+    '1y': {
+        'interval': 'monthly',
+        'months': 12
+    }
+}
+
+# Content encodings a cached /historical-data body may be stored under (None: as-is)
+HISTORICAL_ENCODINGS = (None, 'gzip', 'br')
+# Encoded /historical-data bodies, keyed by ('HISTORICAL', symbol, range, content encoding)
+historical_responses = TTLCache(maxsize=Config.HISTORICAL_RESPONSE_CACHE_SIZE)
+
+
+def invalidate_historical(symbol, interval):
+    for range_name, dets in HISTORICAL_RANGES.items():
+        if dets['interval'] == interval:
+            for encoding in HISTORICAL_ENCODINGS:
+                historical_responses.invalidate(('HISTORICAL', symbol, range_name, encoding))
+
+
+alpha_vantage.prices.subscribe(publish_quote)
+valuation_book.subscribe(publish_portfolio)
+bar_store.subscribe(invalidate_historical)
+registry.register_collector(cache_collector('upstream_cache', alpha_vantage.cache))
+registry.register_collector(cache_collector('historical_response_cache', historical_responses))
+registry.register_collector(valuation_collector)
+
+RATE_LIMIT_ERROR = 'API rate limit reached. Please try again later.'
+FORBIDDEN_ERROR = 'Not allowed to access another user\'s account'
+
+
+def is_other_user(user_id):
+    """
+    Tell whether a user id sent by the client names someone other than the token's user.
+
+    Args:
+        user_id: The `userId`/`user_id` the client sent, or None.
+
+    Returns:
+        bool: True if the id is given and differs from `g.principal.user_id`.
+    """
+    try:
+        return user_id is not None and int(user_id) != g.principal.user_id
+    except (TypeError, ValueError):
+        return True
 
 @bp.route('/api/stock/quote/<symbol>')
 def get_quote(symbol):
     """
     Get the current stock data for the given stock symbol.
 
+    The upstream body is sent as received, without decoding and re-encoding it.
+    The response carries an ETag of the quote and may be reused by the client
+    until the cached quote expires; a matching `If-None-Match` gets a 304.
+
     Args:
         symbol (str): The stock symbol for which the quote (i.e data) is to be fetched.
 
@@ -29,17 +143,96 @@ def get_quote(symbol):
     Raises:
         Exception: If an error occurs while fetching the stock quote.
     """
-    logger.info(f"Fetching stock info for: {symbol}")
+    logger.info("Fetching stock info for: %s", symbol)
     try:
         quote = alpha_vantage.get_stock_quote(symbol)
-        logger.info(f"Stock info fetched successfully: {quote}")
-        return jsonify(quote)
+        logger.info("Stock info fetched successfully for %s", symbol)
+        logger.debug("Stock info for %s: %s", symbol, quote)
+        etag = http_cache.etag_for('quote', symbol.upper(), quote)
+        max_age = alpha_vantage.fresh_for({'function': 'GLOBAL_QUOTE', 'symbol': symbol})
+        not_modified = http_cache.conditional(etag, max_age)
+        if not_modified:
+            return not_modified
+
+        raw = getattr(quote, 'raw', None)
+        if raw is not None:
+            response = current_app.response_class(raw, mimetype=current_app.config['JSONIFY_MIMETYPE'])
+        else:
+            response = jsonify(quote)
+        return http_cache.cacheable(response, etag, max_age)
+    except RateLimitExceeded:
+        logger.warning("Rate limited fetching stock info for %s", symbol)
+        return jsonify({'error': RATE_LIMIT_ERROR}), 429
     except Exception as e:
-        logger.error(f"Error fetching stock info for {symbol}: {str(e)}")
+        logger.error("Error fetching stock info for %s: %s", symbol, e)
         return jsonify({'error': 'Failed to fetch stock quote'}), 500
 
 
 
+@bp.route('/api/stock/quotes')
+def get_quotes():
+    """
+    Get the current stock data for several symbols in one request.
+
+    Symbols are upper-cased and de-duplicated; cached quotes are served directly
+    and the rest are fetched from upstream concurrently.
+
+    Args:
+        symbols (str): Comma separated stock symbols, e.g. `AAPL,MSFT`.
+
+    Returns:
+        jsonify: The normalized quotes keyed by symbol and the symbols that could not be fetched, or error message.
+    """
+    symbols = [s.strip().upper() for s in request.args.get('symbols', '').split(',') if s.strip()]
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        logger.warning("No symbols given for batch quote in input!")
+        return jsonify({"error": "No symbols given"}), 400
+
+    max_symbols = current_app.config['QUOTE_BATCH_MAX_SYMBOLS']
+    if len(symbols) > max_symbols:
+        return jsonify({"error": f"Too many symbols (max {max_symbols})"}), 400
+
+    logger.info("Fetching batch stock info for: %s", symbols)
+    quotes, missing = alpha_vantage.get_stock_quotes(symbols)
+
+    normalized = {}
+    for symbol, quote in quotes.items():
+        global_quote = quote.get('Global Quote')
+        if global_quote:
+            normalized[symbol] = normalize_quote(symbol, global_quote)
+        else:
+            missing[symbol] = MISSING_INVALID
+
+    return jsonify({
+        'quotes': normalized,
+        'missing': list(missing)
+    })
+
+
+
+def normalize_quote(symbol, global_quote):
+    """
+    Flatten an upstream `Global Quote` object into typed fields.
+
+    Args:
+        symbol (str): The requested stock symbol.
+        global_quote (dict): The `Global Quote` object from Alpha Vantage.
+
+    Returns:
+        dict: The symbol, price, volume, change percent and latest trading day.
+    """
+    volume = global_quote.get('06. volume')
+    return {
+        'symbol': global_quote.get('01. symbol', symbol),
+        'price': float(global_quote['05. price']),
+        'volume': int(volume) if volume else None,
+        'change_percent': global_quote.get('10. change percent'),
+        'latest_trading_day': global_quote.get('07. latest trading day')
+    }
+
+
+
 @bp.route('/api/stock/value/<symbol>/<int:shares>')
 def calculate_value(symbol, shares):
     """
@@ -55,15 +248,18 @@ def calculate_value(symbol, shares):
     Raises:
         Exception: If an error occurs while calculating the stock value.
     """
-    logger.info(f"Calculating stock value for symbol with shares: {symbol, shares}")
+    logger.info("Calculating stock value for %s with %s shares", symbol, shares)
     try:
         quote = alpha_vantage.get_stock_quote(symbol)
         price = float(quote['Global Quote']['05. price'])
         value = price * shares
-        logger.info(f"Calculated value: {value}")
+        logger.info("Calculated value: %s", value)
         return jsonify({'value': value})
+    except RateLimitExceeded:
+        logger.warning("Rate limited calculating stock value for %s", symbol)
+        return jsonify({'error': RATE_LIMIT_ERROR}), 429
     except Exception as e:
-        logger.error(f"Error in calculating stock value for {symbol}: {str(e)}")
+        logger.error("Error in calculating stock value for %s: %s", symbol, e)
         return jsonify({'error': 'Failed to calculate stock value'}), 500
 
 
@@ -73,6 +269,12 @@ def lookup_stock():
     """
     Find and return the current stock data and market status for a given symbol.
 
+    The market status is cached until the next market open/close and, when not
+    cached, is fetched concurrently with the quote, waiting at most the fan-out
+    deadline for it (504 after that). The response carries an ETag and may be
+    reused until the quote or market status expires; a matching `If-None-Match`
+    gets a 304.
+
     Args:
         symbol (str): The stock symbol.
 
@@ -88,26 +290,32 @@ def lookup_stock():
         logger.warning("No symbol given for lookup in input!")
         return jsonify({"error": "No symbol given"}), 400
 
-    logger.info(f"Looking up information for stock symbol: {symbol}")
+    logger.info("Looking up information for stock symbol: %s", symbol)
+
+    # Market status is usually cached; when it is not, fetch it alongside the quote
+    status_future = alpha_vantage.executor.submit(alpha_vantage.get_global_market_status)
     try:
         res_data = alpha_vantage.get_stock_quote(symbol)
 
-        logger.debug(f"Stock info: {res_data}")
+        logger.debug("Stock info for %s: %s", symbol, res_data)
         if "Global Quote" not in res_data or not res_data["Global Quote"]:
-            logger.warning(f"No data found for symbol: {symbol}")
+            logger.warning("No data found for symbol: %s", symbol)
             return jsonify({"error": "No data found for the given symbol"}), 404
 
         current_price = res_data["Global Quote"].get("05. price", "N/A")
         volume = res_data["Global Quote"].get("06. volume", "N/A")
-        logger.debug(f"Price and Volume: {current_price, volume}")
+        logger.debug("Price and volume for %s: %s, %s", symbol, current_price, volume)
 
+    except RateLimitExceeded:
+        logger.warning("Rate limited looking up %s", symbol)
+        return jsonify({"error": RATE_LIMIT_ERROR}), 429
     except Exception as e:
-        logger.error(f"Error fetching stock lookup for {symbol}: {str(e)}")
+        logger.error("Error fetching stock lookup for %s: %s", symbol, e)
         return jsonify({"error": f"Error getting stock data: {str(e)}"}), 500
 
     logger.info("Looking up global market status")
     try:
-        md = alpha_vantage.get_global_market_status()
+        md = status_future.result(timeout=alpha_vantage.fanout_deadline)
         ms = []
         if "markets" in md:
             for m in md["markets"]:
@@ -116,18 +324,33 @@ def lookup_stock():
                     "region": m.get("region", "Unknown"),
                     "current_status": m.get("current_status", "Unknown")
                 })
-        logger.debug(f"Market status: {ms}")
+        logger.debug("Market status: %s", ms)
+    except RateLimitExceeded:
+        logger.warning("Rate limited fetching market status")
+        return jsonify({"error": RATE_LIMIT_ERROR}), 429
+    except FutureTimeoutError:
+        logger.warning("Timed out fetching market status")
+        return jsonify({"error": "Timed out getting market status"}), 504
     except Exception as e:
-        logger.error(f"Error fetching market status: {str(e)}")
+        logger.error("Error fetching market status: %s", e)
         return jsonify({"error": "Error getting market status"}), 500
 
+    etag = http_cache.etag_for('lookup', symbol, current_price, volume, ms)
+    max_age = min(
+        alpha_vantage.fresh_for({'function': 'GLOBAL_QUOTE', 'symbol': symbol}),
+        alpha_vantage.fresh_for({'function': 'MARKET_STATUS'})
+    )
+    not_modified = http_cache.conditional(etag, max_age)
+    if not_modified:
+        return not_modified
+
     data = {
         "symbol": symbol,
         "current_price": current_price,
         "volume": volume,
         "market_status": ms
     }
-    return jsonify(data)
+    return http_cache.cacheable(jsonify(data), etag, max_age)
 
 
 
@@ -136,6 +359,15 @@ def historical_data():
     """
     Get the historical trends data for the stock symbol within a specified time range.
 
+    The ETag is derived from the range's first day and the newest stored bar, and
+    the response may be reused until the series is next topped up from upstream;
+    a matching `If-None-Match` gets a 304 without serializing the bars.
+
+    The encoded and compressed body is kept per (symbol, range, content
+    encoding) until the series is due a refresh, new bars for it are stored,
+    or the day changes, so repeated requests skip the bar store, serialization
+    and compression entirely.
+
     Args:
         symbol (str): The stock symbol.
         range (str): The time range for the historical data (e.g., '1d', '10d', '1m').
@@ -154,99 +386,185 @@ def historical_data():
         logger.warning("No symbol given for historical in input!")
         return jsonify({"error": "No symbol given.."}), 400
 
-    logger.info(f"Fetching historical trend data for symbol: {symbol}, range: {range}")
-    
-    range_mapping = {
-        '1d': {
-            'endpoint': 'TIME_SERIES_INTRADAY',
-            'interval': '60min',
-            'days': 1
-        },
-        '10d': {
-            'endpoint': 'TIME_SERIES_DAILY',
-            'days': 10
-        },
-        '1m': {
-            'endpoint': 'TIME_SERIES_DAILY',
-            'days': 30
-        },
-        '6m': {
-            'endpoint': 'TIME_SERIES_MONTHLY',
-            'months': 6
-        },
-        '1y': {
-            'endpoint': 'TIME_SERIES_MONTHLY',
-            'months': 12
-        }
-    }
+    logger.info("Fetching historical trend data for symbol: %s, range: %s", symbol, range)
+
+    if range not in HISTORICAL_RANGES:
+        range = '1m'
+    accepted = http_cache.accepted_encoding()
+    key = ('HISTORICAL', symbol.upper(), range, accepted)
+    today = datetime.today().date()
+    rendered, state = historical_responses.get(key)
+    if state is not None and rendered[0] == today:
+        _, etag, encoding, data = rendered
+        max_age = historical_responses.ttl(key)
+        return http_cache.conditional(etag, max_age) or http_cache.encoded_response(data, encoding, etag, max_age)
 
     try:
-        dets = range_mapping.get(range, range_mapping['1m'])
-        if dets['endpoint'] == 'TIME_SERIES_INTRADAY':
-            hist_data = alpha_vantage.get_time_series_intraday(symbol, dets['interval'])
-        elif dets['endpoint'] == 'TIME_SERIES_DAILY':
-            hist_data = alpha_vantage.get_time_series_daily(symbol)
-        elif dets['endpoint'] == 'TIME_SERIES_MONTHLY':
-            hist_data = alpha_vantage.get_time_series_monthly(symbol)
-
-        time_series = hist_data.get(f'Time Series (60min)') or hist_data.get('Time Series (Daily)') or hist_data.get('Monthly Time Series')
-        logger.debug(f"Trend data for {symbol} range {dets}: {time_series}")
-
-        if not time_series:
+        dets = HISTORICAL_RANGES[range]
+        days = dets['days'] if 'days' in dets else dets['months'] * 30
+        since = datetime.combine(today - timedelta(days=days), datetime.min.time())
+
+        # Bars come from the local store, which only asks upstream for the tail it is missing
+        series = bar_store.get_series(symbol, dets['interval'])
+        if not len(series):
             logger.error("Invalid data for historical data")
             return jsonify({"error": "Invalid data retrieved!"}), 500
 
-        main_data = []
-        today = datetime.today()
-
-        for date, stats in sorted(time_series.items(), reverse=True):
-            date_obj = datetime.strptime(date.split()[0], '%Y-%m-%d')
-            condition = (today - date_obj).days <= dets['days'] if 'days' in dets else (today - date_obj).days <= dets['months'] * 30
-            if condition:
-                main_data.append({"date": date,"close": float(stats["4. close"])})
-
-        return jsonify(main_data)
-
+        bars = series.since(since)
+        logger.debug("Trend data for %s range %s: %s of %s bars", symbol, dets, len(bars), len(series))
+
+        # Only the newest bar is ever rewritten, so it and the bar count identify the data
+        etag = http_cache.etag_for('historical', symbol.upper(), range, since, len(bars),
+                                   bars.timestamps[-1:].tolist(), bars.closes[-1:].tolist())
+        max_age = bar_store.fresh_for(series, dets['interval'])
+        not_modified = http_cache.conditional(etag, max_age)
+        if not_modified:
+            return not_modified
+
+        data, encoding = http_cache.encode(jsonify(bars.to_records()).get_data(), accepted)
+        if max_age > 0:
+            historical_responses.set(key, (today, etag, encoding, data), max_age)
+        return http_cache.encoded_response(data, encoding, etag, max_age)
+
+    except RateLimitExceeded:
+        logger.warning("Rate limited fetching historical trend data for %s", symbol)
+        return jsonify({"error": RATE_LIMIT_ERROR}), 429
     except Exception as e:
-        logger.error(f"Error fetching historical trend data: {str(e)} for symbol {symbol} of range {range}")
+        logger.error("Error fetching historical trend data: %s for symbol %s of range %s", e, symbol, range)
         return jsonify({"error": "Failed to fetch historical trend data"}), 500
 
 
 
 @bp.route('/api/portfolio-status/<int:user_id>')
+@token_required
 def get_portfolio_status(user_id):
     """
     Get the portfolio status i.e account balance and portfolio value for a user.
 
+    The value is read from the materialized valuation book, which is updated
+    incrementally on trades and price ticks. Held symbols whose price is missing or
+    older than `PORTFOLIO_PRICE_MAX_AGE` are refreshed concurrently first. Symbols
+    that could not be refreshed are valued at their last known price (or left out
+    if there is none) and reported in `missing_symbols`, with `partial` set to true.
+    `price_age` is the age in seconds of the oldest price used.
+
+    Requires the user's session token.
+
     Args:
         user_id (int): The user's ID.
 
     Returns:
-        jsonify: The user's balance and portfolio value in JSON format, or error message.
+        jsonify: The user's balance, portfolio value and partial-result flags in JSON format, or error message.
 
     Raises:
         ValueError: If no user is found for the given ID.  ???
         Exception: If an error occurs while fetching portfolio data.
     """
-    user = User.query.get(user_id)
-    if not user:
+    if is_other_user(user_id):
+        return jsonify({'error': FORBIDDEN_ERROR}), 403
+
+    valuation = valuation_book.ensure_loaded(user_id, load_account)
+    if valuation is None:
         return jsonify({'error': 'No user found'}), 404
 
-    total_value = 0
-    for position in user.portfolio:
-        quote = alpha_vantage.get_stock_quote(position.symbol)
-        if 'Global Quote' in quote:
-            current_price = float(quote['Global Quote']['05. price'])
-            total_value += current_price * position.quantity
+    # Fetched prices land in the price table, which ticks them into the valuation book
+    _, missing, price_age = current_prices(
+        valuation['symbols'],
+        current_app.config['PORTFOLIO_PRICE_MAX_AGE']
+    )
+    # The account may have expired while quotes were fetched; this reloads it if so
+    valuation = valuation_book.ensure_loaded(user_id, load_account)
+    if valuation is None:
+        return jsonify({'error': 'No user found'}), 404
+    missing = sorted(set(missing) | set(valuation['unpriced']))
+
+    if missing:
+        logger.warning("Portfolio value for user %s is partial, missing quotes for: %s", user_id, missing)
 
     return jsonify({
-        'balance': user.balance,
-        'portfolio_value': total_value
+        'balance': valuation['balance'],
+        'portfolio_value': valuation['portfolio_value'],
+        'partial': bool(missing),
+        'missing_symbols': missing,
+        'price_age': price_age
     })
 
 
 
+def current_prices(symbols, max_age, priority=PRIORITY_LOOKUP):
+    """
+    Get prices for several symbols, preferring the in-memory price table.
+
+    Symbols whose table entry is missing or older than `max_age` are fetched
+    concurrently, which also writes them back into the table. At trade priority
+    they are fetched from upstream, never from the response cache, so no price
+    is older than `max_age`.
+
+    Args:
+        symbols (list): The stock symbols.
+        max_age (float): The oldest table entry (seconds) that may be used.
+        priority (int): The upstream quota priority for fetches.
+
+    Returns:
+        tuple: `(prices, missing, price_age)` where prices maps symbol to price, missing
+        maps each symbol without a price to why (a `MISSING_*` reason) and price_age is
+        the oldest price's age in seconds.
+    """
+    prices, ages, stale = {}, [], []
+    for symbol in dict.fromkeys(symbols):
+        known = alpha_vantage.prices.get(symbol, max_age)
+        if known:
+            prices[symbol] = known[0]
+            ages.append(known[1])
+        else:
+            stale.append(symbol)
+
+    missing = {}
+    if stale:
+        quotes, missing = alpha_vantage.get_stock_quotes(stale, priority=priority,
+                                                         refresh=priority == PRIORITY_TRADE)
+        for symbol, quote in quotes.items():
+            known = alpha_vantage.prices.get(symbol)
+            if known and quote.get('Global Quote'):
+                prices[symbol] = known[0]
+                ages.append(known[1])
+            else:
+                missing[symbol] = MISSING_INVALID
+
+    return prices, missing, round(max(ages), 1) if ages else None
+
+
+
+def trade_price(symbol):
+    """
+    Get the price to execute a trade at.
+
+    Uses the price table if its entry is within `TRADE_PRICE_MAX_AGE`, otherwise
+    fetches a quote from upstream at trade priority. The response cache is
+    skipped, as a cached or stale quote is at least as old as the table entry.
+
+    Args:
+        symbol (str): The stock symbol.
+
+    Returns:
+        tuple: `(price, age_seconds)`, or None if the symbol has no quote.
+
+    Raises:
+        RateLimitExceeded: If the upstream quota is exhausted.
+    """
+    known = alpha_vantage.prices.get(symbol, current_app.config['TRADE_PRICE_MAX_AGE'])
+    if known:
+        return known
+
+    quote = alpha_vantage.refresh_stock_quote(symbol, priority=PRIORITY_TRADE)
+    if not quote.get('Global Quote'):
+        return None
+    return alpha_vantage.prices.get(symbol) or (float(quote['Global Quote']['05. price']), 0.0)
+
+
+
 @bp.route('/api/buy-stock', methods=['POST'])
+@token_required
 def buy_stock():
     """
     Buy stock(s) for a user and update portfolio value and account balance.
@@ -254,67 +572,58 @@ def buy_stock():
     Args:
         symbol (str): The stock symbol.
         quantity (int): The number of shares to buy.
-        userId (int): The user's ID.
+        userId (int): The user's ID (optional; the session token identifies the user).
 
     Returns:
         jsonify: The user's updated balance and portfolio value in JSON format, or error message.
 
     Raises:
         ValueError: If the input data is invalid, user is not found or insufficient funds for buying the stocks.
+        TradeError: If the trade is rejected against the locked account rows, or keeps conflicting with concurrent trades (409).
         Exception: If an error occurs while buying stock or updating portfolio.
+        RateLimitExceeded: If the upstream quota is exhausted; returned as 429.
     """
     data = request.json
     symbol = data.get('symbol')
     quantity = int(data.get('quantity', 0))
-    user_id = data.get('userId')
+    user_id = g.principal.user_id
 
-    if not symbol or quantity <= 0 or not user_id:
+    if is_other_user(data.get('userId')):
+        return jsonify({'success': False, 'error': FORBIDDEN_ERROR}), 403
+    if not symbol or quantity <= 0:
         return jsonify({'success': False, 'error': 'Invalid input'}), 400
 
-    quote = alpha_vantage.get_stock_quote(symbol)
-    if 'Global Quote' not in quote:
+    try:
+        quoted = trade_price(symbol)
+    except RateLimitExceeded:
+        return jsonify({'success': False, 'error': RATE_LIMIT_ERROR}), 429
+    if not quoted:
         return jsonify({'success': False, 'error': 'Invalid stock symbol'}), 400
 
-    current_price = float(quote['Global Quote']['05. price'])
+    current_price, price_age = quoted
     total_cost = current_price * quantity
 
-    user = User.query.get(user_id)
-    if not user:
-        return jsonify({'success': False, 'error': 'User not found'}), 404
-
-    if user.balance < total_cost:
-        return jsonify({'success': False, 'error': 'Insufficient funds'}), 400
-
     try:
-        # Update or create position
-        position = Portfolio.query.filter_by(user_id=user.id, symbol=symbol).first()
-        if position:
-            position.quantity += quantity
-        else:
-            position = Portfolio(
-                user_id=user.id,
-                symbol=symbol,
-                quantity=quantity,
-                purchase_price=current_price
-            )
-            db.session.add(position)
-
-        user.balance -= total_cost
-        db.session.commit()
-
-        return jsonify({
-            'success': True,
-            'new_balance': user.balance,
-            'portfolio_value': total_cost
-        })
-
+        new_balance, version = execute_trade(user_id, symbol, quantity, current_price,
+                                             max_retries=current_app.config['TRADE_MAX_RETRIES'])
+    except TradeError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status_code
     except Exception as e:
-        db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+    valuation_book.apply_trade(user_id, symbol, quantity, new_balance, version)
+
+    return jsonify({
+        'success': True,
+        'new_balance': new_balance,
+        'portfolio_value': total_cost,
+        'price_age': round(price_age, 1)
+    })
+
 
 
 @bp.route('/api/sell-stock', methods=['POST'])
+@token_required
 def sell_stock():
     """
     Sell stock(s) for a user and update portfolio value and account balance.
@@ -322,55 +631,248 @@ def sell_stock():
     Args:
         symbol (str): The stock symbol.
         quantity (int): The number of shares to sell.
-        userId (int): The user's ID.
+        userId (int): The user's ID (optional; the session token identifies the user).
 
     Returns:
         jsonify: The user's updated balance and portfolio value in JSON format, or error message.
 
     Raises:
         ValueError: If the input data is invalid, user is not found or insufficient funds for selling the stocks.
+        TradeError: If the trade is rejected against the locked account rows, or keeps conflicting with concurrent trades (409).
         Exception: If an error occurs while selling stock or updating portfolio.
+        RateLimitExceeded: If the upstream quota is exhausted; returned as 429.
     """
     data = request.json
     symbol = data.get('symbol')
     quantity = int(data.get('quantity', 0))
-    user_id = data.get('userId')
+    user_id = g.principal.user_id
 
-    if not symbol or quantity <= 0 or not user_id:
+    if is_other_user(data.get('userId')):
+        return jsonify({'success': False, 'error': FORBIDDEN_ERROR}), 403
+    if not symbol or quantity <= 0:
         return jsonify({'success': False, 'error': 'Invalid input'}), 400
-    if not symbol or quantity <= 0 or not user_id:
-        return jsonify({'success': False, 'error': 'Invalid input'}), 400
-
-    user = User.query.get(user_id)
-    if not user:
-        return jsonify({'success': False, 'error': 'User not found'}), 404
 
-    position = Portfolio.query.filter_by(user_id=user.id, symbol=symbol).first()
+    # Cheap unlocked pre-check so obviously invalid sells don't spend a quote;
+    # execute_trade re-checks against the locked rows. The read transaction is
+    # ended before the quote is fetched.
+    position = Portfolio.query.filter_by(user_id=user_id, symbol=symbol).first()
     if not position or position.quantity < quantity:
         return jsonify({'success': False, 'error': 'Insufficient shares'}), 400
+    db.session.rollback()
 
-    quote = alpha_vantage.get_stock_quote(symbol)
-    if 'Global Quote' not in quote:
+    try:
+        quoted = trade_price(symbol)
+    except RateLimitExceeded:
+        return jsonify({'success': False, 'error': RATE_LIMIT_ERROR}), 429
+    if not quoted:
         return jsonify({'success': False, 'error': 'Invalid stock symbol'}), 400
 
-    current_price = float(quote['Global Quote']['05. price'])
+    current_price, price_age = quoted
     total_value = current_price * quantity
 
     try:
-        position.quantity -= quantity
-        user.balance += total_value
+        new_balance, version = execute_trade(user_id, symbol, -quantity, current_price,
+                                             max_retries=current_app.config['TRADE_MAX_RETRIES'])
+    except TradeError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status_code
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    valuation_book.apply_trade(user_id, symbol, -quantity, new_balance, version)
+
+    return jsonify({
+        'success': True,
+        'new_balance': new_balance,
+        'portfolio_value': total_value,
+        'price_age': round(price_age, 1)
+    })
+
+
+
+@bp.route('/api/orders/batch', methods=['POST'])
+@token_required
+def batch_orders():
+    """
+    Execute several buys and sells for a user as one atomic order.
+
+    Each distinct symbol is priced once (price table or a concurrent quote
+    fan-out at trade priority), then the whole set is validated against the
+    user's balance and holdings and committed in a single transaction. Sales
+    in the batch can fund its buys; if any order fails validation nothing is
+    applied.
+
+    Args:
+        userId (int): The user's ID (optional; the session token identifies the user).
+        orders (list): Objects with `symbol`, `side` (`buy` or `sell`) and `quantity`.
+
+    Returns:
+        jsonify: The user's updated balance, the executed orders with their prices and the oldest price age, or error message.
 
-        if position.quantity == 0:
-            db.session.delete(position)
+    Raises:
+        TradeError: If the orders are rejected against the locked account rows, or keep conflicting with concurrent trades (409).
+    """
+    data = request.json or {}
+    user_id = g.principal.user_id
+    legs = data.get('orders')
 
-        db.session.commit()
+    if is_other_user(data.get('userId')):
+        return jsonify({'success': False, 'error': FORBIDDEN_ERROR}), 403
+    if not isinstance(legs, list) or not legs:
+        return jsonify({'success': False, 'error': 'Invalid input'}), 400
 
-        return jsonify({
-            'success': True,
-            'new_balance': user.balance,
-            'portfolio_value': total_value
-        })
+    max_legs = current_app.config['ORDER_BATCH_MAX_LEGS']
+    if len(legs) > max_legs:
+        return jsonify({'success': False, 'error': f'Too many orders (max {max_legs})'}), 400
 
+    orders = []
+    try:
+        for leg in legs:
+            symbol = str(leg.get('symbol', '')).strip().upper()
+            side = leg.get('side')
+            quantity = int(leg.get('quantity', 0))
+            if not symbol or side not in ('buy', 'sell') or quantity <= 0:
+                raise ValueError(leg)
+            orders.append((symbol, quantity if side == 'buy' else -quantity))
+    except (AttributeError, TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Invalid input'}), 400
+
+    logger.info("Executing %s orders for user %s", len(orders), user_id)
+    prices, missing, price_age = current_prices(
+        [symbol for symbol, _ in orders],
+        current_app.config['TRADE_PRICE_MAX_AGE'],
+        PRIORITY_TRADE
+    )
+    if missing:
+        return batch_price_error(missing)
+
+    try:
+        new_balance, version = execute_orders(user_id, orders, prices,
+                                              max_retries=current_app.config['TRADE_MAX_RETRIES'])
+    except TradeError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status_code
     except Exception as e:
-        db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
+
+    valuation_book.apply_trades(user_id, net_quantities(orders), new_balance, version)
+
+    return jsonify({
+        'success': True,
+        'new_balance': new_balance,
+        'orders': [
+            {'symbol': symbol, 'side': 'buy' if quantity > 0 else 'sell', 'quantity': abs(quantity), 'price': prices[symbol]}
+            for symbol, quantity in orders
+        ],
+        'price_age': price_age
+    })
+
+
+
+def batch_price_error(missing):
+    """
+    Build the error response for a batch whose symbols could not all be priced.
+
+    An unknown symbol makes the request itself invalid (400); otherwise the status
+    says why upstream could not answer: quota exhausted (429), timed out (504) or
+    failed (503).
+
+    Args:
+        missing (dict): Symbols without a price, mapped to their `MISSING_*` reason.
+
+    Returns:
+        tuple: The JSON error response and its status code.
+    """
+    reasons = set(missing.values())
+    if MISSING_INVALID in reasons:
+        error, status = 'Invalid stock symbol', 400
+    elif MISSING_THROTTLED in reasons:
+        error, status = RATE_LIMIT_ERROR, 429
+    elif MISSING_TIMEOUT in reasons:
+        error, status = 'Timed out fetching stock prices', 504
+    else:
+        error, status = 'Failed to fetch stock prices', 503
+    return jsonify({'success': False, 'error': error, 'missing_symbols': sorted(missing)}), status
+
+
+
+@bp.route('/api/upstream/stats')
+def upstream_stats():
+    """
+    Get the Alpha Vantage cache counters (hits, stale hits, misses per function).
+
+    Returns:
+        jsonify: The upstream statistics in JSON format.
+    """
+    return jsonify(alpha_vantage.stats())
+
+
+
+@bp.route('/api/stream')
+def stream():
+    """
+    Stream live portfolio and quote updates as Server-Sent Events.
+
+    The stream starts with the current values and then pushes `portfolio` events
+    whenever the user's balance or portfolio value changes and `quote` events
+    whenever a subscribed symbol's price is refreshed. A comment line is sent
+    every `STREAM_HEARTBEAT` seconds to keep idle connections open. All events
+    come from the shared publisher, so connected clients never add upstream calls.
+
+    Portfolio updates require the user's session token, passed as a `token`
+    query parameter since EventSource cannot set headers.
+
+    Args:
+        user_id (int): The user whose portfolio updates to stream (optional).
+        symbols (str): Comma separated stock symbols whose quotes to stream (optional).
+        token (str): The user's session token (required with `user_id`).
+
+    Returns:
+        Response: A `text/event-stream` response, or error message.
+    """
+    user_id = request.args.get('user_id', type=int)
+    symbols = [s.strip().upper() for s in request.args.get('symbols', '').split(',') if s.strip()]
+    symbols = list(dict.fromkeys(symbols))
+    if not user_id and not symbols:
+        return jsonify({"error": "No user or symbols given"}), 400
+    if len(symbols) > current_app.config['QUOTE_BATCH_MAX_SYMBOLS']:
+        return jsonify({"error": "Too many symbols"}), 400
+
+    topics = [f'quote:{symbol}' for symbol in symbols]
+    initial = []
+    if user_id:
+        try:
+            g.principal = authenticate(allow_query_token=True)
+        except InvalidToken as e:
+            return jsonify({'error': str(e)}), 401
+        if is_other_user(user_id):
+            return jsonify({'error': FORBIDDEN_ERROR}), 403
+        valuation = valuation_book.ensure_loaded(user_id, load_account)
+        if valuation is None:
+            return jsonify({'error': 'No user found'}), 404
+        topics.append(f'portfolio:{user_id}')
+        initial.append(('portfolio', {'balance': valuation['balance'], 'portfolio_value': valuation['portfolio_value']}))
+    for symbol in symbols:
+        known = alpha_vantage.prices.get(symbol)
+        if known:
+            initial.append(('quote', {'symbol': symbol, 'price': known[0], 'updated_at': time.time() - known[1]}))
+
+    subscription = broadcaster.subscribe(topics)
+    heartbeat = current_app.config['STREAM_HEARTBEAT']
+    logger.info("Streaming %s to client", topics)
+
+    def events():
+        try:
+            for event, data in initial:
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+            while True:
+                item = subscription.get(timeout=heartbeat)
+                if item is None:
+                    yield ": keep-alive\n\n"
+                else:
+                    yield f"event: {item[0]}\ndata: {json.dumps(item[1])}\n\n"
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
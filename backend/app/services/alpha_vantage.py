@@ -1,38 +1,210 @@
-import os
+import json
+import logging
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from config import Config
+from .cache import TTLCache
+from .cassette import Cassette
+from .market_hours import seconds_until_next_transition
+from .metrics import registry
+from .price_table import PriceTable
+from .rate_limiter import (
+    PRIORITY_BACKGROUND, PRIORITY_HISTORICAL, PRIORITY_LOOKUP, QuotaScheduler, RateLimitExceeded
+)
+from .singleflight import SingleFlight
+
+
+logger = logging.getLogger(__name__)
+
+# Upstream payload keys that signal an error or throttling rather than data
+ERROR_KEYS = ('Error Message', 'Note', 'Information')
+
+# Why a symbol is in the `missing` mapping of `get_stock_quotes` (and the routes'
+# price lookups): quota exhausted, deadline or upstream timeout, any other upstream
+# failure, or an answer without a quote (unknown symbol)
+MISSING_THROTTLED = 'throttled'
+MISSING_TIMEOUT = 'timeout'
+MISSING_FAILED = 'failed'
+MISSING_INVALID = 'invalid'
+
+# HTTP statuses worth retrying; anything else is returned to the caller as-is
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# ALPHA_VANTAGE_CASSETTE_MODE values besides '' (live calls only)
+CASSETTE_MODES = ('record', 'replay')
+
+# Seconds past an open/close before cached market status is refetched, so upstream has flipped
+MARKET_TRANSITION_GRACE = 5
+
+UPSTREAM_LATENCY = registry.histogram(
+    'upstream_request_duration_seconds', 'Alpha Vantage HTTP call latency per attempt.', ['function']
+)
+UPSTREAM_ERRORS = registry.counter(
+    'upstream_errors_total', 'Failed Alpha Vantage calls by kind (timeout, connection, http_<status>, throttled).',
+    ['function', 'kind']
+)
+
+# Wording Alpha Vantage uses in 'Note'/'Information' payloads when a quota is hit
+THROTTLE_PATTERN = re.compile(r'call frequency|rate limit|requests per (day|minute)', re.IGNORECASE)
+# Throttling that will not clear until the daily quota frees up
+DAILY_THROTTLE_PATTERN = re.compile(r'per day|daily', re.IGNORECASE)
+
+
+class UpstreamPayload(dict):
+    """
+    A decoded upstream JSON object that keeps the bytes it was decoded from.
+
+    It behaves as a plain dict; `raw` lets routes that return the payload
+    unchanged send the original body instead of re-encoding it. The dict must
+    not be modified, or `raw` no longer matches it.
+    """
+
+    __slots__ = ('raw',)
+
+    def __init__(self, data, raw):
+        super().__init__(data)
+        self.raw = raw
+
+    @classmethod
+    def wrap(cls, data, raw):
+        return cls(data, raw) if isinstance(data, dict) else data
+
 
 class AlphaVantageService:
-    def __init__(self):
-        self.api_key = os.getenv('ALPHA_VANTAGE_API_KEY')
-        self.base_url = 'https://www.alphavantage.co/query'
+    def __init__(self, config=Config):
+        self.api_key = config.ALPHA_VANTAGE_API_KEY
+        self.base_url = config.ALPHA_VANTAGE_BASE_URL
+
+        self.session = self._build_session(config.ALPHA_VANTAGE_POOL_SIZE)
+        self.timeout = (config.ALPHA_VANTAGE_CONNECT_TIMEOUT, config.ALPHA_VANTAGE_READ_TIMEOUT)
+        self.max_retries = config.ALPHA_VANTAGE_MAX_RETRIES
+        self.backoff_base = config.ALPHA_VANTAGE_BACKOFF_BASE
+        self.backoff_max = config.ALPHA_VANTAGE_BACKOFF_MAX
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=config.ALPHA_VANTAGE_FANOUT_WORKERS,
+            thread_name_prefix='alpha-vantage'
+        )
+        self.fanout_deadline = config.ALPHA_VANTAGE_FANOUT_DEADLINE
+
+        self.cache = TTLCache(maxsize=config.ALPHA_VANTAGE_CACHE_SIZE)
+        self.cache_ttls = config.ALPHA_VANTAGE_CACHE_TTLS
+        self.default_ttl = config.ALPHA_VANTAGE_CACHE_DEFAULT_TTL
+        self.stale_ttl = config.ALPHA_VANTAGE_CACHE_STALE_TTL
+        self.market_status_max_ttl = config.ALPHA_VANTAGE_MARKET_STATUS_MAX_TTL
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+        self.flights = SingleFlight()
+        self.prices = PriceTable()
 
-    def get_stock_quote(self, symbol):
+        self.scheduler = QuotaScheduler(
+            per_minute=config.ALPHA_VANTAGE_CALLS_PER_MINUTE,
+            per_day=config.ALPHA_VANTAGE_CALLS_PER_DAY,
+            max_wait=config.ALPHA_VANTAGE_QUOTA_MAX_WAIT
+        )
+
+        self.cassette_mode = config.ALPHA_VANTAGE_CASSETTE_MODE
+        if self.cassette_mode and self.cassette_mode not in CASSETTE_MODES:
+            raise ValueError(f"ALPHA_VANTAGE_CASSETTE_MODE must be one of {CASSETTE_MODES}, not {self.cassette_mode!r}")
+        self.cassette = Cassette(config.ALPHA_VANTAGE_CASSETTE_PATH) if self.cassette_mode else None
+        self.replay_latency = config.ALPHA_VANTAGE_CASSETTE_REPLAY_LATENCY
+
+    def get_stock_quote(self, symbol, priority=PRIORITY_LOOKUP):
         """Get current stock quote"""
         params = {
             'function': 'GLOBAL_QUOTE',
-            'symbol': symbol,
-            'apikey': self.api_key
+            'symbol': symbol
         }
-        response = requests.get(self.base_url, params=params)
-        return response.json()
+        return self._query(params, priority)
 
-    def get_time_series_daily(self, symbol):
-        """Get daily time series"""
+    def refresh_stock_quote(self, symbol, priority=PRIORITY_BACKGROUND):
+        """
+        Fetch a stock quote from upstream even if a cached one is still fresh.
+
+        Args:
+            symbol (str): The stock symbol.
+            priority (int): The upstream quota priority.
+
+        Returns:
+            dict: The quote payload.
+        """
+        params = {'function': 'GLOBAL_QUOTE', 'symbol': symbol}
+        return self._fetch_and_store(self._cache_key(params), params, priority)
+
+    def get_stock_quotes(self, symbols, timeout=None, priority=PRIORITY_LOOKUP, refresh=False):
+        """
+        Get current quotes for many symbols concurrently.
+
+        Cached quotes are resolved inline; the remaining distinct symbols are fetched
+        in parallel on the shared worker pool, so the call takes roughly as long as
+        the slowest quote rather than their sum.
+
+        Args:
+            symbols (iterable): The stock symbols; duplicates are fetched once.
+            timeout (float): Seconds to wait before giving up on outstanding quotes.
+                Defaults to the configured fan-out deadline.
+            priority (int): The upstream quota priority of the fetches.
+            refresh (bool): Fetch every symbol from upstream, ignoring cached quotes.
+
+        Returns:
+            tuple: `(quotes, missing)` where quotes maps symbol to its payload and
+            missing maps each symbol that could not be fetched to `MISSING_THROTTLED`,
+            `MISSING_TIMEOUT` (deadline or upstream timeout) or `MISSING_FAILED`.
+        """
+        quotes, missing, futures = {}, {}, {}
+        for symbol in dict.fromkeys(symbols):
+            params = {'function': 'GLOBAL_QUOTE', 'symbol': symbol}
+            key = self._cache_key(params)
+            value, hit = (None, False) if refresh else self._cached(key, params)
+            if hit:
+                quotes[symbol] = value
+            else:
+                futures[self.executor.submit(self._fetch_and_store, key, params, priority)] = symbol
+        if not futures:
+            return quotes, missing
+
+        done, _ = wait(futures, timeout=self.fanout_deadline if timeout is None else timeout)
+        for future, symbol in futures.items():
+            if future not in done:
+                missing[symbol] = MISSING_TIMEOUT
+            elif future.exception() is None:
+                quotes[symbol] = future.result()
+            elif isinstance(future.exception(), RateLimitExceeded):
+                missing[symbol] = MISSING_THROTTLED
+            elif isinstance(future.exception(), requests.Timeout):
+                missing[symbol] = MISSING_TIMEOUT
+            else:
+                missing[symbol] = MISSING_FAILED
+        return quotes, missing
+
+    def get_time_series_daily(self, symbol, outputsize=None, priority=PRIORITY_HISTORICAL):
+        """Get daily time series ('compact' = latest 100 bars, 'full' = entire history), uncached"""
         params = {
             'function': 'TIME_SERIES_DAILY',
-            'symbol': symbol,
-            'apikey': self.api_key
+            'symbol': symbol
         }
-        response = requests.get(self.base_url, params=params)
-        return response.json()
+        if outputsize:
+            params['outputsize'] = outputsize
+        return self._fetch_uncached(params, priority)
 
-    def get_time_series_intraday(self, symbol, interval):
+    def get_time_series_intraday(self, symbol, interval, outputsize=None, priority=PRIORITY_HISTORICAL):
         """
         Get per hour time series data for the given symbol.
 
+        Time series are always fetched from upstream: the bar store keeps the bars,
+        and a cached payload would hand it bars older than the ones it is refreshing.
+
         Args:
             symbol (str): The stock symbol.
             interval (str): The interval for intraday data.
+            outputsize (str): 'compact' for the latest 100 bars or 'full'. Defaults to the upstream default.
 
         Returns:
             dict: The intraday time series data.
@@ -40,16 +212,16 @@ class AlphaVantageService:
         params = {
             'function': 'TIME_SERIES_INTRADAY',
             'symbol': symbol,
-            'interval': interval,
-            'apikey': self.api_key
+            'interval': interval
         }
-        response = requests.get(self.base_url, params=params)
-        return response.json()
+        if outputsize:
+            params['outputsize'] = outputsize
+        return self._fetch_uncached(params, priority)
 
 
-    def get_time_series_monthly(self, symbol):
+    def get_time_series_monthly(self, symbol, priority=PRIORITY_HISTORICAL):
         """
-        Get monthly time series data for the given symbol.
+        Get monthly time series data for the given symbol, always from upstream.
 
         Args:
             symbol (str): The stock symbol.
@@ -59,23 +231,230 @@ class AlphaVantageService:
         """
         params = {
             'function': 'TIME_SERIES_MONTHLY',
-            'symbol': symbol,
-            'apikey': self.api_key
+            'symbol': symbol
         }
-        response = requests.get(self.base_url, params=params)
-        return response.json()
+        return self._fetch_uncached(params, priority)
 
 
-    def get_global_market_status(self):
+    def get_global_market_status(self, priority=PRIORITY_LOOKUP):
         """
         Get the global market status of major trading venues.
 
+        The result is cached until the next open or close of any listed market.
+
         Returns:
             dict: The market status data.
         """
         params = {
-            'function': 'MARKET_STATUS',
-            'apikey': self.api_key
+            'function': 'MARKET_STATUS'
         }
-        response = requests.get(self.base_url, params=params)
-        return response.json()
+        return self._query(params, priority)
+
+
+    def fresh_for(self, params):
+        """
+        Get how much longer the cached response to a query stays fresh.
+
+        Args:
+            params (dict): The query parameters, without the API key.
+
+        Returns:
+            float: Seconds until a refetch is due; 0 if nothing fresh is cached.
+        """
+        return self.cache.ttl(self._cache_key(params))
+
+    def stats(self):
+        """
+        Get cache, request-coalescing and quota counters so TTLs can be tuned under load.
+
+        Returns:
+            dict: The cache, single-flight and rate limiter statistics.
+        """
+        return {
+            'cache': self.cache.stats(),
+            'single_flight': self.flights.stats(),
+            'rate_limiter': self.scheduler.stats()
+        }
+
+
+    def _query(self, params, priority=PRIORITY_LOOKUP):
+        """
+        Serve a request from the cache, falling back to the upstream API.
+
+        Fresh entries are returned directly. Expired entries still inside the stale
+        window are returned immediately while a single background refresh runs.
+
+        Args:
+            params (dict): The query parameters, without the API key.
+            priority (int): The upstream quota priority if a fetch is needed.
+
+        Returns:
+            dict: The decoded upstream payload.
+
+        Raises:
+            RateLimitExceeded: If the upstream quota is exhausted.
+        """
+        key = self._cache_key(params)
+        value, hit = self._cached(key, params)
+        if hit:
+            return value
+        return self._fetch_and_store(key, params, priority)
+
+    def _fetch_uncached(self, params, priority=PRIORITY_LOOKUP):
+        """
+        Fetch a payload from upstream without reading or filling the cache.
+
+        Concurrent calls for the same query still share one upstream request.
+        """
+        return self.flights.do(self._cache_key(params), lambda: self._fetch(params, priority))
+
+    def _cached(self, key, params):
+        """
+        Look up a cached payload, scheduling a background refresh if it is stale.
+
+        Returns:
+            tuple: `(value, hit)` where hit is False when the upstream must be called.
+        """
+        value, state = self.cache.get(key)
+        if state == TTLCache.STALE:
+            self._refresh_in_background(key, params)
+        return value, state is not None
+
+    def _fetch_and_store(self, key, params, priority=PRIORITY_LOOKUP):
+        """
+        Fetch a payload from upstream and cache it if it is valid data.
+
+        Concurrent calls for the same key share one upstream request; every
+        waiter gets its result or its exception.
+        """
+        def load():
+            data = self._fetch(params, priority)
+            if self._is_cacheable(data):
+                self._store(key, params, data)
+            return data
+
+        return self.flights.do(key, load)
+
+    def _store(self, key, params, data):
+        if params['function'] == 'MARKET_STATUS':
+            # Status only changes at an open/close, and serving it stale past one would be wrong
+            seconds = seconds_until_next_transition(data)
+            if seconds is None:
+                ttl = self.cache_ttls.get('MARKET_STATUS', self.default_ttl)
+            else:
+                ttl = min(seconds + MARKET_TRANSITION_GRACE, self.market_status_max_ttl)
+            self.cache.set(key, data, ttl)
+            return
+        ttl = self.cache_ttls.get(params['function'], self.default_ttl)
+        self.cache.set(key, data, ttl, self.stale_ttl)
+
+        if params['function'] == 'GLOBAL_QUOTE' and data.get('Global Quote', {}).get('05. price'):
+            self.prices.update(params['symbol'], float(data['Global Quote']['05. price']))
+
+    def _refresh_in_background(self, key, params):
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._fetch_and_store(key, params, PRIORITY_BACKGROUND)
+            except Exception as e:
+                logger.warning("Background refresh failed for %s: %s", key, e)
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name='alpha-vantage-refresh', daemon=True).start()
+
+    def _fetch(self, params, priority=PRIORITY_LOOKUP):
+        """
+        Call the upstream API over the pooled session, retrying transient failures.
+
+        Every attempt first waits for a token from the quota scheduler. Connection
+        errors, timeouts and retryable HTTP statuses are retried up to
+        `max_retries` times with full-jitter exponential backoff. In cassette
+        record mode every attempt's response is saved; in replay mode the
+        recorded response is returned instead and neither the network nor the
+        quota is used.
+
+        Args:
+            params (dict): The query parameters, without the API key.
+            priority (int): The upstream quota priority.
+
+        Returns:
+            dict: The decoded upstream payload.
+
+        Raises:
+            RateLimitExceeded: If no quota is available or the upstream reports throttling.
+            requests.RequestException: If the last attempt still fails.
+            CassetteMiss: In replay mode, if the request was never recorded.
+        """
+        if self.cassette_mode == 'replay':
+            return self._replay(params)
+
+        query = dict(params, apikey=self.api_key)
+        function = params['function']
+        for attempt in range(self.max_retries + 1):
+            self.scheduler.acquire(priority)
+            started = time.perf_counter()
+            try:
+                response = self.session.get(self.base_url, params=query, timeout=self.timeout)
+                elapsed = time.perf_counter() - started
+                UPSTREAM_LATENCY.observe(elapsed, function)
+                if self.cassette_mode == 'record':
+                    self.cassette.record(params, response.status_code, response.content, elapsed)
+                if response.status_code not in RETRY_STATUSES:
+                    data = UpstreamPayload.wrap(response.json(), response.content)
+                    return self._check_throttled(data, function)
+                UPSTREAM_ERRORS.inc(function, f'http_{response.status_code}')
+                error = requests.HTTPError(f"Upstream returned {response.status_code}", response=response)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                UPSTREAM_LATENCY.observe(time.perf_counter() - started, function)
+                UPSTREAM_ERRORS.inc(function, 'timeout' if isinstance(e, requests.Timeout) else 'connection')
+                error = e
+
+            if attempt == self.max_retries:
+                raise error
+            delay = self._backoff(attempt)
+            logger.warning("Upstream %s failed (%s), retrying in %.2fs", params['function'], error, delay)
+            time.sleep(delay)
+
+    def _replay(self, params):
+        status, body, latency = self.cassette.play(params)
+        if self.replay_latency:
+            time.sleep(latency)
+        UPSTREAM_LATENCY.observe(latency, params['function'])
+        if status in RETRY_STATUSES:
+            raise requests.HTTPError(f"Recorded upstream response was {status}")
+        return self._check_throttled(UpstreamPayload.wrap(json.loads(body), body), params['function'])
+
+    def _check_throttled(self, data, function):
+        message = data.get('Note') or data.get('Information') if isinstance(data, dict) else None
+        if message and THROTTLE_PATTERN.search(message):
+            UPSTREAM_ERRORS.inc(function, 'throttled')
+            self.scheduler.drain(daily=bool(DAILY_THROTTLE_PATTERN.search(message)))
+            raise RateLimitExceeded(message)
+        return data
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    @staticmethod
+    def _build_session(pool_size):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    @staticmethod
+    def _cache_key(params):
+        symbol = params.get('symbol')
+        extra = tuple(sorted((k, v) for k, v in params.items() if k not in ('function', 'symbol')))
+        return (params['function'], symbol.upper() if symbol else None, extra)
+
+    @staticmethod
+    def _is_cacheable(data):
+        return isinstance(data, dict) and bool(data) and not any(k in data for k in ERROR_KEYS)
@@ -0,0 +1,93 @@
+import time
+from collections import namedtuple
+
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+from .cache import TTLCache
+
+
+# The authenticated user as seen by request handlers
+Principal = namedtuple('Principal', ['user_id', 'username', 'email'])
+
+
+class InvalidToken(Exception):
+    """Raised for tokens that are malformed, tampered with, expired or name an unknown user."""
+
+
+class TokenAuthority:
+    """
+    Issues and verifies compact HMAC-signed session tokens.
+
+    A token is the user id plus its issue time, signed with the app's
+    `SECRET_KEY`, so verification needs no server-side session. Verified
+    tokens are kept in a small TTL cache together with the user row's
+    principal, so repeated requests with the same token skip both the HMAC
+    check and the `User` lookup. A cache entry never outlives its token.
+    """
+
+    SALT = 'auth-token'
+
+    def __init__(self, secret_key, max_age, load_principal, cache_ttl=60, cache_size=4096, clock=time.time):
+        """
+        Args:
+            secret_key (str): Signing key.
+            max_age (int): Seconds a token stays valid after it is issued.
+            load_principal (callable): `load_principal(user_id)` returning a Principal, or None for unknown users.
+            cache_ttl (int): Seconds a verified token's principal is cached.
+            cache_size (int): Most tokens cached at once.
+            clock (callable): Wall clock, in seconds.
+        """
+        self.serializer = URLSafeTimedSerializer(secret_key, salt=self.SALT)
+        self.max_age = max_age
+        self.load_principal = load_principal
+        self.cache_ttl = cache_ttl
+        self.cache = TTLCache(maxsize=cache_size)
+        self._clock = clock
+
+    def issue(self, user_id):
+        """
+        Create a token for a user.
+
+        Args:
+            user_id (int): The user's ID.
+
+        Returns:
+            str: The signed token.
+        """
+        return self.serializer.dumps(user_id)
+
+    def verify(self, token):
+        """
+        Resolve a token to the principal it was issued for.
+
+        Args:
+            token (str): A token from `issue`.
+
+        Returns:
+            Principal: The authenticated user.
+
+        Raises:
+            InvalidToken: If the token is not valid.
+        """
+        key = ('TOKEN', token, ())
+        principal, state = self.cache.get(key)
+        if state == TTLCache.FRESH:
+            return principal
+
+        try:
+            user_id, issued_at = self.serializer.loads(token, max_age=self.max_age, return_timestamp=True)
+        except SignatureExpired:
+            raise InvalidToken('Token expired')
+        except BadSignature:
+            raise InvalidToken('Invalid token')
+
+        principal = self.load_principal(user_id)
+        if principal is None:
+            raise InvalidToken('Unknown user')
+
+        remaining = issued_at.timestamp() + self.max_age - self._clock()
+        ttl = min(self.cache_ttl, remaining)
+        if ttl > 0:
+            self.cache.set(key, principal, ttl=ttl)
+        return principal
+
@@ -0,0 +1,211 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from config import Config
+from app.models import db, PriceBar, PriceSeries
+from .series_frame import SeriesFrame
+from .singleflight import SingleFlight
+
+
+logger = logging.getLogger(__name__)
+
+
+# How each stored interval is fetched, parsed and labelled. `compact_window` is how far
+# back the latest 100 bars reliably reach; older gaps need the 'full' output size.
+SERIES = {
+    '60min': {
+        'payload_key': 'Time Series (60min)',
+        'format': '%Y-%m-%d %H:%M:%S',
+        'label_unit': 's',
+        'compact_window': timedelta(days=5),
+        'fetch': lambda av, symbol, outputsize: av.get_time_series_intraday(symbol, '60min', outputsize=outputsize)
+    },
+    'daily': {
+        'payload_key': 'Time Series (Daily)',
+        'format': '%Y-%m-%d',
+        'label_unit': 'D',
+        'compact_window': timedelta(days=100),
+        'fetch': lambda av, symbol, outputsize: av.get_time_series_daily(symbol, outputsize=outputsize)
+    },
+    'monthly': {
+        'payload_key': 'Monthly Time Series',
+        'format': '%Y-%m-%d',
+        'label_unit': 'D',
+        'compact_window': None,
+        'fetch': lambda av, symbol, outputsize: av.get_time_series_monthly(symbol)
+    }
+}
+
+
+class BarStore:
+    """
+    Persistent OHLCV bar store backed by the `PriceBar` table.
+
+    Each (symbol, interval) series is topped up from upstream at most once per
+    refresh period, fetching only the compact tail since the newest stored bar.
+    Reads are served from an in-memory columnar `SeriesFrame` that is reloaded
+    from the table only when the stored series changes. Listeners registered
+    with `subscribe` are called with `(symbol, interval)` after new or updated
+    bars are stored.
+    """
+
+    def __init__(self, alpha_vantage, refresh_after=None):
+        self.alpha_vantage = alpha_vantage
+        self.refresh_after = refresh_after or Config.BAR_STORE_REFRESH_AFTER
+        self.flights = SingleFlight()
+        self._frames = {}
+        self._frames_lock = threading.Lock()
+        self._listeners = []
+
+    def get_series(self, symbol, interval):
+        """
+        Get the closing prices of a stored series, refreshing it first if due.
+
+        Args:
+            symbol (str): The stock symbol.
+            interval (str): One of '60min', 'daily' or 'monthly'.
+
+        Returns:
+            SeriesFrame: The series oldest first; empty if no data is available.
+        """
+        symbol = symbol.upper()
+        self.refresh(symbol, interval)
+
+        # refreshed_at changes on every sync, including ones made by other workers
+        series = db.session.get(PriceSeries, (symbol, interval))
+        version = series.refreshed_at if series is not None else None
+        with self._frames_lock:
+            frame = self._frames.get((symbol, interval))
+        if frame is not None and frame.version == version:
+            return frame
+
+        rows = db.session.query(PriceBar.timestamp, PriceBar.close).filter(
+            PriceBar.symbol == symbol,
+            PriceBar.interval == interval
+        ).order_by(PriceBar.timestamp).all()
+        frame = SeriesFrame.from_rows(rows, SERIES[interval]['label_unit'], version)
+        with self._frames_lock:
+            self._frames[(symbol, interval)] = frame
+        return frame
+
+    def subscribe(self, listener):
+        with self._frames_lock:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        with self._frames_lock:
+            self._listeners.remove(listener)
+
+    def fresh_for(self, frame, interval):
+        """
+        Get how long until a series read through `get_series` is due a refresh.
+
+        Args:
+            frame (SeriesFrame): The frame returned by `get_series`.
+            interval (str): One of '60min', 'daily' or 'monthly'.
+
+        Returns:
+            float: Seconds until the next top-up from upstream; 0 if it is due.
+        """
+        if frame.version is None:
+            return 0.0
+        age = (datetime.utcnow() - frame.version).total_seconds()
+        return max(0.0, self.refresh_after[interval] - age)
+
+    def refresh(self, symbol, interval):
+        """
+        Top up a series from upstream if its refresh period has passed.
+
+        If the refresh fails but bars are already stored, they keep being served.
+
+        Args:
+            symbol (str): The upper-cased stock symbol.
+            interval (str): One of '60min', 'daily' or 'monthly'.
+
+        Returns:
+            int: The number of bars written.
+        """
+        series = db.session.get(PriceSeries, (symbol, interval))
+        max_age = timedelta(seconds=self.refresh_after[interval])
+        if series is not None and datetime.utcnow() - series.refreshed_at < max_age:
+            return 0
+
+        try:
+            return self.flights.do((symbol, interval), lambda: self._sync(symbol, interval))
+        except Exception as e:
+            if series is None or series.last_timestamp is None:
+                raise
+            logger.warning("Refreshing %s %s bars failed, serving stored bars: %s", symbol, interval, e)
+            return 0
+
+    def _sync(self, symbol, interval):
+        spec = SERIES[interval]
+        series = db.session.get(PriceSeries, (symbol, interval))
+        last = series.last_timestamp if series is not None else None
+
+        outputsize = 'compact'
+        if last is not None and spec['compact_window'] and datetime.utcnow() - last > spec['compact_window']:
+            outputsize = 'full'
+
+        payload = spec['fetch'](self.alpha_vantage, symbol, outputsize)
+        time_series = payload.get(spec['payload_key'])
+        if not time_series:
+            logger.warning("No %s data returned for %s", interval, symbol)
+            return 0
+
+        # The newest stored bar may have been partial (e.g. today's daily bar), so rewrite it too
+        bars = {}
+        for label, stats in time_series.items():
+            timestamp = datetime.strptime(label, spec['format'])
+            if last is None or timestamp >= last:
+                bars[timestamp] = stats
+
+        existing = {}
+        if last is not None:
+            existing = {
+                bar.timestamp: bar for bar in PriceBar.query.filter(
+                    PriceBar.symbol == symbol,
+                    PriceBar.interval == interval,
+                    PriceBar.timestamp >= last
+                )
+            }
+
+        for timestamp, stats in bars.items():
+            bar = existing.get(timestamp)
+            if bar is None:
+                bar = PriceBar(symbol=symbol, interval=interval, timestamp=timestamp)
+                db.session.add(bar)
+            bar.open = _to_float(stats.get('1. open'))
+            bar.high = _to_float(stats.get('2. high'))
+            bar.low = _to_float(stats.get('3. low'))
+            bar.close = float(stats['4. close'])
+            volume = stats.get('5. volume')
+            bar.volume = int(volume) if volume else None
+
+        if series is None:
+            series = PriceSeries(symbol=symbol, interval=interval)
+            db.session.add(series)
+        if bars:
+            series.last_timestamp = max(bars) if last is None else max(last, max(bars))
+        series.refreshed_at = datetime.utcnow()
+
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another worker stored the same bars first; its copy is as good as ours
+            db.session.rollback()
+            return 0
+        logger.info("Stored %d %s bars for %s (outputsize=%s)", len(bars), interval, symbol, outputsize)
+        if bars:
+            with self._frames_lock:
+                listeners = list(self._listeners)
+            for listener in listeners:
+                listener(symbol, interval)
+        return len(bars)
+
+
+def _to_float(value):
+    return float(value) if value is not None else None
@@ -0,0 +1,102 @@
+import queue
+import threading
+
+
+class Subscription:
+    """One connected client: the topics it follows and its bounded event queue."""
+
+    def __init__(self, topics, maxsize):
+        self.topics = frozenset(topics)
+        self.events = queue.Queue(maxsize=maxsize)
+
+    def get(self, timeout):
+        """
+        Wait for the next event.
+
+        Args:
+            timeout (float): Seconds to wait.
+
+        Returns:
+            tuple: `(event, data)`, or None if nothing arrived in time.
+        """
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def put(self, event, data):
+        # Slow clients lose their oldest events rather than blocking the publisher
+        while True:
+            try:
+                self.events.put_nowait((event, data))
+                return
+            except queue.Full:
+                try:
+                    self.events.get_nowait()
+                except queue.Empty:
+                    pass
+
+
+class Broadcaster:
+    """
+    Shared publisher fanning events out to subscribed clients.
+
+    Subscriptions are indexed by topic (e.g. `quote:AAPL`, `portfolio:1`), so
+    publishing costs O(subscribers of that topic). Clients never poll upstream;
+    one price refresh reaches every viewer through their queues.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._topics = {}
+
+    def subscribe(self, topics):
+        subscription = Subscription(topics, self.queue_size)
+        with self._lock:
+            for topic in subscription.topics:
+                self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._topics.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._topics[topic]
+
+    def publish(self, topic, event, data):
+        """
+        Send an event to every subscriber of a topic.
+
+        Args:
+            topic (str): The topic, e.g. `quote:AAPL`.
+            event (str): The SSE event name.
+            data (dict): The JSON-serializable payload.
+        """
+        with self._lock:
+            subscribers = list(self._topics.get(topic, ()))
+        for subscription in subscribers:
+            subscription.put(event, data)
+
+    def topics(self, prefix=''):
+        """
+        Get the topics that currently have subscribers.
+
+        Args:
+            prefix (str): Only return topics starting with this, with the prefix removed.
+
+        Returns:
+            list: The topic names.
+        """
+        with self._lock:
+            return [topic[len(prefix):] for topic in self._topics if topic.startswith(prefix)]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'topics': len(self._topics),
+                'subscriptions': len({s for subscribers in self._topics.values() for s in subscribers})
+            }
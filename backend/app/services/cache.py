@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Bounded, thread-safe LRU cache whose entries expire after a per-entry TTL.
+
+    Keys are tuples whose first element is a namespace (e.g. the Alpha Vantage
+    `function`); hit/miss counters are kept per namespace so TTLs can be tuned
+    independently. Expired entries may still be served as *stale* for
+    `stale_ttl` seconds so callers can implement stale-while-revalidate.
+    """
+
+    FRESH = 'fresh'
+    STALE = 'stale'
+
+    def __init__(self, maxsize=1024, clock=time.monotonic):
+        self.maxsize = maxsize
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Look up a cached value.
+
+        Args:
+            key (tuple): The cache key.
+
+        Returns:
+            tuple: `(value, state)` where state is `TTLCache.FRESH`, `TTLCache.STALE`
+            or None when nothing usable is cached.
+        """
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._count(key, 'misses')
+                return None, None
+
+            value, expires_at, stale_until = entry
+            if now < expires_at:
+                self._entries.move_to_end(key)
+                self._count(key, 'hits')
+                return value, self.FRESH
+            if now < stale_until:
+                self._entries.move_to_end(key)
+                self._count(key, 'stale_hits')
+                return value, self.STALE
+
+            del self._entries[key]
+            self._count(key, 'misses')
+            return None, None
+
+    def set(self, key, value, ttl, stale_ttl=0):
+        """
+        Store a value, evicting the least recently used entry when full.
+
+        Args:
+            key (tuple): The cache key.
+            value: The value to store.
+            ttl (float): Seconds the value is considered fresh.
+            stale_ttl (float): Extra seconds the value may be served stale.
+        """
+        now = self._clock()
+        with self._lock:
+            self._entries[key] = (value, now + ttl, now + ttl + stale_ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def ttl(self, key):
+        """
+        Get how much longer an entry stays fresh.
+
+        Args:
+            key (tuple): The cache key.
+
+        Returns:
+            float: Seconds until the entry goes stale; 0 if it is stale or missing.
+        """
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+        return max(0.0, entry[1] - now) if entry is not None else 0.0
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        Get hit/miss counters per namespace.
+
+        Returns:
+            dict: Cache size, evictions and per-namespace hits, stale hits, misses and hit ratio.
+        """
+        with self._lock:
+            namespaces = {}
+            for namespace, counters in self._stats.items():
+                lookups = counters['hits'] + counters['stale_hits'] + counters['misses']
+                namespaces[namespace] = dict(
+                    counters,
+                    hit_ratio=(counters['hits'] + counters['stale_hits']) / lookups if lookups else 0.0
+                )
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'evictions': self.evictions,
+                'namespaces': namespaces
+            }
+
+    def _count(self, key, counter):
+        namespace = key[0] if isinstance(key, tuple) and key else key
+        counters = self._stats.setdefault(namespace, {'hits': 0, 'stale_hits': 0, 'misses': 0})
+        counters[counter] += 1
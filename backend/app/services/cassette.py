@@ -0,0 +1,96 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+
+# Query parameters that do not change the upstream answer
+IGNORED_PARAMS = ('apikey',)
+
+
+class CassetteMiss(LookupError):
+    """Raised in replay mode when a request was never recorded."""
+
+
+class Cassette:
+    """
+    On-disk store of upstream requests and responses, for offline replay.
+
+    Each entry is keyed by the normalized query parameters (sorted, symbol
+    upper-cased, API key removed) and holds the HTTP status, the zlib-compressed
+    response body and how long the call took. Recording the same request again
+    replaces the earlier entry. The store is a single SQLite file shared by all
+    threads.
+
+    Args:
+        path (str): The SQLite file; its directory is created if missing.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS interaction ('
+            ' key TEXT PRIMARY KEY, function TEXT, status INTEGER, body BLOB, latency REAL, recorded_at REAL)'
+        )
+        self._db.commit()
+
+    @staticmethod
+    def key(params):
+        normalized = {k: v for k, v in params.items() if k not in IGNORED_PARAMS}
+        if normalized.get('symbol'):
+            normalized['symbol'] = normalized['symbol'].upper()
+        return json.dumps(normalized, sort_keys=True, separators=(',', ':'))
+
+    def record(self, params, status, body, latency):
+        """
+        Store one upstream interaction.
+
+        Args:
+            params (dict): The query parameters (an API key is dropped).
+            status (int): The HTTP status code.
+            body (bytes): The raw response body.
+            latency (float): Seconds the call took.
+        """
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO interaction VALUES (?, ?, ?, ?, ?, ?)',
+                (self.key(params), params.get('function'), status, zlib.compress(body), latency, time.time())
+            )
+            self._db.commit()
+
+    def play(self, params):
+        """
+        Look up a recorded interaction.
+
+        Args:
+            params (dict): The query parameters.
+
+        Returns:
+            tuple: `(status, body, latency)` with the decompressed body.
+
+        Raises:
+            CassetteMiss: If the request was not recorded.
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT status, body, latency FROM interaction WHERE key = ?', (self.key(params),)
+            ).fetchone()
+        if row is None:
+            raise CassetteMiss(f"No recorded response for {self.key(params)}")
+        status, body, latency = row
+        return status, zlib.decompress(body), latency
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM interaction').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
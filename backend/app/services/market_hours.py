@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+
+# Alpha Vantage MARKET_STATUS reports local open/close times per region without a timezone
+REGION_TIMEZONES = {
+    'United States': 'America/New_York',
+    'Canada': 'America/Toronto',
+    'United Kingdom': 'Europe/London',
+    'Germany': 'Europe/Berlin',
+    'France': 'Europe/Paris',
+    'Spain': 'Europe/Madrid',
+    'Portugal': 'Europe/Lisbon',
+    'Japan': 'Asia/Tokyo',
+    'India': 'Asia/Kolkata',
+    'Mainland China': 'Asia/Shanghai',
+    'Hong Kong': 'Asia/Hong_Kong',
+    'Brazil': 'America/Sao_Paulo',
+    'Mexico': 'America/Mexico_City',
+    'South Africa': 'Africa/Johannesburg'
+}
+
+
+def seconds_until_next_transition(payload, now=None):
+    """
+    Get the time until the next market in a MARKET_STATUS payload opens or closes.
+
+    Markets in regions without a known timezone (e.g. 'Global' forex and crypto,
+    which trade around the clock) are ignored.
+
+    Args:
+        payload (dict): The MARKET_STATUS response.
+        now (datetime): The current time (timezone aware). Defaults to now.
+
+    Returns:
+        float: Seconds until the nearest open/close, or None if no market has usable times.
+    """
+    now = now or datetime.now(timezone.utc)
+    nearest = None
+    for market in payload.get('markets', []):
+        tz_name = REGION_TIMEZONES.get(market.get('region'))
+        if tz_name is None:
+            continue
+        local_now = now.astimezone(ZoneInfo(tz_name))
+        for field in ('local_open', 'local_close'):
+            try:
+                hour, minute = (int(part) for part in market[field].split(':'))
+            except (KeyError, ValueError, AttributeError):
+                continue
+            transition = local_now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if transition <= local_now:
+                transition += timedelta(days=1)
+            seconds = (transition - local_now).total_seconds()
+            if nearest is None or seconds < nearest:
+                nearest = seconds
+    return nearest
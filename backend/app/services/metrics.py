@@ -0,0 +1,211 @@
+import bisect
+import threading
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+
+
+class Counter(_Metric):
+    """Monotonic count per label set."""
+
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f'{self.name}{_labels(self.labelnames, labels)} {_number(v)}' for labels, v in values]
+
+
+class Gauge(_Metric):
+    """Value per label set that can go up and down."""
+
+    type = 'gauge'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f'{self.name}{_labels(self.labelnames, labels)} {_number(v)}' for labels, v in values]
+
+
+class Histogram(_Metric):
+    """
+    Bucketed distribution per label set.
+
+    An observation is one bisect and a few additions under a lock; cumulative
+    bucket counts are only computed when the registry is rendered.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, *labels):
+        state = self._values.get(labels)
+        return state[2] if state else 0
+
+    def samples(self):
+        with self._lock:
+            values = sorted((labels, (list(s[0]), s[1], s[2])) for labels, s in self._values.items())
+        lines = []
+        for labels, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, [("le", _number(bound))])} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+class Registry:
+    """
+    Process-wide collection of metrics rendered in the Prometheus text format.
+
+    Besides metrics updated as things happen, collectors can be registered:
+    callables returning `(name, type, documentation, [(labels_dict, value), ...])`
+    tuples, read at scrape time (e.g. to export counters a component already keeps).
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            # Modules may be re-imported (e.g. in tests); keep the first instance
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def unregister_collector(self, collector):
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text exposition format (version 0.0.4).
+
+        Returns:
+            str: The exposition text.
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+            collectors = list(self._collectors)
+
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        for collector in collectors:
+            for name, kind, documentation, samples in collector():
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_labels(labels.keys(), labels.values())} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def cache_collector(prefix, cache):
+    """
+    Export a TTLCache's per-namespace counters and hit ratio.
+
+    Args:
+        prefix (str): Metric name prefix, e.g. `upstream_cache`.
+        cache (TTLCache): The cache to read at scrape time.
+
+    Returns:
+        callable: A collector for `Registry.register_collector`.
+    """
+    def collect():
+        stats = cache.stats()
+        namespaces = sorted(stats['namespaces'].items())
+        samples = lambda field: [({'namespace': ns}, counts[field]) for ns, counts in namespaces]
+        return [
+            (f'{prefix}_hits_total', 'counter', 'Fresh cache hits.', samples('hits')),
+            (f'{prefix}_stale_hits_total', 'counter', 'Stale entries served while refreshing.', samples('stale_hits')),
+            (f'{prefix}_misses_total', 'counter', 'Cache misses.', samples('misses')),
+            (f'{prefix}_hit_ratio', 'gauge', 'Share of lookups served from the cache.', samples('hit_ratio')),
+            (f'{prefix}_entries', 'gauge', 'Entries currently cached.', [({}, stats['size'])]),
+            (f'{prefix}_evictions_total', 'counter', 'Entries evicted to stay within maxsize.', [({}, stats['evictions'])]),
+        ]
+    return collect
+
+
+# Shared by every module that records metrics; rendered by the /metrics route
+registry = Registry()
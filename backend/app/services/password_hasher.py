@@ -0,0 +1,122 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+
+logger = logging.getLogger(__name__)
+
+
+class HasherBusy(Exception):
+    """Raised when every hashing slot stayed taken for the whole queue timeout."""
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _verify(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+
+def _to_bytes(value):
+    return value.encode('utf-8') if isinstance(value, str) else value
+
+
+class PasswordHasher:
+    """
+    bcrypt hashing off the request threads.
+
+    Hashes run in a small pool of worker processes, so a burst of logins costs
+    those processes' CPU instead of the GIL shared with quote and trade
+    requests. At most `max_concurrency` hashes are queued or running at once;
+    further callers wait up to `queue_timeout` seconds for a slot and then get
+    `HasherBusy`, which keeps login latency bounded under load. With
+    `pool_size=0` hashing runs inline (still capped), e.g. for tests.
+
+    The pool uses the `spawn` start method (forking a threaded server is
+    unsafe) and is only started on first use, so each server worker process
+    gets its own.
+    """
+
+    def __init__(self, rounds=12, pool_size=2, max_concurrency=8, queue_timeout=5):
+        self.rounds = rounds
+        self.pool_size = pool_size
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def hash(self, password):
+        """
+        Hash a password with the configured work factor.
+
+        Args:
+            password (str): The plain text password.
+
+        Returns:
+            str: The bcrypt hash.
+
+        Raises:
+            HasherBusy: If no hashing slot freed up in time.
+        """
+        return self._run(_hash, _to_bytes(password), self.rounds)
+
+    def verify(self, password, hashed):
+        """
+        Check a password against a stored bcrypt hash.
+
+        Args:
+            password (str): The plain text password.
+            hashed (str | bytes): The stored hash.
+
+        Returns:
+            bool: True if the password matches.
+
+        Raises:
+            HasherBusy: If no hashing slot freed up in time.
+        """
+        return self._run(_verify, _to_bytes(password), _to_bytes(hashed))
+
+    def needs_rehash(self, hashed):
+        """
+        Tell whether a stored hash was made with a different work factor.
+
+        Args:
+            hashed (str | bytes): The stored hash, e.g. `$2b$12$...`.
+
+        Returns:
+            bool: True if the hash should be replaced on the next successful login.
+        """
+        try:
+            return int(_to_bytes(hashed).split(b'$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            logger.warning("Password hashing saturated; rejecting after %ss", self.queue_timeout)
+            raise HasherBusy()
+        try:
+            if not self.pool_size:
+                return fn(*args)
+            return self._pool().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.pool_size,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
@@ -0,0 +1,84 @@
+import logging
+import threading
+
+from app.models import db, Portfolio
+from .rate_limiter import RateLimitExceeded
+
+
+logger = logging.getLogger(__name__)
+
+
+class PriceRefresher:
+    """
+    Background worker keeping the quotes of every held symbol warm.
+
+    Each cycle reads the distinct `Portfolio.symbol` set, plus any symbols returned
+    by `extra_symbols` (e.g. those live-streamed to clients), and refreshes up to
+    `batch_size` symbols, stalest first, skipping any whose price is newer than
+    the cycle interval. Refreshes run at background priority, so they only use
+    upstream quota that trades and lookups are not waiting for. A cycle stops
+    early once the quota is exhausted, or once only `daily_reserve` calls are
+    left in the daily quota, which are kept for trades and lookups.
+    """
+
+    def __init__(self, app, alpha_vantage, interval, batch_size, daily_reserve=0, extra_symbols=None):
+        self.app = app
+        self.alpha_vantage = alpha_vantage
+        self.extra_symbols = extra_symbols
+        self.interval = interval
+        self.batch_size = batch_size
+        self.daily_reserve = daily_reserve
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='price-refresher', daemon=True)
+        self._thread.start()
+        logger.info("Price refresher started (every %ss, up to %s symbols)", self.interval, self.batch_size)
+
+    def stop(self):
+        self._stop.set()
+
+    def refresh_once(self):
+        """
+        Run one refresh cycle.
+
+        Returns:
+            int: The number of symbols refreshed.
+        """
+        with self.app.app_context():
+            symbols = [symbol for (symbol,) in db.session.query(Portfolio.symbol).distinct()]
+            db.session.remove()
+        if self.extra_symbols is not None:
+            symbols = list(dict.fromkeys(symbols + list(self.extra_symbols())))
+
+        prices = self.alpha_vantage.prices
+        due = [s for s in symbols if prices.age(s) is None or prices.age(s) >= self.interval]
+        due.sort(key=lambda s: float('inf') if prices.age(s) is None else prices.age(s), reverse=True)
+
+        refreshed = 0
+        for symbol in due[:self.batch_size]:
+            left = self.alpha_vantage.scheduler.remaining_today()
+            if left is not None and left <= self.daily_reserve:
+                logger.info("Daily upstream quota down to its reserve of %d, refreshed %d of %d due symbols",
+                            self.daily_reserve, refreshed, len(due))
+                break
+            try:
+                self.alpha_vantage.refresh_stock_quote(symbol)
+                refreshed += 1
+            except RateLimitExceeded:
+                logger.info("Upstream quota exhausted, refreshed %d of %d due symbols", refreshed, len(due))
+                break
+            except Exception as e:
+                logger.warning("Refreshing quote for %s failed: %s", symbol, e)
+        return refreshed
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh_once()
+            except Exception as e:
+                logger.error("Price refresh cycle failed: %s", e)
+            self._stop.wait(self.interval)
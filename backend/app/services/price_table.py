@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import namedtuple
+
+
+PriceEntry = namedtuple('PriceEntry', ['price', 'updated_at'])
+
+
+class PriceTable:
+    """
+    In-memory table of the latest known price per symbol.
+
+    Every successful upstream quote is written here, whether it was fetched by a
+    request or by the background refresher. Listeners registered with `subscribe`
+    are called with `(symbol, price, updated_at)` whenever a price is written.
+    """
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._prices = {}
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def update(self, symbol, price, updated_at=None):
+        """
+        Record the latest price of a symbol and notify listeners.
+
+        Args:
+            symbol (str): The stock symbol.
+            price (float): The latest price.
+            updated_at (float): When the price was fetched (epoch seconds); defaults to now.
+        """
+        symbol = symbol.upper()
+        entry = PriceEntry(price, self._clock() if updated_at is None else updated_at)
+        with self._lock:
+            self._prices[symbol] = entry
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(symbol, entry.price, entry.updated_at)
+
+    def get(self, symbol, max_age=None):
+        """
+        Get the latest price of a symbol.
+
+        Args:
+            symbol (str): The stock symbol.
+            max_age (float): Ignore prices older than this many seconds.
+
+        Returns:
+            tuple: `(price, age_seconds)`, or None if no fresh enough price is known.
+        """
+        entry = self._prices.get(symbol.upper())
+        if entry is None:
+            return None
+        age = self._clock() - entry.updated_at
+        if max_age is not None and age > max_age:
+            return None
+        return entry.price, age
+
+    def updated_at(self, symbol):
+        entry = self._prices.get(symbol.upper())
+        return None if entry is None else entry.updated_at
+
+    def age(self, symbol):
+        entry = self._prices.get(symbol.upper())
+        return None if entry is None else self._clock() - entry.updated_at
+
+    def subscribe(self, listener):
+        with self._lock:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        with self._lock:
+            self._listeners.remove(listener)
+
+    def __len__(self):
+        return len(self._prices)
@@ -0,0 +1,119 @@
+import time
+
+from sqlalchemy import delete, func, insert, select, text
+
+from app.models import UpstreamCall
+
+
+# Postgres advisory lock id held while a call is counted and recorded
+QUOTA_LOCK_KEY = 411_0002
+
+MINUTE = 60
+DAY = 86400
+
+calls = UpstreamCall.__table__
+
+
+class QuotaLedger:
+    """
+    Upstream calls recorded in the database, so every process sharing it draws on one quota.
+
+    Each call is a row in `upstream_call`. A call is recorded only while fewer
+    than the quota's calls fall inside the last 60 s and 24 h; recording and
+    counting happen in one transaction, serialized by a Postgres advisory lock
+    or, on SQLite, by the write lock its first statement (pruning rows older
+    than a day) takes. Times are wall-clock seconds, so processes agree on them.
+    A per-minute drain adds rows that count towards the minute window only.
+
+    Args:
+        engine (Engine): Engine of the app's database.
+        per_minute (int): Calls allowed in any 60 s; 0 for no limit.
+        per_day (int): Calls allowed in any 24 h; 0 for no limit.
+    """
+
+    def __init__(self, engine, per_minute, per_day, clock=time.time):
+        self.engine = engine
+        self.windows = [(per_minute, MINUTE), (per_day, DAY)]
+        self._clock = clock
+
+    def take(self):
+        """
+        Record one call if every window has room.
+
+        Returns:
+            float: 0 if the call was recorded, otherwise seconds until a window may have room.
+        """
+        now = self._clock()
+        with self.engine.connect() as connection:
+            transaction = connection.begin()
+            try:
+                self._lock(connection, now)
+                connection.execute(insert(calls).values(called_at=now))
+                delay = 0
+                for capacity, period in self.windows:
+                    if not capacity:
+                        continue
+                    # With this call included, the window is over quota if a row sits past the capacity
+                    blocking = connection.execute(
+                        select(calls.c.called_at)
+                        .where(*self._within(now, period))
+                        .order_by(calls.c.called_at.desc())
+                        .offset(capacity)
+                        .limit(1)
+                    ).scalar()
+                    if blocking is not None:
+                        delay = max(delay, blocking + period - now)
+                if delay:
+                    transaction.rollback()
+                    return delay
+                transaction.commit()
+                return 0
+            except Exception:
+                transaction.rollback()
+                raise
+
+    def drain(self, daily=False):
+        """
+        Fill the minute window (and the day window if `daily`), e.g. after the upstream reported throttling.
+        """
+        now = self._clock()
+        with self.engine.connect() as connection:
+            with connection.begin():
+                self._lock(connection, now)
+                for capacity, period in self.windows if daily else self.windows[:1]:
+                    missing = capacity - self._count(connection, now, period)
+                    if capacity and missing > 0:
+                        connection.execute(insert(calls), [{'called_at': now, 'daily': daily}] * missing)
+
+    def remaining(self, daily=False):
+        """
+        Get how many calls the minute (or day) window still allows.
+
+        Returns:
+            int: Calls left, or None if that window has no limit.
+        """
+        capacity, period = self.windows[1 if daily else 0]
+        if not capacity:
+            return None
+        with self.engine.connect() as connection:
+            return max(0, capacity - self._count(connection, self._clock(), period))
+
+    @classmethod
+    def _count(cls, connection, now, period):
+        return connection.execute(
+            select(func.count()).select_from(calls).where(*cls._within(now, period))
+        ).scalar()
+
+    @staticmethod
+    def _within(now, period):
+        conditions = [calls.c.called_at > now - period]
+        if period == DAY:
+            conditions.append(calls.c.daily.is_(True))
+        return conditions
+
+    @staticmethod
+    def _lock(connection, now):
+        if connection.dialect.name == 'postgresql':
+            connection.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': QUOTA_LOCK_KEY})
+        # Writing first makes SQLite take its write lock before anything is counted
+        connection.execute(delete(calls).where(calls.c.called_at <= now - DAY))
@@ -0,0 +1,199 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+
+# Lower value = served first when callers queue for upstream quota
+PRIORITY_TRADE = 0
+PRIORITY_LOOKUP = 1
+PRIORITY_HISTORICAL = 2
+PRIORITY_BACKGROUND = 3
+
+
+class RateLimitExceeded(Exception):
+    """Raised when an upstream call cannot be made within the configured quota."""
+
+
+class SlidingWindow:
+    """
+    Allows at most `capacity` calls in any `period` seconds, from the times of past calls.
+
+    A capacity of 0 disables the window (always allows).
+    """
+
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.period = period
+        self.calls = deque()
+        self.blocked_until = 0.0
+
+    def expire(self, now):
+        while self.calls and self.calls[0] <= now - self.period:
+            self.calls.popleft()
+
+    def remaining(self):
+        return max(0, self.capacity - len(self.calls)) if self.capacity else None
+
+    def time_until_available(self, now):
+        if not self.capacity:
+            return 0
+        delay = self.blocked_until - now
+        if len(self.calls) >= self.capacity:
+            delay = max(delay, self.calls[len(self.calls) - self.capacity] + self.period - now)
+        return max(0, delay)
+
+    def take(self, now):
+        if self.capacity:
+            self.calls.append(now)
+
+    def drain(self, now):
+        if self.capacity:
+            self.blocked_until = now + self.period
+
+
+class QuotaScheduler:
+    """
+    Queue upstream calls so they never overrun the per-minute and per-day quota.
+
+    Each quota is a sliding window over the times of the calls already made,
+    so no 60 s (or 24 h) span ever holds more calls than the quota allows.
+    Callers block in `acquire` until every window has room. The windows are
+    kept in memory unless a `ledger` (a `QuotaLedger`) is set, which counts
+    the calls of every process sharing the database instead.
+
+    Waiting callers are served strictly by priority, then arrival order, so
+    trade-path quotes jump ahead of lookups and historical charts.
+    """
+
+    def __init__(self, per_minute, per_day, max_wait, clock=time.monotonic, ledger=None):
+        self.windows = [SlidingWindow(per_minute, 60), SlidingWindow(per_day, 86400)]
+        self.ledger = ledger
+        self.max_wait = max_wait
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self.acquired = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.last_wait = 0.0
+        self.longest_wait = 0.0
+
+    def acquire(self, priority=PRIORITY_LOOKUP, timeout=None):
+        """
+        Wait for permission to make one upstream call.
+
+        Args:
+            priority (int): One of the PRIORITY_* constants.
+            timeout (float): Maximum seconds to queue. Defaults to `max_wait`.
+
+        Returns:
+            float: Seconds spent waiting.
+
+        Raises:
+            RateLimitExceeded: If the quota does not free up before the timeout.
+        """
+        timeout = self.max_wait if timeout is None else timeout
+        with self._cond:
+            start = self._clock()
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    now = self._clock()
+                    remaining = start + timeout - now
+                    delay = None
+                    if self._waiters[0] == ticket:
+                        delay = self._take(now)
+                        if delay == 0:
+                            waited = now - start
+                            self._record(waited)
+                            return waited
+                        if delay > remaining:
+                            # The quota will not free up in time; fail now rather than queue uselessly
+                            remaining = 0
+                    if remaining <= 0:
+                        self.rejected += 1
+                        raise RateLimitExceeded('Upstream API quota exhausted')
+                    self._cond.wait(remaining if delay is None else min(delay, remaining))
+            finally:
+                if ticket in self._waiters:
+                    self._waiters.remove(ticket)
+                    heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+    def drain(self, daily=False):
+        """
+        Stop calls for a full window after the upstream reported throttling.
+
+        Args:
+            daily (bool): The daily quota was hit, so block the day window too;
+                otherwise only the minute window is blocked.
+        """
+        if self.ledger is not None:
+            self.ledger.drain(daily)
+            return
+        with self._cond:
+            now = self._clock()
+            for window in self.windows if daily else self.windows[:1]:
+                window.drain(now)
+
+    def remaining_today(self):
+        """
+        Get how many calls the daily quota still allows.
+
+        Returns:
+            int: Calls left in the current 24 h window, or None if there is no daily quota.
+        """
+        if self.ledger is not None:
+            return self.ledger.remaining(daily=True)
+        with self._cond:
+            day = self.windows[1]
+            day.expire(self._clock())
+            return day.remaining()
+
+    def stats(self):
+        """
+        Get queue depth and wait-time counters.
+
+        Returns:
+            dict: Current queue depth, calls left in each window and wait statistics.
+        """
+        with self._cond:
+            now = self._clock()
+            for window in self.windows:
+                window.expire(now)
+            minute, day = self.windows
+            if self.ledger is not None:
+                remaining = self.ledger.remaining(), self.ledger.remaining(daily=True)
+            else:
+                remaining = minute.remaining(), day.remaining()
+            return {
+                'queue_depth': len(self._waiters),
+                'remaining_minute': remaining[0],
+                'remaining_day': remaining[1],
+                'acquired': self.acquired,
+                'rejected': self.rejected,
+                'last_wait': self.last_wait,
+                'longest_wait': self.longest_wait,
+                'average_wait': self.total_wait / self.acquired if self.acquired else 0.0
+            }
+
+    def _take(self, now):
+        if self.ledger is not None:
+            return self.ledger.take()
+        for window in self.windows:
+            window.expire(now)
+        delay = max(window.time_until_available(now) for window in self.windows)
+        if delay == 0:
+            for window in self.windows:
+                window.take(now)
+        return delay
+
+    def _record(self, waited):
+        self.acquired += 1
+        self.total_wait += waited
+        self.last_wait = waited
+        self.longest_wait = max(self.longest_wait, waited)
@@ -0,0 +1,64 @@
+import numpy as np
+
+
+class SeriesFrame:
+    """
+    Immutable columnar view of one price series, sorted oldest first.
+
+    Timestamps are held as `datetime64[s]` and closes as `float64`, so range
+    selection is a binary search and slicing is zero-copy regardless of how
+    long the series is.
+    """
+
+    __slots__ = ('timestamps', 'closes', 'label_unit', 'version')
+
+    def __init__(self, timestamps, closes, label_unit='D', version=None):
+        self.timestamps = timestamps
+        self.closes = closes
+        self.label_unit = label_unit
+        self.version = version
+
+    @classmethod
+    def from_rows(cls, rows, label_unit='D', version=None):
+        """
+        Build a frame from `(timestamp, close)` rows already sorted oldest first.
+
+        Args:
+            rows (list): `(datetime, float)` tuples, e.g. from a database query.
+            label_unit (str): 'D' to label bars by date, 's' to include the time of day.
+            version: Opaque marker of the stored data the frame was built from.
+
+        Returns:
+            SeriesFrame: The columnar frame.
+        """
+        timestamps = np.array([row[0] for row in rows], dtype='datetime64[s]')
+        closes = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+        return cls(timestamps, closes, label_unit, version)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def since(self, cutoff):
+        """
+        Select the bars at or after a cutoff.
+
+        Args:
+            cutoff (datetime): The earliest timestamp to keep.
+
+        Returns:
+            SeriesFrame: A view of the selected bars.
+        """
+        start = np.searchsorted(self.timestamps, np.datetime64(cutoff, 's'), side='left')
+        return SeriesFrame(self.timestamps[start:], self.closes[start:], self.label_unit, self.version)
+
+    def to_records(self):
+        """
+        Convert the frame to JSON-ready records, newest first.
+
+        Returns:
+            list: `{"date": str, "close": float}` dicts.
+        """
+        labels = np.datetime_as_string(self.timestamps[::-1], unit=self.label_unit)
+        if self.label_unit != 'D':
+            labels = np.char.replace(labels, 'T', ' ')
+        return [{"date": label, "close": close} for label, close in zip(labels.tolist(), self.closes[::-1].tolist())]
@@ -0,0 +1,71 @@
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight block until it finishes and receive the same result or exception.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """
+        Run `fn` for `key`, or wait for the call already in flight.
+
+        Args:
+            key (hashable): Identifies identical calls.
+            fn (callable): The zero-argument function to run.
+
+        Returns:
+            The value returned by `fn`.
+
+        Raises:
+            Exception: Whatever `fn` raised, re-raised in every waiter.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'executions': self.executions,
+                'coalesced': self.coalesced
+            }
@@ -0,0 +1,126 @@
+import logging
+import threading
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.models import db, Quote, User
+
+
+logger = logging.getLogger(__name__)
+
+quotes = Quote.__table__
+users = User.__table__
+
+
+class StateSync:
+    """
+    Share fetched quotes and committed trades between worker processes through the database.
+
+    Every price written to this process's price table is also written to the
+    `quote` table. Each cycle then reads the quotes other processes wrote since
+    the last one into the local price table, which ticks them into the
+    valuation book and the event stream, and compares the row version of every
+    account loaded in the valuation book with the database. Accounts another
+    process traded on are reloaded, which sends their streams a `portfolio` event.
+
+    Args:
+        app (Flask): The application, for the database engine and app context.
+        prices (PriceTable): This process's price table.
+        book (ValuationBook): This process's valuation book.
+        loader (callable): Reads an account for `ValuationBook.reload`.
+        interval (float): Seconds between cycles.
+    """
+
+    def __init__(self, app, prices, book, loader, interval):
+        self.app = app
+        self.prices = prices
+        self.book = book
+        self.loader = loader
+        self.interval = interval
+        with app.app_context():
+            self.engine = db.engine
+        self._seen = 0.0
+        self._pulling = threading.local()
+        self._stop = threading.Event()
+        self._thread = None
+        prices.subscribe(self.record)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='state-sync', daemon=True)
+        self._thread.start()
+        logger.info("State sync started (every %ss)", self.interval)
+
+    def stop(self):
+        self._stop.set()
+        self.prices.unsubscribe(self.record)
+
+    def record(self, symbol, price, updated_at):
+        """Write a price from this process's table to the shared `quote` table, unless a newer one is there."""
+        if getattr(self._pulling, 'active', False):
+            return
+        engine = self.engine
+        with engine.begin() as connection:
+            written = connection.execute(
+                update(quotes)
+                .where(quotes.c.symbol == symbol, quotes.c.updated_at < updated_at)
+                .values(price=price, updated_at=updated_at)
+            ).rowcount
+        if written:
+            return
+        try:
+            with engine.begin() as connection:
+                connection.execute(insert(quotes).values(symbol=symbol, price=price, updated_at=updated_at))
+        except IntegrityError:
+            # The row exists with a newer price, or another process inserted it first
+            pass
+
+    def sync_once(self):
+        """
+        Run one cycle.
+
+        Returns:
+            tuple: `(quotes, accounts)`, how many quotes were taken in and accounts reloaded.
+        """
+        with self.app.app_context():
+            with self.engine.connect() as connection:
+                # Re-read one interval back, as rows may commit a little after their timestamp
+                rows = connection.execute(
+                    select(quotes.c.symbol, quotes.c.price, quotes.c.updated_at)
+                    .where(quotes.c.updated_at > self._seen - self.interval)
+                ).fetchall()
+            taken = 0
+            self._pulling.active = True
+            try:
+                for symbol, price, updated_at in rows:
+                    self._seen = max(self._seen, updated_at)
+                    known = self.prices.updated_at(symbol)
+                    if known is None or known < updated_at:
+                        self.prices.update(symbol, price, updated_at)
+                        taken += 1
+            finally:
+                self._pulling.active = False
+
+            versions = self.book.versions()
+            reloaded = 0
+            if versions:
+                with self.engine.connect() as connection:
+                    current = connection.execute(
+                        select(users.c.id, users.c.version).where(users.c.id.in_(list(versions)))
+                    ).fetchall()
+                for user_id, version in current:
+                    if version != versions[user_id]:
+                        self.book.reload(user_id, self.loader)
+                        reloaded += 1
+            db.session.remove()
+            return taken, reloaded
+
+    def _run(self):
+        # The first cycle waits an interval, so `flask db upgrade` can create the tables first
+        while not self._stop.wait(self.interval):
+            try:
+                self.sync_once()
+            except Exception as e:
+                logger.error("State sync cycle failed: %s", e)
@@ -0,0 +1,156 @@
+import logging
+from collections import namedtuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import flag_modified
+from sqlalchemy.orm.exc import StaleDataError
+
+from app.models import db, Portfolio, User
+
+
+logger = logging.getLogger(__name__)
+
+# Another worker changed the same rows first (version mismatch, or both inserted the
+# same new position); the whole transaction is re-read and retried
+CONFLICTS = (StaleDataError, IntegrityError)
+
+# Outcome of a committed trade: the user's balance and the row version it committed as
+TradeResult = namedtuple('TradeResult', ['balance', 'version'])
+
+
+class TradeError(Exception):
+    """A trade rejected against the current account state, with the HTTP status to report."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def execute_trade(user_id, symbol, quantity, price, max_retries=3):
+    """
+    Atomically apply a buy or sell at an already quoted price.
+
+    The price must be fetched before calling this, so no network call happens
+    while rows are locked. The user and position are read `FOR UPDATE` (a
+    no-op on SQLite, where the write lock and busy timeout serialize writers)
+    and both carry a version column, so a concurrent trade that committed in
+    between makes the write fail instead of silently overwriting it; the
+    transaction is then rolled back and re-run against the fresh rows.
+
+    Args:
+        user_id (int): The user's ID.
+        symbol (str): The stock symbol.
+        quantity (int): Shares to buy (positive) or sell (negative).
+        price (float): Price per share to execute at.
+        max_retries (int): Re-runs allowed after a concurrent update.
+
+    Returns:
+        TradeResult: The user's balance after the trade, and the user's row
+        version, which every trade increments.
+
+    Raises:
+        TradeError: If the user is unknown, funds or shares are insufficient, or
+            the trade kept conflicting with concurrent updates.
+    """
+    return execute_orders(user_id, [(symbol, quantity)], {symbol: price}, max_retries)
+
+
+def net_quantities(orders):
+    """
+    Net a list of orders into one share delta per symbol, keeping first-seen order.
+
+    Args:
+        orders (list): `(symbol, quantity)` pairs, quantity negative for sells.
+
+    Returns:
+        dict: Symbol to net share delta; symbols that net to zero are kept.
+    """
+    deltas = {}
+    for symbol, quantity in orders:
+        deltas[symbol] = deltas.get(symbol, 0) + quantity
+    return deltas
+
+
+def execute_orders(user_id, orders, prices, max_retries=3):
+    """
+    Atomically apply a set of buys and sells in a single transaction.
+
+    Orders are netted per symbol and validated as a whole: every net sale must
+    be covered by the position held, and the balance after all proceeds and
+    costs must not go negative, so a rebalance may fund its buys with its own
+    sales. Either every order is applied or none is. Locking and retry work as
+    described for `execute_trade`.
+
+    Args:
+        user_id (int): The user's ID.
+        orders (list): `(symbol, quantity)` pairs, quantity negative for sells.
+        prices (dict): Already quoted price per share for every symbol in `orders`.
+        max_retries (int): Re-runs allowed after a concurrent update.
+
+    Returns:
+        TradeResult: The user's balance and row version after the orders.
+
+    Raises:
+        TradeError: If the user is unknown, funds or shares are insufficient, or
+            the orders kept conflicting with concurrent updates.
+    """
+    deltas = net_quantities(orders)
+    for attempt in range(max_retries + 1):
+        try:
+            result = _apply(user_id, deltas, prices)
+            db.session.commit()
+            return result
+        except TradeError:
+            db.session.rollback()
+            raise
+        except CONFLICTS as e:
+            db.session.rollback()
+            logger.info("Trade for user %s on %s conflicted (attempt %s): %s",
+                        user_id, ','.join(deltas), attempt + 1, e)
+        except Exception:
+            db.session.rollback()
+            raise
+
+    raise TradeError('Account was updated concurrently, please try again', status_code=409)
+
+
+def _apply(user_id, deltas, prices):
+    user = db.session.get(User, user_id, with_for_update=True, populate_existing=True)
+    if not user:
+        raise TradeError('User not found', status_code=404)
+
+    positions = {
+        position.symbol: position
+        for position in (Portfolio.query
+                         .filter(Portfolio.user_id == user.id, Portfolio.symbol.in_(list(deltas)))
+                         .order_by(Portfolio.symbol)
+                         .with_for_update()
+                         .populate_existing())
+    }
+
+    balance = user.balance
+    for symbol, quantity in deltas.items():
+        position = positions.get(symbol)
+        if quantity < 0 and (not position or position.quantity < -quantity):
+            raise TradeError('Insufficient shares' if len(deltas) == 1 else f'Insufficient shares of {symbol}')
+        balance -= prices[symbol] * quantity
+    if balance < 0:
+        raise TradeError('Insufficient funds')
+
+    for symbol, quantity in deltas.items():
+        position = positions.get(symbol)
+        if quantity == 0:
+            continue
+        if position:
+            position.quantity += quantity
+            if position.quantity == 0:
+                db.session.delete(position)
+        else:
+            db.session.add(Portfolio(user_id=user.id, symbol=symbol, quantity=quantity, purchase_price=prices[symbol]))
+    user.balance = balance
+    # Bump the user's version even when the balance nets out unchanged
+    flag_modified(user, 'balance')
+
+    # Flush inside the retry loop so version and unique-index conflicts surface here
+    db.session.flush()
+    return TradeResult(user.balance, user.version)
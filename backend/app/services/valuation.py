@@ -0,0 +1,301 @@
+import threading
+import time
+from collections import defaultdict
+
+
+class _Account:
+    __slots__ = ('balance', 'holdings', 'value', 'loaded_at', 'loaded_version', 'version', 'applied')
+
+    def __init__(self, balance, loaded_at, version):
+        self.balance = balance
+        self.holdings = {}
+        self.value = 0.0
+        self.loaded_at = loaded_at
+        # Version read from the database, the newest version reflected in
+        # `balance`, and the versions of trades applied on top of the load
+        self.loaded_version = version
+        self.version = version
+        self.applied = set()
+
+
+class ValuationBook:
+    """
+    Materialized per-user portfolio valuations, maintained incrementally.
+
+    Each loaded user has a holdings vector and a running portfolio value. All
+    holders of a symbol are valued at one mark price per symbol, taken from the
+    price table. A price tick for a symbol adjusts only the users in that
+    symbol's holder index by `(new - old) * quantity`, and trades adjust only
+    the trading user. Reading a value is O(1).
+
+    The book is per process. Trades made by other processes are picked up
+    when `reload` is called for the account, or at the latest when it expires
+    `max_age` seconds after loading. Expired accounts are removed when a price
+    tick or trade reaches them, and by a sweep of the whole book at most once
+    per `max_age`, so users who are not viewed again do not stay in memory.
+    Loads and trades carry the user's row version, so a trade committed before
+    a load read the database is not applied on top of it a second time. Listeners
+    registered with `subscribe` are called with `(user_id, snapshot)` whenever a
+    loaded user's valuation changes.
+    """
+
+    def __init__(self, prices, max_age=30, clock=time.monotonic):
+        self.prices = prices
+        self.max_age = max_age
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._accounts = {}
+        self._holders = defaultdict(set)
+        self._marks = {}
+        self._listeners = []
+        self._swept_at = clock()
+        prices.subscribe(self._on_price)
+
+    def subscribe(self, listener):
+        with self._lock:
+            self._listeners.append(listener)
+
+    def load(self, user_id, balance, positions, version=None):
+        """
+        (Re)build a user's account from the database state.
+
+        A load is ignored if the account already holds trades newer than
+        `version`, as it was read before they committed.
+
+        Args:
+            user_id (int): The user's ID.
+            balance (float): The user's cash balance.
+            positions (iterable): `(symbol, quantity)` pairs.
+            version (int): The user's row version the state was read at.
+        """
+        with self._lock:
+            changed = self._load(user_id, balance, positions, version)
+        self._notify(changed - {user_id})
+
+    def ensure_loaded(self, user_id, loader):
+        """
+        Get a user's snapshot, loading the account first if it is missing or expired.
+
+        The loader runs outside the lock; the snapshot is taken under the same
+        lock as the load, so the account cannot expire in between.
+
+        Args:
+            user_id (int): The user's ID.
+            loader (callable): Called with `user_id`; returns `(balance, positions,
+                version)` as taken by `load`, or None if the user does not exist.
+
+        Returns:
+            dict: The `snapshot`, or None if the user does not exist.
+        """
+        with self._lock:
+            self._sweep()
+            account = self._fresh(user_id)
+            if account is not None:
+                return self._snapshot(account)
+
+        state = loader(user_id)
+        if state is None:
+            return None
+        with self._lock:
+            changed = self._load(user_id, *state)
+            snapshot = self._snapshot(self._accounts[user_id])
+        self._notify(changed - {user_id})
+        return snapshot
+
+    def reload(self, user_id, loader):
+        """
+        Re-read an account that changed in the database, e.g. through a trade
+        made by another process, and notify listeners of it.
+
+        Args:
+            user_id (int): The user's ID.
+            loader (callable): As for `ensure_loaded`.
+        """
+        state = loader(user_id)
+        with self._lock:
+            if state is None:
+                self._drop(user_id)
+                return
+            changed = self._load(user_id, *state)
+        self._notify(changed | {user_id})
+
+    def versions(self):
+        """
+        Get the row version every loaded account fully reflects.
+
+        An account that applied a trade while missing an earlier one (made by
+        another process) reports the version it was loaded at.
+
+        Returns:
+            dict: Version keyed by user ID, for accounts loaded with one.
+        """
+        with self._lock:
+            self._sweep(force=True)
+            versions = {}
+            for user_id, account in self._accounts.items():
+                if account.version is None:
+                    continue
+                complete = len(account.applied) == account.version - account.loaded_version
+                versions[user_id] = account.version if complete else account.loaded_version
+            return versions
+
+    def apply_trade(self, user_id, symbol, quantity_delta, balance, version=None):
+        """
+        Apply a committed trade to a loaded account; unloaded accounts are ignored.
+
+        Args:
+            user_id (int): The user's ID.
+            symbol (str): The traded stock symbol.
+            quantity_delta (int): Shares bought (positive) or sold (negative).
+            balance (float): The user's balance after the trade.
+            version (int): The user's row version the trade committed as.
+        """
+        self.apply_trades(user_id, {symbol: quantity_delta}, balance, version)
+
+    def apply_trades(self, user_id, quantity_deltas, balance, version=None):
+        """
+        Apply several committed trades at once, notifying listeners a single time.
+
+        Trades the loaded state already contains (a version at or below the one
+        it was read at) and trades applied before are skipped. Trades may
+        arrive out of order; the balance is taken from the newest.
+
+        Args:
+            user_id (int): The user's ID.
+            quantity_deltas (dict): Shares bought (positive) or sold (negative) per symbol.
+            balance (float): The user's balance after the trades.
+            version (int): The user's row version the trades committed as.
+        """
+        with self._lock:
+            account = self._fresh(user_id)
+            if account is None:
+                return
+            if version is None or account.version is None:
+                account.balance = balance
+            elif version <= account.loaded_version or version in account.applied:
+                return
+            else:
+                account.applied.add(version)
+                if version > account.version:
+                    account.balance = balance
+                    account.version = version
+            changed = set()
+            for symbol, quantity_delta in quantity_deltas.items():
+                if quantity_delta:
+                    changed.update(self._adjust(user_id, account, symbol.upper(), quantity_delta))
+        self._notify(changed | {user_id})
+
+    def snapshot(self, user_id):
+        """
+        Get a loaded user's balance and portfolio value.
+
+        Returns:
+            dict: `balance`, `portfolio_value`, `symbols` (held symbols) and
+            `unpriced` (held symbols without a price yet), or None if the
+            account is not loaded or has expired.
+        """
+        with self._lock:
+            account = self._fresh(user_id)
+            return self._snapshot(account) if account is not None else None
+
+    def values(self):
+        """
+        Get every loaded user's portfolio value at once; expired accounts are removed first.
+
+        Returns:
+            dict: Portfolio value keyed by user ID.
+        """
+        with self._lock:
+            self._sweep(force=True)
+            return {user_id: account.value for user_id, account in self._accounts.items()}
+
+    def _fresh(self, user_id):
+        account = self._accounts.get(user_id)
+        if account is not None and self._clock() - account.loaded_at > self.max_age:
+            self._drop(user_id)
+            return None
+        return account
+
+    def _sweep(self, force=False):
+        now = self._clock()
+        if not force and now - self._swept_at < self.max_age:
+            return
+        self._swept_at = now
+        for user_id in [u for u, account in self._accounts.items() if now - account.loaded_at > self.max_age]:
+            self._drop(user_id)
+
+    def _load(self, user_id, balance, positions, version):
+        account = self._accounts.get(user_id)
+        if account is not None and version is not None and account.version is not None and account.version > version:
+            return set()
+        self._drop(user_id)
+        account = self._accounts[user_id] = _Account(balance, self._clock(), version)
+        changed = set()
+        for symbol, quantity in positions:
+            changed.update(self._adjust(user_id, account, symbol.upper(), quantity))
+        return changed
+
+    def _snapshot(self, account):
+        return {
+            'balance': account.balance,
+            'portfolio_value': account.value,
+            'symbols': list(account.holdings),
+            'unpriced': [symbol for symbol in account.holdings if symbol not in self._marks]
+        }
+
+    def _adjust(self, user_id, account, symbol, quantity_delta):
+        quantity = account.holdings.get(symbol, 0) + quantity_delta
+        if quantity > 0:
+            account.holdings[symbol] = quantity
+            self._holders[symbol].add(user_id)
+        else:
+            account.holdings.pop(symbol, None)
+            self._holders[symbol].discard(user_id)
+            if not self._holders[symbol]:
+                del self._holders[symbol]
+
+        if symbol not in self._marks:
+            # First holder of an unpriced symbol: mark it (and so value every holder) if a price is known
+            known = self.prices.get(symbol)
+            return self._mark(symbol, known[0]) if known else []
+        account.value += self._marks[symbol] * quantity_delta
+        return []
+
+    def _on_price(self, symbol, price, updated_at):
+        with self._lock:
+            self._sweep()
+            changed = self._mark(symbol, price)
+        self._notify(changed)
+
+    def _mark(self, symbol, price):
+        old = self._marks.get(symbol)
+        self._marks[symbol] = price
+        delta = price - (old or 0.0)
+        if not delta:
+            return []
+        holders = []
+        for user_id in list(self._holders.get(symbol, ())):
+            account = self._fresh(user_id)
+            if account is not None:
+                account.value += delta * account.holdings[symbol]
+                holders.append(user_id)
+        return holders
+
+    def _notify(self, user_ids):
+        if not self._listeners:
+            return
+        for user_id in user_ids:
+            snapshot = self.snapshot(user_id)
+            if snapshot is None:
+                continue
+            for listener in list(self._listeners):
+                listener(user_id, snapshot)
+
+    def _drop(self, user_id):
+        account = self._accounts.pop(user_id, None)
+        if account is None:
+            return
+        for symbol in account.holdings:
+            self._holders[symbol].discard(user_id)
+            if not self._holders[symbol]:
+                del self._holders[symbol]
@@ -0,0 +1,15 @@
+import os
+
+# Workers boot in parallel, so they do not migrate the schema themselves; the
+# container runs `flask db upgrade` once before starting gunicorn
+os.environ.setdefault('DATABASE_AUTO_MIGRATE', 'false')
+
+# gevent workers run each connection on a greenlet, so thousands of idle
+# /api/stream clients do not each pin an OS thread
+worker_class = 'gevent'
+# Workers share the upstream quota, fetched quotes and committed trades through
+# the database (SHARED_STATE_ENABLED), so a trade on one worker reaches streams
+# held by another within SHARED_STATE_SYNC_INTERVAL
+workers = int(os.getenv('GUNICORN_WORKERS', 2))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 5000))
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
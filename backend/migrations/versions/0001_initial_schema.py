@@ -0,0 +1,45 @@
+"""Initial schema: users and portfolio positions
+
+Revision ID: 0001_initial_schema
+Revises:
+Create Date: 2024-12-08 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001_initial_schema'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'user',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(length=80), nullable=False),
+        sa.Column('email', sa.String(length=120), nullable=False),
+        sa.Column('password', sa.String(length=128), nullable=False),
+        sa.Column('balance', sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('email'),
+        sa.UniqueConstraint('username')
+    )
+    op.create_table(
+        'portfolio',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('symbol', sa.String(length=10), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('purchase_price', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('portfolio')
+    op.drop_table('user')
@@ -0,0 +1,87 @@
+"""Stored price bars and a unique (user_id, symbol) index on portfolio
+
+Revision ID: 0002_price_bars_portfolio_index
+Revises: 0001_initial_schema
+Create Date: 2024-12-08 12:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_price_bars_portfolio_index'
+down_revision = '0001_initial_schema'
+branch_labels = None
+depends_on = None
+
+
+portfolio = sa.table(
+    'portfolio',
+    sa.column('id', sa.Integer),
+    sa.column('user_id', sa.Integer),
+    sa.column('symbol', sa.String),
+    sa.column('quantity', sa.Integer),
+)
+
+
+def merge_duplicate_positions(connection):
+    # Keep the oldest row of each (user_id, symbol) and fold the others' quantity into it,
+    # the same way buying more of a held symbol updates the existing position
+    duplicates = connection.execute(
+        sa.select(portfolio.c.user_id, portfolio.c.symbol)
+        .group_by(portfolio.c.user_id, portfolio.c.symbol)
+        .having(sa.func.count() > 1)
+    ).fetchall()
+    for user_id, symbol in duplicates:
+        rows = connection.execute(
+            sa.select(portfolio.c.id, portfolio.c.quantity)
+            .where(portfolio.c.user_id == user_id, portfolio.c.symbol == symbol)
+            .order_by(portfolio.c.id)
+        ).fetchall()
+        keep_id = rows[0].id
+        connection.execute(
+            portfolio.update()
+            .where(portfolio.c.id == keep_id)
+            .values(quantity=sum(row.quantity for row in rows))
+        )
+        connection.execute(portfolio.delete().where(portfolio.c.id.in_([row.id for row in rows[1:]])))
+
+
+def upgrade():
+    # Databases built by db.create_all() may already have the bar store tables
+    existing = sa.inspect(op.get_bind()).get_table_names()
+
+    if 'price_bar' not in existing:
+        op.create_table(
+            'price_bar',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('symbol', sa.String(length=10), nullable=False),
+            sa.Column('interval', sa.String(length=10), nullable=False),
+            sa.Column('timestamp', sa.DateTime(), nullable=False),
+            sa.Column('open', sa.Float(), nullable=True),
+            sa.Column('high', sa.Float(), nullable=True),
+            sa.Column('low', sa.Float(), nullable=True),
+            sa.Column('close', sa.Float(), nullable=False),
+            sa.Column('volume', sa.BigInteger(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('symbol', 'interval', 'timestamp', name='uq_price_bar_series_timestamp')
+        )
+    if 'price_series' not in existing:
+        op.create_table(
+            'price_series',
+            sa.Column('symbol', sa.String(length=10), nullable=False),
+            sa.Column('interval', sa.String(length=10), nullable=False),
+            sa.Column('last_timestamp', sa.DateTime(), nullable=True),
+            sa.Column('refreshed_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('symbol', 'interval')
+        )
+
+    merge_duplicate_positions(op.get_bind())
+    op.create_index('ix_portfolio_user_symbol', 'portfolio', ['user_id', 'symbol'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_portfolio_user_symbol', table_name='portfolio')
+    op.drop_table('price_series')
+    op.drop_table('price_bar')
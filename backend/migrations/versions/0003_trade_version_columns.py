@@ -0,0 +1,28 @@
+"""Version columns on user and portfolio for optimistic concurrency control
+
+Revision ID: 0003_trade_version_columns
+Revises: 0002_price_bars_portfolio_index
+Create Date: 2024-12-08 12:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_trade_version_columns'
+down_revision = '0002_price_bars_portfolio_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('user', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('portfolio', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('portfolio') as batch_op:
+        batch_op.drop_column('version')
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_column('version')
@@ -0,0 +1,42 @@
+"""Upstream call ledger and latest quotes shared between worker processes
+
+Revision ID: 0004_shared_quota_and_quotes
+Revises: 0003_trade_version_columns
+Create Date: 2024-12-09 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004_shared_quota_and_quotes'
+down_revision = '0003_trade_version_columns'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'upstream_call',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('called_at', sa.Float(), nullable=False),
+        sa.Column('daily', sa.Boolean(), server_default=sa.true(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_upstream_call_called_at', 'upstream_call', ['called_at'])
+    op.create_table(
+        'quote',
+        sa.Column('symbol', sa.String(length=10), nullable=False),
+        sa.Column('price', sa.Float(), nullable=False),
+        sa.Column('updated_at', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('symbol')
+    )
+    op.create_index('ix_quote_updated_at', 'quote', ['updated_at'])
+
+
+def downgrade():
+    op.drop_index('ix_quote_updated_at', table_name='quote')
+    op.drop_table('quote')
+    op.drop_index('ix_upstream_call_called_at', table_name='upstream_call')
+    op.drop_table('upstream_call')
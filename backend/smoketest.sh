@@ -105,15 +105,20 @@ test_historical_data() {
     fi
 }
 
+# Log in (with the password set by test_update_password) and keep the user ID and session token
+login_for_token() {
+    login_response=$(curl -s -X POST "$BASE_URL/api/auth/login" -H "Content-Type: application/json" \
+        -d '{"username":"testuser", "password":"newpassword456"}')
+    user_id=$(echo $login_response | grep -o '"id":[0-9]*' | cut -d':' -f2)
+    token=$(echo $login_response | grep -o '"token":"[^"]*"' | cut -d'"' -f4)
+}
+
 # Function to test portfolio status
 test_portfolio_status() {
     echo "Testing portfolio status..."
-    # Get user ID from login response
-    login_response=$(curl -s -X POST "$BASE_URL/api/auth/login" -H "Content-Type: application/json" \
-        -d '{"username":"testuser", "password":"password123"}')
-    user_id=$(echo $login_response | grep -o '"id":[0-9]*' | cut -d':' -f2)
+    login_for_token
     
-    response=$(curl -s -X GET "$BASE_URL/api/portfolio-status/$user_id")
+    response=$(curl -s -X GET "$BASE_URL/api/portfolio-status/$user_id" -H "Authorization: Bearer $token")
     if [ "$ECHO_JSON" = true ]; then
         echo "Portfolio Status Response:"
         echo "$response"
@@ -123,8 +128,9 @@ test_portfolio_status() {
 # Function to test buy stock
 test_buy_stock() {
     echo "Testing buy stock..."
+    login_for_token
     response=$(curl -s -X POST "$BASE_URL/api/buy-stock" -H "Content-Type: application/json" \
-        -d '{"symbol":"AAPL", "quantity":1, "userId":1}')
+        -H "Authorization: Bearer $token" -d '{"symbol":"AAPL", "quantity":1}')
     if [ "$ECHO_JSON" = true ]; then
         echo "Buy Stock Response:"
         echo "$response"
@@ -134,8 +140,9 @@ test_buy_stock() {
 # Function to test sell stock
 test_sell_stock() {
     echo "Testing sell stock..."
+    login_for_token
     response=$(curl -s -X POST "$BASE_URL/api/sell-stock" -H "Content-Type: application/json" \
-        -d '{"symbol":"AAPL", "quantity":1, "userId":1}')
+        -H "Authorization: Bearer $token" -d '{"symbol":"AAPL", "quantity":1}')
     if [ "$ECHO_JSON" = true ]; then
         echo "Sell Stock Response:"
         echo "$response"
@@ -0,0 +1,209 @@
+"""
+Local stand-in for the Alpha Vantage query API, for benchmarks.
+
+Serves deterministic, realistically sized payloads for the functions the
+backend uses (GLOBAL_QUOTE, TIME_SERIES_INTRADAY/DAILY/MONTHLY and
+MARKET_STATUS), with configurable latency, error rate and rate limiting.
+
+Run standalone with `python benchmarks/fake_alpha_vantage.py --port 8099` and
+point the backend at it with `ALPHA_VANTAGE_BASE_URL=http://127.0.0.1:8099/query`.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+THROTTLE_NOTE = ('Thank you for using Alpha Vantage! Our standard API call frequency is '
+                 '5 calls per minute and 25 requests per day.')
+
+# Today's close, so the backend's date-range filters always find bars while
+# payloads (and therefore response sizes) stay identical across runs on a day
+ANCHOR = datetime.combine(datetime.today().date(), datetime.min.time()) + timedelta(hours=16)
+
+
+def _walk(symbol, count, seed_suffix=''):
+    """Deterministic random-walk closes for a symbol."""
+    rng = random.Random(f'{symbol}{seed_suffix}')
+    price = 20 + rng.random() * 480
+    closes = []
+    for _ in range(count):
+        price = max(1.0, price * (1 + rng.gauss(0, 0.015)))
+        closes.append(price)
+    return closes
+
+
+def _bars(symbol, timestamps, fmt):
+    closes = _walk(symbol, len(timestamps), fmt)
+    series = {}
+    for when, close in zip(timestamps, closes):
+        series[when.strftime(fmt)] = {
+            '1. open': f'{close * 0.995:.4f}',
+            '2. high': f'{close * 1.01:.4f}',
+            '3. low': f'{close * 0.99:.4f}',
+            '4. close': f'{close:.4f}',
+            '5. volume': str(int(1_000_000 + close * 1000)),
+        }
+    return series
+
+
+def global_quote(symbol):
+    price = _walk(symbol, 1)[0]
+    return {'Global Quote': {
+        '01. symbol': symbol,
+        '02. open': f'{price * 0.99:.4f}',
+        '03. high': f'{price * 1.01:.4f}',
+        '04. low': f'{price * 0.98:.4f}',
+        '05. price': f'{price:.4f}',
+        '06. volume': '4028430',
+        '07. latest trading day': ANCHOR.strftime('%Y-%m-%d'),
+        '08. previous close': f'{price * 0.995:.4f}',
+        '09. change': f'{price * 0.005:.4f}',
+        '10. change percent': '0.5025%',
+    }}
+
+
+def time_series(function, symbol, outputsize):
+    full = outputsize == 'full'
+    if function == 'TIME_SERIES_INTRADAY':
+        count = 2000 if full else 100
+        stamps = [ANCHOR - timedelta(hours=i) for i in range(count)]
+        return {'Meta Data': {'2. Symbol': symbol}, 'Time Series (60min)': _bars(symbol, stamps, '%Y-%m-%d %H:%M:%S')}
+    if function == 'TIME_SERIES_DAILY':
+        count = 5000 if full else 100
+        stamps = [ANCHOR - timedelta(days=i) for i in range(count)]
+        return {'Meta Data': {'2. Symbol': symbol}, 'Time Series (Daily)': _bars(symbol, stamps, '%Y-%m-%d')}
+    stamps = [ANCHOR - timedelta(days=30 * i) for i in range(240)]
+    return {'Meta Data': {'2. Symbol': symbol}, 'Monthly Time Series': _bars(symbol, stamps, '%Y-%m-%d')}
+
+
+def market_status():
+    return {'endpoint': 'Global Market Open & Close Status', 'markets': [
+        {'market_type': 'Equity', 'region': 'United States', 'primary_exchanges': 'NASDAQ, NYSE',
+         'local_open': '09:30', 'local_close': '16:15', 'current_status': 'open', 'notes': ''},
+        {'market_type': 'Equity', 'region': 'United Kingdom', 'primary_exchanges': 'London Stock Exchange',
+         'local_open': '08:00', 'local_close': '16:30', 'current_status': 'closed', 'notes': ''},
+    ]}
+
+
+class FakeAlphaVantage:
+    """
+    Threaded HTTP server answering Alpha Vantage style queries.
+
+    Args:
+        port (int): Port to listen on (0 picks a free one).
+        latency (float): Mean seconds added to every response.
+        jitter (float): Extra uniformly random seconds, up to this much.
+        error_rate (float): Share of requests answered with HTTP 503.
+        calls_per_minute (int): Requests allowed per rolling minute before
+            answering with Alpha Vantage's throttle note (0 disables).
+        seed (int): Seed for latency and error sampling.
+    """
+
+    def __init__(self, port=0, latency=0.05, jitter=0.02, error_rate=0.0, calls_per_minute=0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls_per_minute = calls_per_minute
+        self.calls = {}
+        self._rng = random.Random(seed)
+        self._recent = deque()
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}/query'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fake-alpha-vantage', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def respond(self, params):
+        """Return `(status, payload)` for a query, after the simulated delay."""
+        function = params.get('function', '')
+        with self._lock:
+            self.calls[function] = self.calls.get(function, 0) + 1
+            delay = self.latency + self._rng.random() * self.jitter
+            failed = self._rng.random() < self.error_rate
+            throttled = self._throttled()
+        time.sleep(delay)
+
+        if failed:
+            return 503, {'error': 'Service Unavailable'}
+        if throttled:
+            return 200, {'Note': THROTTLE_NOTE}
+
+        symbol = params.get('symbol', '').upper()
+        if function == 'GLOBAL_QUOTE':
+            return 200, global_quote(symbol)
+        if function in ('TIME_SERIES_INTRADAY', 'TIME_SERIES_DAILY', 'TIME_SERIES_MONTHLY'):
+            return 200, time_series(function, symbol, params.get('outputsize'))
+        if function == 'MARKET_STATUS':
+            return 200, market_status()
+        return 200, {'Error Message': f'Invalid API call: {function}'}
+
+    def _throttled(self):
+        if not self.calls_per_minute:
+            return False
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] > 60:
+            self._recent.popleft()
+        if len(self._recent) >= self.calls_per_minute:
+            return True
+        self._recent.append(now)
+        return False
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                status, payload = fake.respond(params)
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--jitter', type=float, default=0.02)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--calls-per-minute', type=int, default=0)
+    args = parser.parse_args()
+
+    fake = FakeAlphaVantage(args.port, args.latency, args.jitter, args.error_rate, args.calls_per_minute)
+    print(f'Serving fake Alpha Vantage at {fake.url}')
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
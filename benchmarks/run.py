@@ -0,0 +1,249 @@
+"""
+Load-test the backend against a local fake Alpha Vantage server.
+
+Boots `create_app()` on a throwaway SQLite database, registers one user per
+client, drives a weighted mix of login, lookup, historical, portfolio-status
+and trade requests at a fixed concurrency, and reports throughput and
+p50/p95/p99 latency per route. The request schedule is derived from `--seed`,
+so runs with the same arguments are comparable; `--baseline` compares against
+an earlier `--output` file and exits non-zero on regressions.
+
+    python benchmarks/run.py --clients 16 --requests 2000 --output results.json
+    python benchmarks/run.py --clients 16 --requests 2000 --baseline results.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import make_server
+
+from fake_alpha_vantage import FakeAlphaVantage
+
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+
+SYMBOLS = ['AAPL', 'MSFT', 'GOOG', 'AMZN', 'NVDA', 'META', 'TSLA', 'JPM', 'V', 'UNH',
+           'XOM', 'JNJ', 'WMT', 'PG', 'MA', 'HD', 'CVX', 'KO', 'PEP', 'COST']
+RANGES = ['1d', '10d', '1m', '6m', '1y']
+
+# Share of traffic per operation
+DEFAULT_MIX = {'login': 5, 'lookup': 25, 'historical': 25, 'portfolio': 25, 'trade': 20}
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Client:
+    """One simulated user: its own HTTP session, token and request schedule."""
+
+    def __init__(self, base_url, index, seed):
+        self.base_url = base_url
+        self.username = f'bench{index}'
+        self.password = 'bench-password'
+        self.session = requests.Session()
+        self.rng = random.Random(seed * 1000 + index)
+        self.token = None
+        self.user_id = None
+        self.held = []
+
+    def register(self):
+        self.session.post(f'{self.base_url}/api/auth/register', json={
+            'username': self.username, 'email': f'{self.username}@bench.local', 'password': self.password
+        })
+        self.login()
+
+    def login(self):
+        response = self.session.post(f'{self.base_url}/api/auth/login',
+                                     json={'username': self.username, 'password': self.password})
+        if response.ok:
+            data = response.json()
+            self.token, self.user_id = data['token'], data['user']['id']
+        return response
+
+    def request(self, operation):
+        """Run one operation; returns `(route, status)`."""
+        headers = {'Authorization': f'Bearer {self.token}'}
+        symbol = self.rng.choice(SYMBOLS)
+        if operation == 'login':
+            return 'POST /api/auth/login', self.login().status_code
+        if operation == 'lookup':
+            response = self.session.get(f'{self.base_url}/lookup-stock', params={'symbol': symbol})
+            return 'GET /lookup-stock', response.status_code
+        if operation == 'historical':
+            params = {'symbol': symbol, 'range': self.rng.choice(RANGES)}
+            response = self.session.get(f'{self.base_url}/historical-data', params=params)
+            return 'GET /historical-data', response.status_code
+        if operation == 'portfolio':
+            response = self.session.get(f'{self.base_url}/api/portfolio-status/{self.user_id}', headers=headers)
+            return 'GET /api/portfolio-status', response.status_code
+        # Trades alternate between buying a new symbol and selling one bought earlier
+        if self.held and self.rng.random() < 0.5:
+            sold = self.held.pop(self.rng.randrange(len(self.held)))
+            response = self.session.post(f'{self.base_url}/api/sell-stock', headers=headers,
+                                         json={'symbol': sold, 'quantity': 1})
+            return 'POST /api/sell-stock', response.status_code
+        response = self.session.post(f'{self.base_url}/api/buy-stock', headers=headers,
+                                     json={'symbol': symbol, 'quantity': 1})
+        if response.ok:
+            self.held.append(symbol)
+        return 'POST /api/buy-stock', response.status_code
+
+
+def boot_backend(upstream_url, args):
+    """Configure the environment, then import and serve the app on a free port."""
+    data_dir = tempfile.mkdtemp(prefix='trading-bench-')
+    os.environ.update({
+        'ALPHA_VANTAGE_BASE_URL': upstream_url,
+        'ALPHA_VANTAGE_API_KEY': 'bench',
+        'DATABASE_URL': f"sqlite:///{os.path.join(data_dir, 'trading.db')}",
+        # The fake server applies its own limit; the app's quota would only add queueing noise
+        'ALPHA_VANTAGE_CALLS_PER_MINUTE': str(args.app_calls_per_minute),
+        'ALPHA_VANTAGE_CALLS_PER_DAY': '0',
+        'BCRYPT_ROUNDS': str(args.bcrypt_rounds),
+        'LOG_LEVEL': 'WARNING',
+        'PRICE_REFRESH_ENABLED': 'false',
+        'PROFILING_ENABLED': 'false',
+    })
+    sys.path.insert(0, BACKEND_DIR)
+    from app import create_app
+
+    app = create_app()
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-backend', daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def run(args):
+    fake = FakeAlphaVantage(latency=args.upstream_latency, jitter=args.upstream_jitter,
+                            error_rate=args.upstream_error_rate, calls_per_minute=args.upstream_calls_per_minute,
+                            seed=args.seed).start()
+    server, base_url = boot_backend(fake.url, args)
+
+    clients = [Client(base_url, i, args.seed) for i in range(args.clients)]
+    for client in clients:
+        client.register()
+
+    operations = [op for op, weight in DEFAULT_MIX.items() for _ in range(weight)]
+    per_client = args.requests // args.clients
+    results = {}
+    lock = threading.Lock()
+
+    def drive(client, count, record):
+        for _ in range(count):
+            operation = client.rng.choice(operations)
+            started = time.perf_counter()
+            try:
+                route, status = client.request(operation)
+            except requests.RequestException:
+                route, status = operation, 'error'
+            elapsed = time.perf_counter() - started
+            if record:
+                with lock:
+                    results.setdefault(route, []).append((elapsed, status))
+
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        list(pool.map(lambda c: drive(c, args.warmup // args.clients, False), clients))
+        started = time.perf_counter()
+        list(pool.map(lambda c: drive(c, per_client, True), clients))
+        wall = time.perf_counter() - started
+
+    server.shutdown()
+    fake.stop()
+    return summarize(results, wall, args, fake.calls)
+
+
+def summarize(results, wall, args, upstream_calls):
+    routes = {}
+    for route, samples in sorted(results.items()):
+        latencies = sorted(elapsed for elapsed, _ in samples)
+        routes[route] = {
+            'count': len(samples),
+            'server_errors': sum(1 for _, s in samples if s == 'error' or s >= 500),
+            'client_errors': sum(1 for _, s in samples if s != 'error' and 400 <= s < 500),
+            'throughput': len(samples) / wall,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+        }
+    total = sum(r['count'] for r in routes.values())
+    return {
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline', 'tolerance')},
+        'wall_seconds': wall,
+        'throughput': total / wall,
+        'upstream_calls': upstream_calls,
+        'routes': routes,
+    }
+
+
+def report(summary):
+    print(f"\n{'route':<28}{'count':>7}{'5xx':>6}{'4xx':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for route, r in summary['routes'].items():
+        print(f"{route:<28}{r['count']:>7}{r['server_errors']:>6}{r['client_errors']:>6}{r['throughput']:>9.1f}"
+              f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}")
+    print(f"\nTotal: {summary['throughput']:.1f} req/s over {summary['wall_seconds']:.1f}s; "
+          f"upstream calls: {summary['upstream_calls']}")
+
+
+def compare(summary, baseline, tolerance):
+    """Print regressions against a baseline run; returns how many were found."""
+    if baseline['config'] != summary['config']:
+        print('\nWarning: baseline was recorded with different settings:', baseline['config'])
+
+    regressions = []
+    if summary['throughput'] < baseline['throughput'] * (1 - tolerance):
+        regressions.append(f"total throughput {baseline['throughput']:.1f} -> {summary['throughput']:.1f} req/s")
+    for route, current in summary['routes'].items():
+        before = baseline['routes'].get(route)
+        if not before:
+            continue
+        for field in ('p95_ms', 'p99_ms'):
+            if current[field] > before[field] * (1 + tolerance):
+                regressions.append(f'{route} {field} {before[field]:.1f} -> {current[field]:.1f}')
+    for line in regressions:
+        print('REGRESSION:', line)
+    if not regressions:
+        print(f'\nNo regressions beyond {tolerance:.0%} of the baseline.')
+    return len(regressions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=8, help='concurrent simulated users')
+    parser.add_argument('--requests', type=int, default=1000, help='measured requests across all clients')
+    parser.add_argument('--warmup', type=int, default=100, help='unmeasured requests run first')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--upstream-latency', type=float, default=0.05, help='fake upstream mean latency (s)')
+    parser.add_argument('--upstream-jitter', type=float, default=0.02, help='fake upstream extra random latency (s)')
+    parser.add_argument('--upstream-error-rate', type=float, default=0.0, help='share of upstream calls failing with 503')
+    parser.add_argument('--upstream-calls-per-minute', type=int, default=0, help='fake upstream throttle (0 disables)')
+    parser.add_argument('--app-calls-per-minute', type=int, default=0, help="the app's own upstream quota (0 disables)")
+    parser.add_argument('--bcrypt-rounds', type=int, default=12)
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--baseline', help='compare against an earlier --output file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before flagging a regression')
+    args = parser.parse_args()
+
+    summary = run(args)
+    report(summary)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            sys.exit(1 if compare(summary, json.load(f), args.tolerance) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -22,6 +22,7 @@ function Login() {
         message.success('Login successful');
         // Store user data in localStorage or state management system
         localStorage.setItem('user', JSON.stringify(data.user));
+        localStorage.setItem('token', data.token);
         navigate('/dashboard');
       } else {
         message.error(data.error || 'Login failed');
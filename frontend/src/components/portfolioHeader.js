@@ -13,7 +13,9 @@ const PortfolioHeader = forwardRef((props, ref) => {
         setIsLoading(true);
         try {
             const user = JSON.parse(localStorage.getItem('user'));
-            const response = await fetch(`http://127.0.0.1:5000/api/portfolio-status/${user.id}`);
+            const response = await fetch(`http://127.0.0.1:5000/api/portfolio-status/${user.id}`, {
+                headers: { 'Authorization': `Bearer ${localStorage.getItem('token')}` }
+            });
             const data = await response.json();
             setBalance(data.balance);
             setPortfolioValue(data.portfolio_value);
@@ -34,6 +36,20 @@ const PortfolioHeader = forwardRef((props, ref) => {
         fetchBalanceAndPortfolio();
     }, []);
 
+    // Keep balance and portfolio value live from the server's event stream.
+    useEffect(() => {
+        const user = JSON.parse(localStorage.getItem('user'));
+        // EventSource cannot send headers, so the session token goes in the query string
+        const token = encodeURIComponent(localStorage.getItem('token'));
+        const source = new EventSource(`http://127.0.0.1:5000/api/stream?user_id=${user.id}&token=${token}`);
+        source.addEventListener('portfolio', (event) => {
+            const data = JSON.parse(event.data);
+            setBalance(data.balance);
+            setPortfolioValue(data.portfolio_value);
+        });
+        return () => source.close();
+    }, []);
+
     return (
         <Card style={{ marginBottom: '20px' }}>
             <div style={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center' }}>
@@ -11,6 +11,7 @@ function SellStock({ onSuccess }) {
               method: 'POST',
               headers: {
                   'Content-Type': 'application/json',
+                  'Authorization': `Bearer ${localStorage.getItem('token')}`,
               },
               body: JSON.stringify({
                   ...values,
@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+
+# The backend imports its modules as top-level packages (`app`, `config`)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from config import Config  # noqa: E402
+from app import create_app, db  # noqa: E402
+
+
+@pytest.fixture
+def make_app(monkeypatch):
+    """
+    Build apps on an in-memory database inside a pushed app context.
+
+    Call it with the config values a test changes, e.g.
+    `make_app(BCRYPT_ROUNDS=4)`; the tables are dropped afterwards.
+    """
+    contexts = []
+
+    def make(**overrides):
+        config = type('TestConfig', (Config,), {
+            'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+            'TESTING': True,
+            'SHARED_STATE_ENABLED': False,
+            **overrides
+        })
+        monkeypatch.setattr('app.Config', config)
+        app = create_app()
+        context = app.app_context()
+        context.push()
+        contexts.append(context)
+        return app
+
+    yield make
+    for context in reversed(contexts):
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+        context.pop()
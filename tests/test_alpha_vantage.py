@@ -0,0 +1,274 @@
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+
+from config import Config
+
+from app.services.alpha_vantage import AlphaVantageService
+from app.services.cache import TTLCache
+from app.services.cassette import Cassette, CassetteMiss
+from app.services.market_hours import seconds_until_next_transition
+from app.services.rate_limiter import QuotaScheduler, RateLimitExceeded
+from app.services.singleflight import SingleFlight
+
+
+MOCK_QUOTE = {
+    "Global Quote": {
+        "01. symbol": "AAPL",
+        "05. price": "238.0400",
+        "06. volume": "4028430"
+    }
+}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def service():
+    service = AlphaVantageService()
+    service.scheduler = QuotaScheduler(per_minute=0, per_day=0, max_wait=0)
+    service._fetch = MagicMock(return_value=MOCK_QUOTE)
+    return service
+
+
+def test_cache_expiry_and_stale_window():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=10, clock=clock)
+    cache.set(('GLOBAL_QUOTE', 'AAPL', ()), 1, ttl=10, stale_ttl=5)
+
+    assert cache.get(('GLOBAL_QUOTE', 'AAPL', ())) == (1, TTLCache.FRESH)
+    clock.now = 12
+    assert cache.get(('GLOBAL_QUOTE', 'AAPL', ())) == (1, TTLCache.STALE)
+    clock.now = 20
+    assert cache.get(('GLOBAL_QUOTE', 'AAPL', ())) == (None, None)
+
+    stats = cache.stats()['namespaces']['GLOBAL_QUOTE']
+    assert (stats['hits'], stats['stale_hits'], stats['misses']) == (1, 1, 1)
+
+
+def test_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2)
+    cache.set(('F', 'A', ()), 'a', ttl=60)
+    cache.set(('F', 'B', ()), 'b', ttl=60)
+    cache.get(('F', 'A', ()))
+    cache.set(('F', 'C', ()), 'c', ttl=60)
+
+    assert cache.get(('F', 'B', ()))[1] is None
+    assert cache.get(('F', 'A', ()))[0] == 'a'
+    assert cache.stats()['evictions'] == 1
+
+
+def test_repeated_quotes_hit_cache(service):
+    assert service.get_stock_quote('AAPL') == MOCK_QUOTE
+    assert service.get_stock_quote('aapl') == MOCK_QUOTE
+    assert service._fetch.call_count == 1
+
+
+def test_time_series_always_come_from_upstream(service):
+    service.get_time_series_daily('AAPL', outputsize='compact')
+    service.get_time_series_daily('AAPL', outputsize='compact')
+
+    assert service._fetch.call_count == 2
+    assert len(service.cache) == 0
+
+
+def test_error_payloads_are_not_cached(service):
+    service._fetch.return_value = {'Note': 'API call frequency exceeded'}
+    service.get_stock_quote('AAPL')
+    service.get_stock_quote('AAPL')
+    assert service._fetch.call_count == 2
+
+
+def test_stale_entry_served_while_refreshing(service):
+    service.get_stock_quote('AAPL')
+    key = service._cache_key({'function': 'GLOBAL_QUOTE', 'symbol': 'AAPL'})
+    service.cache.set(key, {'old': True}, ttl=0, stale_ttl=60)
+
+    assert service.get_stock_quote('AAPL') == {'old': True}
+    for _ in range(50):
+        if service.cache.get(key)[1] == TTLCache.FRESH:
+            break
+        time.sleep(0.01)
+    assert service.get_stock_quote('AAPL') == MOCK_QUOTE
+    assert service._fetch.call_count == 2
+
+
+def test_fetch_retries_transient_errors(service):
+    del service._fetch
+    service._backoff = lambda attempt: 0
+    ok = MagicMock(status_code=200)
+    ok.json.return_value = MOCK_QUOTE
+    service.session.get = MagicMock(side_effect=[requests.ConnectionError(), MagicMock(status_code=503), ok])
+
+    assert service.get_stock_quote('AAPL') == MOCK_QUOTE
+    assert service.session.get.call_count == 3
+    assert service.session.get.call_args.kwargs['timeout'] == service.timeout
+
+
+def test_fetch_gives_up_after_max_retries(service):
+    del service._fetch
+    service._backoff = lambda attempt: 0
+    service.session.get = MagicMock(side_effect=requests.Timeout())
+
+    with pytest.raises(requests.Timeout):
+        service.get_stock_quote('AAPL')
+    assert service.session.get.call_count == service.max_retries + 1
+
+
+def test_get_stock_quotes_dedupes_and_flags_missing(service):
+    def fetch(params, priority):
+        if params['symbol'] == 'SLOW':
+            time.sleep(0.5)
+        if params['symbol'] == 'BAD':
+            raise requests.ConnectionError()
+        return MOCK_QUOTE
+    service._fetch = MagicMock(side_effect=fetch)
+
+    quotes, missing = service.get_stock_quotes(['AAPL', 'AAPL', 'SLOW', 'BAD'], timeout=0.2)
+
+    assert list(quotes) == ['AAPL']
+    assert missing == {'SLOW': 'timeout', 'BAD': 'failed'}
+    assert [c.args[0]['symbol'] for c in service._fetch.call_args_list].count('AAPL') == 1
+
+
+def test_concurrent_identical_requests_share_one_call(service):
+    release = threading.Event()
+
+    def fetch(params, priority):
+        release.wait(1)
+        return MOCK_QUOTE
+    service._fetch = MagicMock(side_effect=fetch)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(service.get_stock_quote('AAPL'))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == [MOCK_QUOTE] * 5
+    assert service._fetch.call_count == 1
+    assert service.flights.stats()['coalesced'] == 4
+
+
+def test_single_flight_propagates_errors_to_waiters():
+    flights = SingleFlight()
+    release = threading.Event()
+    errors = []
+
+    def fail():
+        release.wait(1)
+        raise requests.ConnectionError('down')
+
+    def call():
+        try:
+            flights.do('key', fail)
+        except requests.ConnectionError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 3
+    assert flights.stats() == {'in_flight': 0, 'executions': 1, 'coalesced': 2}
+
+
+def test_throttle_payload_raises_and_is_not_cached(service):
+    del service._fetch
+    throttled = MagicMock(status_code=200)
+    throttled.json.return_value = {'Information': 'Our standard API rate limit is 25 requests per day.'}
+    service.session.get = MagicMock(return_value=throttled)
+
+    service.scheduler.drain = MagicMock()
+
+    with pytest.raises(RateLimitExceeded):
+        service.get_stock_quote('AAPL')
+    assert len(service.cache) == 0
+    service.scheduler.drain.assert_called_once_with(daily=True)
+
+
+MARKET_STATUS = {
+    "markets": [
+        {"region": "United States", "local_open": "09:30", "local_close": "16:15", "current_status": "open"},
+        {"region": "Japan", "local_open": "09:00", "local_close": "15:00", "current_status": "closed"},
+        {"region": "Global", "local_open": "00:00", "local_close": "23:59", "current_status": "open"}
+    ]
+}
+
+
+def test_seconds_until_next_transition_picks_nearest_market():
+    # 14:00 UTC is 10:00 in New York (EDT) and 23:00 in Tokyo
+    now = datetime(2024, 6, 3, 14, 0, tzinfo=timezone.utc)
+    assert seconds_until_next_transition(MARKET_STATUS, now) == (6 * 60 + 15) * 60
+
+    # 05:30 UTC is 14:30 in Tokyo, half an hour before it closes
+    now = datetime(2024, 6, 3, 5, 30, tzinfo=timezone.utc)
+    assert seconds_until_next_transition(MARKET_STATUS, now) == 30 * 60
+
+    assert seconds_until_next_transition({"markets": [MARKET_STATUS["markets"][2]]}, now) is None
+
+
+def test_market_status_cached_until_next_transition(service):
+    service._fetch = MagicMock(return_value=MARKET_STATUS)
+
+    service.get_global_market_status()
+    service.get_global_market_status()
+
+    assert service._fetch.call_count == 1
+    key = service._cache_key({'function': 'MARKET_STATUS'})
+    _, expires_at, stale_until = service.cache._entries[key]
+    assert expires_at == stale_until
+    assert expires_at - time.monotonic() <= 12 * 3600
+
+
+def cassette_service(tmp_path, mode):
+    class CassetteConfig(Config):
+        ALPHA_VANTAGE_CASSETTE_MODE = mode
+        ALPHA_VANTAGE_CASSETTE_PATH = str(tmp_path / 'cassettes' / 'av.sqlite')
+    service = AlphaVantageService(CassetteConfig)
+    service.scheduler = QuotaScheduler(per_minute=0, per_day=0, max_wait=0)
+    return service
+
+
+def test_recorded_responses_replay_without_network(tmp_path):
+    recorder = cassette_service(tmp_path, 'record')
+    ok = MagicMock(status_code=200, content=json.dumps(MOCK_QUOTE).encode())
+    ok.json.return_value = MOCK_QUOTE
+    recorder.session.get = MagicMock(return_value=ok)
+    recorder.get_stock_quote('aapl')
+    recorder.cassette.close()
+
+    player = cassette_service(tmp_path, 'replay')
+    player.session.get = MagicMock(side_effect=AssertionError('network used in replay'))
+
+    quote = player.get_stock_quote('AAPL')
+    assert quote == MOCK_QUOTE
+    assert quote.raw == json.dumps(MOCK_QUOTE).encode()
+    with pytest.raises(CassetteMiss):
+        player.get_stock_quote('MSFT')
+
+
+def test_cassette_key_ignores_api_key_and_param_order(tmp_path):
+    cassette = Cassette(str(tmp_path / 'av.sqlite'))
+    cassette.record({'symbol': 'ibm', 'function': 'GLOBAL_QUOTE', 'apikey': 'secret'}, 200, b'{}', 0.25)
+
+    assert cassette.play({'function': 'GLOBAL_QUOTE', 'symbol': 'IBM'}) == (200, b'{}', 0.25)
+    assert len(cassette) == 1
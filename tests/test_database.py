@@ -0,0 +1,75 @@
+import logging
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from config import Config
+from app import db
+from app.models import Portfolio
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """A trading.db as db.create_all() used to build it, holding a duplicated position."""
+    path = tmp_path / 'trading.db'
+    connection = sqlite3.connect(path)
+    connection.executescript("""
+        CREATE TABLE user (
+            id INTEGER NOT NULL, username VARCHAR(80) NOT NULL, email VARCHAR(120) NOT NULL,
+            password VARCHAR(128) NOT NULL, balance FLOAT,
+            PRIMARY KEY (id), UNIQUE (username), UNIQUE (email)
+        );
+        CREATE TABLE portfolio (
+            id INTEGER NOT NULL, user_id INTEGER NOT NULL, symbol VARCHAR(10) NOT NULL,
+            quantity INTEGER NOT NULL, purchase_price FLOAT NOT NULL,
+            PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES user (id)
+        );
+        INSERT INTO user VALUES (1, 'trader', 'trader@test.com', 'x', 1000.0);
+        INSERT INTO portfolio VALUES (1, 1, 'AAPL', 10, 100.0), (2, 1, 'AAPL', 5, 120.0);
+    """)
+    connection.close()
+    return path
+
+
+def test_legacy_database_is_stamped_and_upgraded(make_app, legacy_db):
+    make_app(SQLALCHEMY_DATABASE_URI=f'sqlite:///{legacy_db}')
+
+    positions = Portfolio.query.all()
+    assert [(p.id, p.quantity, p.purchase_price) for p in positions] == [(1, 15, 100.0)]
+    assert db.session.execute(db.text('PRAGMA journal_mode')).scalar() == 'wal'
+    assert db.session.execute(db.text('PRAGMA busy_timeout')).scalar() == Config.SQLITE_BUSY_TIMEOUT
+
+    db.session.add(Portfolio(user_id=1, symbol='AAPL', quantity=1, purchase_price=1.0))
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+    db.session.rollback()
+
+
+def test_migrating_on_startup_leaves_root_logging_alone(make_app, monkeypatch):
+    root = logging.getLogger()
+    monkeypatch.setattr(root, 'handlers', [])
+
+    make_app()
+
+    assert root.handlers == []
+
+
+def test_processes_starting_together_migrate_once(tmp_path):
+    backend = os.path.join(os.path.dirname(__file__), '..', 'backend')
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'trading.db'}", LOG_LEVEL='ERROR')
+    workers = [
+        subprocess.Popen([sys.executable, '-c', 'from app import create_app; create_app()'],
+                         cwd=backend, env=env, stderr=subprocess.PIPE)
+        for _ in range(3)
+    ]
+
+    for worker in workers:
+        _, stderr = worker.communicate(timeout=60)
+        assert worker.returncode == 0, stderr.decode()
+    connection = sqlite3.connect(tmp_path / 'trading.db')
+    assert connection.execute('SELECT COUNT(*) FROM alembic_version').fetchone() == (1,)
+    connection.close()
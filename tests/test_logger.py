@@ -0,0 +1,31 @@
+import logging
+from logging.handlers import QueueHandler
+
+from app.routes import logger as logger_module
+from app.routes.logger import SamplingFilter, configure_logger, log_level
+
+
+def test_configure_logger_is_idempotent():
+    logger = logging.getLogger('tests.idempotent')
+    configure_logger(logger)
+    configure_logger(logger)
+
+    assert [type(h) for h in logger.handlers] == [QueueHandler]
+
+
+def test_log_levels_override_by_longest_prefix(monkeypatch):
+    monkeypatch.setattr(logger_module.Config, 'LOG_LEVEL', 'info')
+    monkeypatch.setattr(logger_module.Config, 'LOG_LEVELS', 'app=WARNING, app.routes.stocks=DEBUG')
+
+    assert log_level('app.routes.stocks') == 'DEBUG'
+    assert log_level('app.services.cache') == 'WARNING'
+    assert log_level('application') == 'INFO'
+
+
+def test_sampling_filter_only_drops_low_level_records():
+    sampler = SamplingFilter(rate=0)
+    record = lambda level: logging.LogRecord('x', level, __file__, 1, 'payload %s', ({'big': 'dict'},), None)
+
+    assert not sampler.filter(record(logging.DEBUG))
+    assert sampler.filter(record(logging.INFO))
+    assert SamplingFilter(rate=1).filter(record(logging.DEBUG))
@@ -0,0 +1,60 @@
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+
+from app.services.alpha_vantage import UPSTREAM_ERRORS, UPSTREAM_LATENCY, AlphaVantageService
+from app.services.metrics import Registry
+from app.services.rate_limiter import QuotaScheduler
+
+
+@pytest.fixture
+def client(make_app):
+    return make_app().test_client()
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    latency = registry.histogram('latency_seconds', 'Latency.', ['route'], buckets=(0.1, 1.0))
+    latency.observe(0.05, '/a')
+    latency.observe(0.5, '/a')
+    latency.observe(5, '/a')
+
+    text = registry.render()
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{route="/a",le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{route="/a"} 3' in text
+
+
+def test_metrics_endpoint_reports_routes_db_and_cache(client):
+    client.get('/health')
+    client.post('/api/auth/login', json={'username': 'nobody', 'password': 'x'})
+
+    response = client.get('/metrics')
+
+    text = response.get_data(as_text=True)
+    assert response.mimetype == 'text/plain'
+    assert 'http_request_duration_seconds_count{route="/health",method="GET"}' in text
+    assert 'http_requests_total{route="/api/auth/login",method="POST",status="401"}' in text
+    assert '# TYPE http_requests_in_flight gauge' in text
+    assert 'db_queries_total{operation="select"}' in text
+    assert '# TYPE upstream_cache_hit_ratio gauge' in text
+    assert '# TYPE portfolio_book_accounts gauge' in text
+
+
+def test_upstream_latency_and_errors_per_function():
+    service = AlphaVantageService()
+    service.scheduler = QuotaScheduler(per_minute=0, per_day=0, max_wait=0)
+    service._backoff = lambda attempt: 0
+    ok = MagicMock(status_code=200)
+    ok.json.return_value = {'Global Quote': {'05. price': '1.0'}}
+    service.session.get = MagicMock(side_effect=[requests.Timeout(), MagicMock(status_code=503), ok])
+    before = UPSTREAM_LATENCY.count('GLOBAL_QUOTE')
+    errors = {kind: UPSTREAM_ERRORS.value('GLOBAL_QUOTE', kind) for kind in ('timeout', 'http_503')}
+
+    service.get_stock_quote('AAPL')
+
+    assert UPSTREAM_LATENCY.count('GLOBAL_QUOTE') == before + 3
+    assert UPSTREAM_ERRORS.value('GLOBAL_QUOTE', 'timeout') == errors['timeout'] + 1
+    assert UPSTREAM_ERRORS.value('GLOBAL_QUOTE', 'http_503') == errors['http_503'] + 1
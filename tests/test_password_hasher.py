@@ -0,0 +1,55 @@
+import bcrypt
+import pytest
+
+from app import db
+from app.models import User
+from app.services.password_hasher import HasherBusy, PasswordHasher
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app(BCRYPT_ROUNDS=4, BCRYPT_POOL_SIZE=0)
+
+
+def test_hash_verify_and_rehash_check_inline():
+    hasher = PasswordHasher(rounds=4, pool_size=0)
+    hashed = hasher.hash('secret')
+
+    assert hashed.startswith('$2b$04$')
+    assert hasher.verify('secret', hashed)
+    assert not hasher.verify('wrong', hashed)
+    # Hashes stored as bytes by earlier versions still verify
+    assert hasher.verify('secret', hashed.encode('utf-8'))
+    assert not hasher.needs_rehash(hashed)
+    assert PasswordHasher(rounds=5, pool_size=0).needs_rehash(hashed)
+
+
+def test_hashing_runs_in_process_pool():
+    hasher = PasswordHasher(rounds=4, pool_size=1)
+    try:
+        assert hasher.verify('secret', hasher.hash('secret'))
+    finally:
+        hasher.shutdown()
+
+
+def test_saturated_hasher_rejects_after_queue_timeout():
+    hasher = PasswordHasher(rounds=4, pool_size=0, max_concurrency=1, queue_timeout=0.05)
+    hasher._slots.acquire()
+
+    with pytest.raises(HasherBusy):
+        hasher.hash('secret')
+
+
+def test_login_rehashes_outdated_work_factor(app):
+    old_hash = bcrypt.hashpw(b'secret', bcrypt.gensalt(5))
+    db.session.add(User(username='trader', email='trader@test.com', password=old_hash))
+    db.session.commit()
+
+    response = app.test_client().post('/api/auth/login', json={'username': 'trader', 'password': 'secret'})
+
+    assert response.status_code == 200
+    token = response.get_json()['token']
+    assert app.extensions['auth_tokens'].verify(token).username == 'trader'
+    stored = User.query.filter_by(username='trader').one().password
+    assert stored.startswith('$2b$04$')
+    assert bcrypt.checkpw(b'secret', stored.encode('utf-8'))
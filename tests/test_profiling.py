@@ -0,0 +1,26 @@
+import pstats
+
+import pytest
+
+
+@pytest.fixture
+def client(make_app, tmp_path):
+    app = make_app(PROFILING_ENABLED=True, PROFILING_ALLOWED_IPS='127.0.0.1', PROFILING_DIR=str(tmp_path))
+    return app.test_client()
+
+
+def test_flagged_request_from_allowed_client_is_profiled(client, tmp_path):
+    assert 'X-Profile-Output' not in client.get('/health').headers
+
+    response = client.get('/health', headers={'X-Profile': '1'})
+
+    output = tmp_path / response.headers['X-Profile-Output']
+    assert '-GET-health_check-' in output.name
+    assert pstats.Stats(str(output)).total_calls > 0
+
+
+def test_profiling_ignores_other_clients(client, tmp_path):
+    response = client.get('/health?profile=1', environ_base={'REMOTE_ADDR': '10.0.0.8'})
+
+    assert 'X-Profile-Output' not in response.headers
+    assert list(tmp_path.iterdir()) == []
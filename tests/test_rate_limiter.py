@@ -0,0 +1,137 @@
+import threading
+import time
+
+import pytest
+
+from app import db
+from app.services.quota_ledger import QuotaLedger
+from app.services.rate_limiter import (
+    PRIORITY_HISTORICAL, PRIORITY_TRADE, QuotaScheduler, RateLimitExceeded
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def wake(scheduler):
+    with scheduler._cond:
+        scheduler._cond.notify_all()
+
+
+def test_rejects_when_quota_cannot_free_up_in_time():
+    scheduler = QuotaScheduler(per_minute=1, per_day=0, max_wait=0.05)
+
+    scheduler.acquire()
+    with pytest.raises(RateLimitExceeded):
+        scheduler.acquire()
+
+    stats = scheduler.stats()
+    assert (stats['acquired'], stats['rejected'], stats['queue_depth']) == (1, 1, 0)
+
+
+def test_daily_quota_is_enforced():
+    scheduler = QuotaScheduler(per_minute=0, per_day=2, max_wait=0.05)
+
+    scheduler.acquire()
+    scheduler.acquire()
+    with pytest.raises(RateLimitExceeded):
+        scheduler.acquire()
+
+
+def test_trade_priority_is_served_before_historical():
+    clock = FakeClock()
+    scheduler = QuotaScheduler(per_minute=1, per_day=0, max_wait=120, clock=clock)
+    scheduler.acquire()
+    order = []
+
+    def call(priority, name):
+        scheduler.acquire(priority)
+        order.append(name)
+
+    historical = threading.Thread(target=call, args=(PRIORITY_HISTORICAL, 'historical'))
+    historical.start()
+    time.sleep(0.05)
+    trade = threading.Thread(target=call, args=(PRIORITY_TRADE, 'trade'))
+    trade.start()
+    time.sleep(0.05)
+    assert scheduler.stats()['queue_depth'] == 2
+
+    clock.now = 60
+    wake(scheduler)
+    trade.join(1)
+    assert order == ['trade']
+
+    clock.now = 120
+    wake(scheduler)
+    historical.join(1)
+    assert order == ['trade', 'historical']
+
+
+def test_quota_is_never_exceeded_within_a_window():
+    clock = FakeClock()
+    scheduler = QuotaScheduler(per_minute=5, per_day=25, max_wait=0, clock=clock)
+
+    admitted = []
+    while clock.now < 86400:
+        try:
+            scheduler.acquire()
+            admitted.append(clock.now)
+        except RateLimitExceeded:
+            pass
+        clock.now += 1
+
+    assert len([t for t in admitted if t < 60]) == 5
+    assert len(admitted) == 25
+    assert all(later - earlier >= 60 for earlier, later in zip(admitted, admitted[5:]))
+
+
+def test_daily_throttle_drains_the_day_window():
+    clock = FakeClock()
+    scheduler = QuotaScheduler(per_minute=5, per_day=25, max_wait=0, clock=clock)
+
+    scheduler.drain()
+    clock.now = 60
+    scheduler.acquire()
+
+    scheduler.drain(daily=True)
+    clock.now = 3600
+    with pytest.raises(RateLimitExceeded):
+        scheduler.acquire()
+    clock.now = 60 + 86400
+    scheduler.acquire()
+
+
+def test_quota_ledger_is_shared_between_processes(make_app, tmp_path):
+    make_app(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'trading.db'}")
+    clock = FakeClock()
+    clock.now = 1000.0
+    # Two schedulers on one database stand in for two worker processes
+    first, second = (
+        QuotaScheduler(per_minute=5, per_day=8, max_wait=0, clock=clock,
+                       ledger=QuotaLedger(db.engine, per_minute=5, per_day=8, clock=clock))
+        for _ in range(2)
+    )
+
+    for scheduler in (first, second, first, second, first):
+        scheduler.acquire()
+    with pytest.raises(RateLimitExceeded):
+        second.acquire()
+    assert first.stats()['remaining_minute'] == 0
+    assert second.remaining_today() == 3
+
+    # A per-minute throttle blocks both for a minute without using up the day
+    clock.now = 1060.0
+    first.drain()
+    with pytest.raises(RateLimitExceeded):
+        second.acquire()
+    assert second.remaining_today() == 3
+    clock.now = 1121.0
+    for _ in range(3):
+        second.acquire()
+    with pytest.raises(RateLimitExceeded):
+        first.acquire()
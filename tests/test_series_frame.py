@@ -0,0 +1,32 @@
+from datetime import datetime, timedelta
+
+from app.services.series_frame import SeriesFrame
+
+
+def test_since_selects_tail_and_records_are_newest_first():
+    start = datetime(2004, 1, 1)
+    rows = [(start + timedelta(days=i), float(i)) for i in range(7300)]
+    frame = SeriesFrame.from_rows(rows)
+
+    tail = frame.since(datetime(2023, 12, 25))
+
+    records = tail.to_records()
+    assert records[0] == {"date": rows[-1][0].strftime('%Y-%m-%d'), "close": 7299.0}
+    assert records[-1]["date"] == "2023-12-25"
+    assert len(records) == len(tail)
+
+
+def test_intraday_labels_keep_time_of_day():
+    rows = [(datetime(2024, 12, 6, 9, 30), 150.5), (datetime(2024, 12, 6, 10, 30), 151.0)]
+    frame = SeriesFrame.from_rows(rows, label_unit='s')
+
+    assert frame.since(datetime(2024, 12, 6)).to_records() == [
+        {"date": "2024-12-06 10:30:00", "close": 151.0},
+        {"date": "2024-12-06 09:30:00", "close": 150.5}
+    ]
+
+
+def test_empty_frame():
+    frame = SeriesFrame.from_rows([])
+    assert len(frame) == 0
+    assert frame.since(datetime(2024, 1, 1)).to_records() == []
@@ -0,0 +1,575 @@
+import gzip
+import json
+import threading
+from datetime import date, datetime, timedelta
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+from flask import jsonify
+
+from config import Config
+from app import db, http_cache
+from app.json_encoder import FastJSONEncoder
+from app.models import PriceBar, PriceSeries, Portfolio, User
+from app.routes import stocks
+from app.services.alpha_vantage import UpstreamPayload
+from app.services.price_refresher import PriceRefresher
+from app.services.price_table import PriceTable
+from app.services.rate_limiter import QuotaScheduler, RateLimitExceeded
+from app.services.state_sync import StateSync
+from app.services.valuation import ValuationBook
+
+
+def make_quote(symbol, price):
+    return {
+        "Global Quote": {
+            "01. symbol": symbol,
+            "05. price": price,
+            "06. volume": "4028430",
+            "07. latest trading day": "2024-12-06",
+            "10. change percent": "1.4015%"
+        }
+    }
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Replace the upstream call of the shared service and start from an empty cache."""
+    stocks.alpha_vantage.cache.clear()
+    stocks.historical_responses.clear()
+    prices = PriceTable()
+    book = ValuationBook(prices)
+    prices.subscribe(stocks.publish_quote)
+    book.subscribe(stocks.publish_portfolio)
+    monkeypatch.setattr(stocks.alpha_vantage, 'prices', prices)
+    monkeypatch.setattr(stocks, 'valuation_book', book)
+    monkeypatch.setattr(stocks.alpha_vantage, 'scheduler', QuotaScheduler(per_minute=0, per_day=0, max_wait=0))
+    fetch = MagicMock(side_effect=lambda params, priority: make_quote(params['symbol'], "238.0400"))
+    monkeypatch.setattr(stocks.alpha_vantage, '_fetch', fetch)
+    return fetch
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def user(app):
+    user = User(username='trader', email='trader@test.com', password=b'x', balance=10000.0)
+    db.session.add(user)
+    db.session.commit()
+    for symbol, quantity in (('AAPL', 10), ('MSFT', 5)):
+        db.session.add(Portfolio(user_id=user.id, symbol=symbol, quantity=quantity, purchase_price=100.0))
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def token(app, user):
+    return app.extensions['auth_tokens'].issue(user.id)
+
+
+@pytest.fixture
+def auth(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_batch_quotes_dedupes_symbols(client, upstream):
+    response = client.get('/api/stock/quotes?symbols=aapl,AAPL,msft')
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert sorted(data['quotes']) == ['AAPL', 'MSFT']
+    assert data['quotes']['AAPL']['price'] == 238.04
+    assert data['missing'] == []
+    assert upstream.call_count == 2
+
+
+def test_batch_quotes_reports_missing_symbols(client, upstream):
+    upstream.side_effect = lambda params, priority: {} if params['symbol'] == 'NOPE' else make_quote(params['symbol'], "1.0")
+
+    data = client.get('/api/stock/quotes?symbols=AAPL,NOPE').get_json()
+
+    assert list(data['quotes']) == ['AAPL']
+    assert data['missing'] == ['NOPE']
+
+
+def test_batch_quotes_requires_symbols(client, upstream):
+    response = client.get('/api/stock/quotes?symbols=')
+    assert response.status_code == 400
+    assert upstream.call_count == 0
+
+
+def make_daily(start, days):
+    return {
+        "Time Series (Daily)": {
+            (start - timedelta(days=i)).isoformat(): {
+                "1. open": "100.0", "2. high": "101.0", "3. low": "99.0",
+                "4. close": f"{100 + i}.0", "5. volume": "1000"
+            }
+            for i in range(days)
+        }
+    }
+
+
+def test_historical_data_filters_range_from_bar_store(client, upstream):
+    upstream.side_effect = lambda params, priority: make_daily(date.today(), 60)
+
+    data = client.get('/historical-data?symbol=AAPL&range=10d').get_json()
+
+    assert len(data) == 11
+    assert data[0] == {"date": date.today().isoformat(), "close": 100.0}
+    assert data[-1]["date"] == (date.today() - timedelta(days=10)).isoformat()
+
+
+def test_historical_data_is_served_locally_then_refreshed_incrementally(client, upstream):
+    yesterday = date.today() - timedelta(days=1)
+    upstream.side_effect = lambda params, priority: make_daily(yesterday, 60)
+    client.get('/historical-data?symbol=AAPL&range=1m')
+    client.get('/historical-data?symbol=AAPL&range=10d')
+    assert upstream.call_count == 1
+    assert PriceBar.query.count() == 60
+
+    # Once the refresh period passes only the compact tail is requested and merged in
+    db.session.get(PriceSeries, ('AAPL', 'daily')).refreshed_at = datetime.utcnow() - timedelta(days=1)
+    db.session.commit()
+    stocks.historical_responses.clear()
+    upstream.side_effect = lambda params, priority: make_daily(date.today(), 5)
+
+    data = client.get('/historical-data?symbol=AAPL&range=1m').get_json()
+
+    assert upstream.call_args.args[0]['outputsize'] == 'compact'
+    assert PriceBar.query.count() == 61
+    assert data[0]["date"] == date.today().isoformat()
+
+
+def test_historical_body_is_reused_until_new_bars_land(client, upstream, monkeypatch):
+    upstream.side_effect = lambda params, priority: make_daily(date.today(), 60)
+    first = client.get('/historical-data?symbol=AAPL&range=1m')
+
+    get_series = MagicMock(side_effect=AssertionError('bar store read for a rendered range'))
+    monkeypatch.setattr(stocks.bar_store, 'get_series', get_series)
+    again = client.get('/historical-data?symbol=AAPL&range=1m')
+    assert again.data == first.data
+    assert again.headers['ETag'] == first.headers['ETag']
+
+    # Storing new daily bars drops the daily ranges but not the intraday one
+    assert stocks.historical_responses.get(('HISTORICAL', 'AAPL', '1m', None))[1] is not None
+    stocks.historical_responses.set(('HISTORICAL', 'AAPL', '1d', None), (date.today(), 'tag', None, b'[]'), 60)
+    stocks.invalidate_historical('AAPL', 'daily')
+    assert stocks.historical_responses.get(('HISTORICAL', 'AAPL', '1m', None))[1] is None
+    assert stocks.historical_responses.get(('HISTORICAL', 'AAPL', '1d', None))[1] is not None
+
+
+def test_historical_data_without_upstream_data(client, upstream):
+    upstream.side_effect = lambda params, priority: {"Error Message": "Invalid API call."}
+
+    response = client.get('/historical-data?symbol=NOPE&range=1m')
+
+    assert response.status_code == 500
+    assert b"Invalid data retrieved!" in response.data
+
+
+def test_historical_data_revalidates_until_a_new_bar_lands(client, upstream):
+    yesterday = date.today() - timedelta(days=1)
+    upstream.side_effect = lambda params, priority: make_daily(yesterday, 60)
+    first = client.get('/historical-data?symbol=AAPL&range=10d')
+    etag = first.headers['ETag']
+    assert first.cache_control.max_age > 0
+
+    again = client.get('/historical-data?symbol=AAPL&range=10d', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+
+    db.session.get(PriceSeries, ('AAPL', 'daily')).refreshed_at = datetime.utcnow() - timedelta(days=1)
+    db.session.commit()
+    stocks.historical_responses.clear()
+    upstream.side_effect = lambda params, priority: make_daily(date.today(), 5)
+
+    updated = client.get('/historical-data?symbol=AAPL&range=10d', headers={'If-None-Match': etag})
+    assert updated.status_code == 200
+    assert updated.headers['ETag'] != etag
+
+
+def test_large_responses_are_gzipped(client, upstream, monkeypatch):
+    upstream.side_effect = lambda params, priority: make_daily(date.today(), 60)
+
+    plain = client.get('/historical-data?symbol=AAPL&range=1m')
+    compressed = client.get('/historical-data?symbol=AAPL&range=1m', headers={'Accept-Encoding': 'gzip'})
+
+    assert 'Content-Encoding' not in plain.headers
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert gzip.decompress(compressed.data) == plain.data
+    assert compressed.headers['ETag'] == plain.headers['ETag'][:-1] + '-gzip"'
+
+    again = client.get('/historical-data?symbol=AAPL&range=1m',
+                       headers={'Accept-Encoding': 'gzip', 'If-None-Match': compressed.headers['ETag']})
+    assert again.status_code == 304
+
+    # The compressed body is cached too, so repeat requests are not compressed again
+    monkeypatch.setattr(http_cache, '_encode', MagicMock(side_effect=AssertionError('compressed on a cache hit')))
+    cached = client.get('/historical-data?symbol=AAPL&range=1m', headers={'Accept-Encoding': 'gzip'})
+    assert cached.data == compressed.data
+    assert cached.headers['ETag'] == compressed.headers['ETag']
+
+
+def test_quote_is_not_resent_while_unchanged(client, upstream):
+    first = client.get('/api/stock/quote/AAPL')
+    assert 0 < first.cache_control.max_age <= Config.ALPHA_VANTAGE_CACHE_TTLS['GLOBAL_QUOTE']
+    assert 'public' in first.headers['Cache-Control']
+
+    again = client.get('/api/stock/quote/AAPL', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+
+    stocks.alpha_vantage.cache.clear()
+    upstream.side_effect = lambda params, priority: make_quote(params['symbol'], "240.0000")
+    changed = client.get('/api/stock/quote/AAPL', headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200
+    assert changed.get_json()['Global Quote']['05. price'] == "240.0000"
+
+
+def test_quote_passes_the_upstream_body_through(client, upstream):
+    raw = b'{\n    "Global Quote": {\n        "01. symbol": "IBM",\n        "05. price": "230.1000"\n    }\n}'
+    upstream.side_effect = lambda params, priority: UpstreamPayload(json.loads(raw), raw)
+
+    response = client.get('/api/stock/quote/IBM')
+
+    assert response.data == raw
+    assert response.mimetype == 'application/json'
+
+
+def test_json_responses_use_the_fast_encoder(app):
+    with app.test_request_context():
+        body = jsonify({'b': 1, 'a': [1.5, None], 'when': date(2024, 12, 6)}).get_data()
+
+    assert body == b'{"a":[1.5,null],"b":1,"when":"Fri, 06 Dec 2024 00:00:00 GMT"}\n'
+    assert app.json_encoder is FastJSONEncoder
+
+
+def test_lookup_stock_serves_market_status_from_cache(client, upstream):
+    market_status = {"markets": [{"market_type": "Equity", "region": "United States", "local_open": "09:30",
+                                  "local_close": "16:15", "current_status": "open"}]}
+    upstream.side_effect = lambda params, priority: (
+        market_status if params['function'] == 'MARKET_STATUS' else make_quote(params['symbol'], "238.0400")
+    )
+
+    first = client.get('/lookup-stock?symbol=AAPL').get_json()
+    stocks.alpha_vantage.cache.invalidate(('GLOBAL_QUOTE', 'AAPL', ()))
+    second = client.get('/lookup-stock?symbol=AAPL').get_json()
+
+    assert first == second
+    assert first['market_status'] == [{"market_type": "Equity", "region": "United States", "current_status": "open"}]
+    functions = [c.args[0]['function'] for c in upstream.call_args_list]
+    assert functions.count('MARKET_STATUS') == 1
+    assert functions.count('GLOBAL_QUOTE') == 2
+
+
+def test_lookup_stock_times_out_on_slow_market_status(client, upstream, monkeypatch):
+    released = threading.Event()
+
+    def fetch(params, priority):
+        if params['function'] == 'MARKET_STATUS':
+            released.wait(5)
+            return {"markets": []}
+        return make_quote(params['symbol'], "238.0400")
+
+    upstream.side_effect = fetch
+    monkeypatch.setattr(stocks.alpha_vantage, 'fanout_deadline', 0.1)
+    try:
+        response = client.get('/lookup-stock?symbol=AAPL')
+    finally:
+        released.set()
+
+    assert response.status_code == 504
+    assert response.get_json() == {'error': 'Timed out getting market status'}
+
+
+def test_portfolio_status_reads_price_table(client, upstream, user, auth):
+    stocks.alpha_vantage.prices.update('AAPL', 200.0)
+    stocks.alpha_vantage.prices.update('MSFT', 100.0)
+
+    data = client.get(f'/api/portfolio-status/{user.id}', headers=auth).get_json()
+
+    assert data['portfolio_value'] == 2500.0
+    assert data['partial'] is False
+    assert data['price_age'] is not None
+    assert upstream.call_count == 0
+
+
+def test_portfolio_status_fetches_missing_prices(client, upstream, user, auth):
+    stocks.alpha_vantage.prices.update('AAPL', 200.0)
+
+    data = client.get(f'/api/portfolio-status/{user.id}', headers=auth).get_json()
+
+    assert data['portfolio_value'] == 2000.0 + 5 * 238.04
+    assert [c.args[0]['symbol'] for c in upstream.call_args_list] == ['MSFT']
+
+
+def test_price_refresher_refreshes_held_symbols(app, upstream, user):
+    refresher = PriceRefresher(app, stocks.alpha_vantage, interval=60, batch_size=5)
+
+    assert refresher.refresh_once() == 2
+    assert stocks.alpha_vantage.prices.get('MSFT')[0] == 238.04
+    # Prices newer than the interval are not refreshed again
+    assert refresher.refresh_once() == 0
+
+
+def test_price_refresher_leaves_the_daily_reserve(app, upstream, user, monkeypatch):
+    scheduler = QuotaScheduler(per_minute=0, per_day=3, max_wait=0)
+    monkeypatch.setattr(stocks.alpha_vantage, 'scheduler', scheduler)
+
+    def fetch(params, priority):
+        scheduler.acquire(priority)
+        return make_quote(params['symbol'], "238.0400")
+
+    upstream.side_effect = fetch
+    refresher = PriceRefresher(app, stocks.alpha_vantage, interval=60, batch_size=5, daily_reserve=2)
+
+    assert refresher.refresh_once() == 1
+    assert scheduler.remaining_today() == 2
+
+
+def test_portfolio_value_tracks_trades_and_price_ticks(client, upstream, user, auth):
+    prices = stocks.alpha_vantage.prices
+    prices.update('AAPL', 200.0)
+    prices.update('MSFT', 100.0)
+    assert client.get(f'/api/portfolio-status/{user.id}', headers=auth).get_json()['portfolio_value'] == 2500.0
+
+    response = client.post('/api/buy-stock', json={'symbol': 'AAPL', 'quantity': 5, 'userId': user.id}, headers=auth)
+    assert response.get_json()['success'] is True
+    prices.update('MSFT', 110.0)
+
+    data = client.get(f'/api/portfolio-status/{user.id}', headers=auth).get_json()
+    assert data['portfolio_value'] == 15 * 200.0 + 5 * 110.0
+    assert data['balance'] == 10000.0 - 5 * 200.0
+    assert upstream.call_count == 0
+
+
+def test_trades_refetch_prices_older_than_the_trade_limit(client, upstream, user, auth):
+    now = [1000.0]
+    stocks.alpha_vantage.prices._clock = lambda: now[0]
+    stocks.alpha_vantage.get_stock_quote('AAPL')
+    now[0] += 40
+    upstream.side_effect = lambda params, priority: make_quote(params['symbol'], "300.0000")
+
+    # The cached quote is still fresh, but older than TRADE_PRICE_MAX_AGE allows
+    data = client.post('/api/buy-stock', json={'symbol': 'AAPL', 'quantity': 1}, headers=auth).get_json()
+    assert data['new_balance'] == 10000.0 - 300.0
+    assert data['price_age'] == 0.0
+
+
+def test_batch_orders_refetch_prices_older_than_the_trade_limit(client, upstream, user, auth):
+    now = [1000.0]
+    stocks.alpha_vantage.prices._clock = lambda: now[0]
+    stocks.alpha_vantage.get_stock_quote('AAPL')
+    now[0] += 40
+    upstream.side_effect = lambda params, priority: make_quote(params['symbol'], "300.0000")
+
+    orders = [{'symbol': 'AAPL', 'side': 'buy', 'quantity': 1}]
+    data = client.post('/api/orders/batch', json={'orders': orders}, headers=auth).get_json()
+    assert data['new_balance'] == 10000.0 - 300.0
+
+
+def test_batch_orders_rebalance_in_one_transaction(client, upstream, user, auth):
+    orders = [
+        {'symbol': 'msft', 'side': 'sell', 'quantity': 5},
+        {'symbol': 'AAPL', 'side': 'buy', 'quantity': 40},
+        {'symbol': 'AAPL', 'side': 'buy', 'quantity': 5},
+    ]
+    response = client.post('/api/orders/batch', json={'userId': user.id, 'orders': orders}, headers=auth)
+
+    data = response.get_json()
+    assert response.status_code == 200
+    # The MSFT sale funds buys the balance alone could not cover
+    assert data['new_balance'] == pytest.approx(10000.0 + 5 * 238.04 - 45 * 238.04)
+    assert sorted(c.args[0]['symbol'] for c in upstream.call_args_list) == ['AAPL', 'MSFT']
+    assert {p.symbol: p.quantity for p in Portfolio.query.filter_by(user_id=user.id)} == {'AAPL': 55}
+
+
+def test_batch_orders_are_all_or_nothing(client, upstream, user, auth):
+    orders = [
+        {'symbol': 'AAPL', 'side': 'buy', 'quantity': 1},
+        {'symbol': 'GOOG', 'side': 'sell', 'quantity': 1},
+    ]
+    response = client.post('/api/orders/batch', json={'userId': user.id, 'orders': orders}, headers=auth)
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Insufficient shares of GOOG'
+    assert db.session.get(User, user.id).balance == 10000.0
+    assert {p.symbol: p.quantity for p in Portfolio.query.filter_by(user_id=user.id)} == {'AAPL': 10, 'MSFT': 5}
+
+    response = client.post('/api/orders/batch', json={'userId': user.id, 'orders': [{'symbol': 'AAPL', 'side': 'hold'}]}, headers=auth)
+    assert response.status_code == 400
+
+
+def test_batch_orders_report_why_prices_are_missing(client, upstream, user, auth):
+    orders = [{'symbol': 'AAPL', 'side': 'buy', 'quantity': 1}]
+
+    upstream.side_effect = RateLimitExceeded('quota')
+    throttled = client.post('/api/orders/batch', json={'orders': orders}, headers=auth)
+    assert throttled.status_code == 429
+    assert throttled.get_json()['missing_symbols'] == ['AAPL']
+
+    upstream.side_effect = requests.ConnectionError()
+    assert client.post('/api/orders/batch', json={'orders': orders}, headers=auth).status_code == 503
+
+    upstream.side_effect = lambda params, priority: {'Global Quote': {}}
+    invalid = client.post('/api/orders/batch', json={'orders': orders}, headers=auth)
+    assert invalid.status_code == 400
+    assert invalid.get_json()['error'] == 'Invalid stock symbol'
+
+
+def test_account_routes_require_the_users_token(app, client, upstream, user, token, auth):
+    assert client.get(f'/api/portfolio-status/{user.id}').status_code == 401
+    # Only the event stream takes the token from the URL
+    assert client.get(f'/api/portfolio-status/{user.id}?token={token}').status_code == 401
+    assert client.get(f'/api/portfolio-status/{user.id}', headers={'Authorization': 'Bearer forged'}).status_code == 401
+    assert client.get(f'/api/portfolio-status/{user.id + 1}', headers=auth).status_code == 403
+
+    response = client.post('/api/buy-stock', json={'symbol': 'AAPL', 'quantity': 1, 'userId': user.id + 1}, headers=auth)
+    assert response.status_code == 403
+    assert client.get(f'/api/stream?user_id={user.id}').status_code == 401
+
+    # The user comes from the token; a verified token is served from the principal cache
+    response = client.post('/api/buy-stock', json={'symbol': 'AAPL', 'quantity': 1}, headers=auth)
+    assert response.get_json()['success'] is True
+    assert app.extensions['auth_tokens'].cache.stats()['namespaces']['TOKEN']['hits'] >= 1
+
+
+def test_valuation_book_price_tick_only_touches_holders():
+    prices = PriceTable()
+    book = ValuationBook(prices)
+    book.load(1, 0.0, [('AAPL', 10)])
+    book.load(2, 0.0, [('MSFT', 3)])
+
+    prices.update('AAPL', 100.0)
+    prices.update('MSFT', 50.0)
+    prices.update('AAPL', 101.0)
+
+    assert book.values() == {1: 1010.0, 2: 150.0}
+    book.apply_trade(2, 'AAPL', 2, balance=0.0)
+    assert book.snapshot(2) == {'balance': 0.0, 'portfolio_value': 352.0, 'symbols': ['MSFT', 'AAPL'], 'unpriced': []}
+
+
+def test_valuation_book_reloads_expired_accounts_atomically():
+    now = [0.0]
+    book = ValuationBook(PriceTable(), max_age=30, clock=lambda: now[0])
+    loads = []
+
+    def loader(user_id):
+        loads.append(user_id)
+        return (100.0, [('AAPL', 1)], 1) if user_id == 1 else None
+
+    assert book.ensure_loaded(1, loader)['symbols'] == ['AAPL']
+    assert book.ensure_loaded(2, loader) is None
+    now[0] = 31.0
+    assert book.ensure_loaded(1, loader)['balance'] == 100.0
+    assert book.snapshot(2) is None
+    assert loads == [1, 2, 1]
+
+
+def test_valuation_book_removes_expired_accounts():
+    now = [0.0]
+    prices = PriceTable()
+    book = ValuationBook(prices, max_age=30, clock=lambda: now[0])
+    notified = []
+    book.subscribe(lambda user_id, snapshot: notified.append(user_id))
+    book.load(1, 0.0, [('AAPL', 1)])
+    book.load(2, 0.0, [('MSFT', 1)])
+
+    now[0] = 20.0
+    book.load(3, 0.0, [('AAPL', 2)])
+    now[0] = 40.0
+    prices.update('AAPL', 10.0)
+
+    # The tick skips expired holders, and the sweep it triggers removes every expired account
+    assert notified == [3]
+    assert book.values() == {3: 20.0}
+    assert set(book._holders) == {'AAPL'}
+
+
+def test_valuation_book_skips_trades_the_load_already_contains():
+    prices = PriceTable()
+    prices.update('AAPL', 10.0)
+    book = ValuationBook(prices)
+
+    # The load read the database after the version-2 trade committed but before it was applied
+    book.load(1, 80.0, [('AAPL', 2)], version=2)
+    book.apply_trade(1, 'AAPL', 2, 80.0, version=2)
+    assert book.snapshot(1)['portfolio_value'] == 20.0
+
+    # Out-of-order trades are both applied and the newest balance wins
+    book.apply_trade(1, 'AAPL', 1, 60.0, version=4)
+    book.apply_trade(1, 'AAPL', 1, 70.0, version=3)
+    assert book.snapshot(1) == {'balance': 60.0, 'portfolio_value': 40.0, 'symbols': ['AAPL'], 'unpriced': []}
+
+    # A load read before those trades does not replace the newer state
+    book.load(1, 80.0, [('AAPL', 2)], version=2)
+    assert book.snapshot(1)['portfolio_value'] == 40.0
+
+
+def test_state_sync_shares_quotes_and_trades_between_processes(app, user):
+    user_id = user.id
+    # Two price tables and books stand in for two worker processes
+    processes = []
+    for _ in range(2):
+        prices = PriceTable()
+        book = ValuationBook(prices)
+        processes.append((prices, book, StateSync(app, prices, book, stocks.load_account, interval=1)))
+    (prices_a, book_a, sync_a), (prices_b, book_b, sync_b) = processes
+    notified = []
+    book_b.subscribe(lambda user_id, snapshot: notified.append((user_id, snapshot['balance'])))
+
+    prices_a.update('AAPL', 200.0)
+    assert sync_b.sync_once() == (1, 0)
+    assert prices_b.get('AAPL')[0] == 200.0
+    assert sync_a.sync_once() == (0, 0)
+
+    book_b.ensure_loaded(user_id, stocks.load_account)
+    assert sync_b.sync_once() == (0, 0)
+
+    # A trade committed by the other process bumps the user's row version
+    db.session.execute(User.__table__.update().values(balance=9000.0, version=User.version + 1))
+    db.session.commit()
+    assert sync_b.sync_once() == (0, 1)
+    assert notified == [(user_id, 9000.0)]
+    assert book_b.snapshot(user_id)['portfolio_value'] == 2000.0
+
+
+def read_events(response, count):
+    events = []
+    chunks = iter(response.response)
+    while len(events) < count:
+        chunk = next(chunks)
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        if chunk.startswith('event:'):
+            name, data = chunk.strip().split('\n')
+            events.append((name[len('event: '):], json.loads(data[len('data: '):])))
+    return events
+
+
+def test_stream_pushes_portfolio_and_quote_updates(client, upstream, user, token):
+    prices = stocks.alpha_vantage.prices
+    prices.update('AAPL', 200.0)
+
+    response = client.get(f'/api/stream?user_id={user.id}&symbols=AAPL&token={token}', buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    initial = read_events(response, 2)
+    assert initial[0] == ('portfolio', {'balance': 10000.0, 'portfolio_value': 2000.0})
+    assert initial[1][0] == 'quote' and initial[1][1]['price'] == 200.0
+
+    prices.update('AAPL', 210.0)
+    updates = read_events(response, 2)
+    assert ('portfolio', {'balance': 10000.0, 'portfolio_value': 2100.0}) in updates
+    assert any(name == 'quote' and data['price'] == 210.0 for name, data in updates)
+
+    response.close()
+    assert stocks.broadcaster.stats()['subscriptions'] == 0
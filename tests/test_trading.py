@@ -0,0 +1,55 @@
+import threading
+
+import pytest
+
+from app import db
+from app.models import Portfolio, User
+from app.services.trading import TradeError, execute_orders, execute_trade
+
+
+@pytest.fixture
+def app(make_app, tmp_path):
+    # A file database, so each thread gets its own connection like separate workers would
+    app = make_app(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'trading.db'}")
+    db.session.add(User(id=1, username='trader', email='trader@test.com', password=b'x', balance=1000.0))
+    db.session.commit()
+    return app
+
+
+def test_concurrent_buys_do_not_lose_updates(app):
+    def buy():
+        with app.app_context():
+            for _ in range(5):
+                execute_trade(1, 'AAPL', 1, 10.0, max_retries=50)
+
+    threads = [threading.Thread(target=buy) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    db.session.expire_all()
+    assert db.session.get(User, 1).balance == 700.0
+    assert [p.quantity for p in Portfolio.query.filter_by(user_id=1)] == [30]
+
+
+def test_trade_rejections(app):
+    with pytest.raises(TradeError, match='Insufficient funds'):
+        execute_trade(1, 'AAPL', 1000, 10.0)
+    with pytest.raises(TradeError, match='Insufficient shares'):
+        execute_trade(1, 'AAPL', -1, 10.0)
+    with pytest.raises(TradeError) as e:
+        execute_trade(2, 'AAPL', 1, 10.0)
+    assert e.value.status_code == 404
+
+    execute_trade(1, 'AAPL', 2, 10.0)
+    assert execute_trade(1, 'AAPL', -2, 12.0).balance == 1004.0
+    assert Portfolio.query.count() == 0
+
+
+def test_every_trade_bumps_the_user_version(app):
+    first = execute_trade(1, 'AAPL', 1, 10.0)
+    # Buying and selling the same amount leaves the balance as it was
+    second = execute_orders(1, [('MSFT', 1), ('AAPL', -1)], {'MSFT': 10.0, 'AAPL': 10.0})
+    assert second.balance == first.balance
+    assert second.version == first.version + 1